@@ -9,7 +9,8 @@ setup(
     install_requires=[
         "ruamel.yaml>=0.17.32",
         "PyYAML>=6.0.1",
-        "openai>=0.27.8",
+        "openai>=1.17.0",
+        "httpx>=0.23.0",
         "orjson>=3.9.4",
         "opencv-python>=4.8.0.76",
         "Pillow>=10.0.1",
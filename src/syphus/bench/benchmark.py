@@ -0,0 +1,231 @@
+import asyncio
+import collections
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import pkg_resources
+
+from syphus.bench.mock_server import MockServerProcess, MockServerSettings
+from syphus.data_generator.concurrency import AIMDController
+from syphus.data_generator.metrics import StageStats
+from syphus.data_generator.openai_settings import OpenAISettings
+from syphus.data_generator.response import Response
+from syphus.data_generator.retry import RetryPolicy, RetrySettings
+from syphus.data_generator.syphus import Syphus
+from syphus.prompts.info import Info
+from typing import Optional, Dict, Iterator, Any
+
+try:
+    import resource
+except ImportError:
+    # The resource module only exists on POSIX systems.
+    resource = None
+
+MOCK_ENGINE = "mock"
+
+
+def make_infos(num_infos: int, words: int = 50) -> Iterator[Info]:
+    """
+    Generate synthetic infos of a fixed size.
+
+    Args:
+        num_infos (int): The number of infos.
+        words (int, optional): The number of words of every info. Defaults to 50.
+
+    Yields:
+        Info: The infos, with IDs 000000, 000001, ...
+    """
+    for i in range(num_infos):
+        content = " ".join([f"Object {i} is described by"] + ["word"] * words)
+        yield Info(content, id=f"{i:06d}")
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """
+    Get the peak resident set size of the current process.
+
+    Returns:
+        Optional[float]: The peak RSS in MiB, or None where the resource module is missing, e.g. on Windows.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def get_cpu_time() -> float:
+    """
+    Get the CPU time used by the current process so far.
+
+    Returns:
+        float: The user and system CPU time in seconds.
+    """
+    return time.process_time()
+
+
+def run_query_benchmark(
+    *,
+    num_infos: int = 1000,
+    info_words: int = 50,
+    server_settings: Optional[MockServerSettings] = None,
+    engine: str = "thread",
+    threads: int = 16,
+    concurrency: int = 256,
+    batch_size: int = 1,
+    stream: bool = False,
+    adaptive: bool = False,
+    retry_base_delay: float = 0.1,
+    output: Optional[str] = None,
+    format: str = "jsonl",
+    split: bool = False,
+    prompts: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Run `Syphus.query_all_infos_and_save` against a mock server in a child process and measure it.
+
+    Args:
+        num_infos (int, optional): The number of synthetic infos to query. Defaults to 1000.
+        info_words (int, optional): The number of words of every info. Defaults to 50.
+        server_settings (Optional[MockServerSettings]): The behaviour of the mock server. Defaults to MockServerSettings().
+        engine (str, optional): The query engine, thread or async. Defaults to thread.
+        threads (int, optional): The number of worker threads of the thread engine. Defaults to 16.
+        concurrency (int, optional): The maximum number of requests in flight with the async engine. Defaults to 256.
+        batch_size (int, optional): The number of infos per request. Defaults to 1.
+        stream (bool, optional): Whether to stream completions. Defaults to False.
+        adaptive (bool, optional): Whether to adapt the number of requests in flight, up to threads or concurrency. Defaults to False.
+        retry_base_delay (float, optional): The backoff ceiling of the first retry. Defaults to 0.1.
+        output (Optional[str]): The output folder, kept after the run. Defaults to a temporary folder removed after the run.
+        format (str, optional): The output format. Defaults to jsonl.
+        split (bool, optional): Whether to save every response in its own folder. Defaults to False.
+        prompts (Optional[str]): The prompts file. Defaults to the prompts of the project template.
+
+    Returns:
+        Dict[str, Any]: The report of the run.
+    """
+    if prompts is None:
+        prompts = pkg_resources.resource_filename(
+            "syphus", "resources/template/config/prompts.yaml"
+        )
+    output_path = (
+        output if output is not None else tempfile.mkdtemp(prefix="syphus-bench-")
+    )
+    latencies = StageStats()
+    errors = collections.Counter()
+    lock = threading.Lock()
+
+    def on_response(id: str, response: Response):
+        with lock:
+            if "latency" in response.stats:
+                latencies.observe(response.stats["latency"])
+            if "error" in response.full_response:
+                errors[response.full_response["error"]] += 1
+            for error in response.stats.get("errors", []):
+                errors[error] += 1
+
+    try:
+        with MockServerProcess(server_settings) as server:
+            syphus_object = Syphus(
+                openai_api=OpenAISettings(
+                    type="open_ai", base=server.base_url, key="mock", engine=MOCK_ENGINE
+                ),
+                prompts=prompts,
+                stream=stream,
+                batch_size=batch_size,
+            )
+            syphus_object.gpt_manager.retry_policy = RetryPolicy(
+                RetrySettings(base_delay=retry_base_delay)
+            )
+            max_limit = threads if engine == "thread" else concurrency
+            controller = (
+                AIMDController(max_limit=max_limit, initial_limit=max_limit // 4 or 1)
+                if adaptive
+                else None
+            )
+            infos = make_infos(num_infos, info_words)
+            cpu_start = get_cpu_time()
+            start = time.perf_counter()
+            if engine == "async":
+                asyncio.run(
+                    syphus_object.aquery_all_infos_and_save(
+                        infos,
+                        output_path,
+                        max_concurrency=concurrency,
+                        controller=controller,
+                        format=format,
+                        split=split,
+                        on_response=on_response,
+                    )
+                )
+            else:
+                syphus_object.query_all_infos_and_save(
+                    infos,
+                    output_path,
+                    num_threads=threads,
+                    controller=controller,
+                    format=format,
+                    split=split,
+                    on_response=on_response,
+                )
+            elapsed = time.perf_counter() - start
+            cpu_time = get_cpu_time() - cpu_start
+    finally:
+        if output is None:
+            shutil.rmtree(output_path, ignore_errors=True)
+    server_counts = server.counts or {}
+    num_requests = server_counts.get("requests", 0)
+    return {
+        "infos": num_infos,
+        "requests": num_requests,
+        "elapsed": elapsed,
+        "requests_per_second": num_requests / elapsed if elapsed > 0 else None,
+        "infos_per_second": num_infos / elapsed if elapsed > 0 else None,
+        "latency_p50": latencies.quantile(0.5),
+        "latency_p95": latencies.quantile(0.95),
+        "latency_p99": latencies.quantile(0.99),
+        "cpu_time": cpu_time,
+        "cpu_ms_per_request": 1000 * cpu_time / num_requests if num_requests else None,
+        "peak_rss_mb": get_peak_rss_mb(),
+        "server": server_counts,
+        "errors": dict(errors),
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """
+    Format the report of a benchmark run for the terminal.
+
+    Args:
+        report (Dict[str, Any]): The report returned by run_query_benchmark.
+
+    Returns:
+        str: The report, one metric per line.
+    """
+
+    def format_value(value: Any, unit: str = "", scale: float = 1) -> str:
+        if value is None:
+            return "n/a"
+        return f"{value * scale:.2f}{unit}"
+
+    lines = [
+        f"Infos:            {report['infos']}",
+        f"Requests:         {report['requests']}",
+        f"Elapsed:          {format_value(report['elapsed'], ' s')}",
+        f"Requests/sec:     {format_value(report['requests_per_second'])}",
+        f"Infos/sec:        {format_value(report['infos_per_second'])}",
+        f"Latency p50:      {format_value(report['latency_p50'], ' ms', 1000)}",
+        f"Latency p95:      {format_value(report['latency_p95'], ' ms', 1000)}",
+        f"Latency p99:      {format_value(report['latency_p99'], ' ms', 1000)}",
+        f"CPU per request:  {format_value(report['cpu_ms_per_request'], ' ms')}",
+        f"Peak RSS:         {format_value(report['peak_rss_mb'], ' MiB')}",
+    ]
+    server = report["server"]
+    if server.get("rate_limited") or server.get("errors"):
+        lines.append(
+            f"Injected errors:  {server.get('rate_limited', 0)} rate limited, {server.get('errors', 0)} server errors"
+        )
+    for error, count in sorted(report["errors"].items()):
+        lines.append(f"  {error}: {count}")
+    return "\n".join(lines)
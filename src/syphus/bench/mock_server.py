@@ -0,0 +1,477 @@
+import json
+import math
+import multiprocessing
+import random
+import threading
+import time
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from syphus.utils.settings import Settings
+from syphus.utils.tokens import estimate_messages_tokens, estimate_tokens
+from typing import Optional, List, Dict, Any
+
+DISTRIBUTIONS = ("constant", "uniform", "normal", "lognormal", "exponential")
+
+
+class MockServerSettings(Settings):
+    """
+    Represents the behaviour of the mock OpenAI-compatible chat completion server.
+
+    Attributes:
+        latency (float): The mean time in seconds before the first token of a completion.
+        latency_stddev (float): The standard deviation of the latency, ignored by the constant and exponential distributions.
+        distribution (str): The distribution of the latency: constant, uniform, normal, lognormal or exponential.
+        tokens_per_second (Optional[float]): The generation speed once the first token is sent. None to send the whole completion at once.
+        rate_limit_rate (float): The fraction of requests answered with a 429 rate limit error.
+        server_error_rate (float): The fraction of requests answered with a 500 or 503 error.
+        retry_after (float): The number of seconds rate limited requests are asked to wait.
+        num_qa_pairs (int): The number of QA pairs in every completion.
+        answer_words (int): The number of words of every answer.
+        seed (Optional[int]): The seed of the random generator, None for a random seed.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0.2,
+        latency_stddev: float = 0.05,
+        distribution: str = "lognormal",
+        tokens_per_second: Optional[float] = None,
+        rate_limit_rate: float = 0.0,
+        server_error_rate: float = 0.0,
+        retry_after: float = 0.1,
+        num_qa_pairs: int = 3,
+        answer_words: int = 20,
+        seed: Optional[int] = None,
+    ):
+        """
+        Initialize the MockServerSettings instance.
+
+        Args:
+            latency (float): The mean time in seconds before the first token of a completion.
+            latency_stddev (float): The standard deviation of the latency.
+            distribution (str): The distribution of the latency.
+            tokens_per_second (Optional[float]): The generation speed, None to send the whole completion at once.
+            rate_limit_rate (float): The fraction of requests answered with a 429 rate limit error.
+            server_error_rate (float): The fraction of requests answered with a 500 or 503 error.
+            retry_after (float): The number of seconds rate limited requests are asked to wait.
+            num_qa_pairs (int): The number of QA pairs in every completion.
+            answer_words (int): The number of words of every answer.
+            seed (Optional[int]): The seed of the random generator.
+
+        Raises:
+            ValueError: If the distribution is unknown.
+        """
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(
+                f"Unknown latency distribution {distribution}, expected one of {DISTRIBUTIONS}"
+            )
+        self.latency = latency
+        self.latency_stddev = latency_stddev
+        self.distribution = distribution
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.retry_after = retry_after
+        self.num_qa_pairs = num_qa_pairs
+        self.answer_words = answer_words
+        self.seed = seed
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the MockServerSettings instance to a dictionary representation.
+
+        Returns:
+            dict: A dictionary containing the mock server settings.
+        """
+        return {
+            "latency": self.latency,
+            "latency_stddev": self.latency_stddev,
+            "distribution": self.distribution,
+            "tokens_per_second": self.tokens_per_second,
+            "rate_limit_rate": self.rate_limit_rate,
+            "server_error_rate": self.server_error_rate,
+            "retry_after": self.retry_after,
+            "num_qa_pairs": self.num_qa_pairs,
+            "answer_words": self.answer_words,
+            "seed": self.seed,
+        }
+
+
+class MockServer(object):
+    """
+    A local stand-in for the chat completion endpoint of the OpenAI API, answering with canned Question/Answer completions.
+
+    It supports streaming, injects rate limit and server errors, and simulates latency and generation speed, so the query pipeline can be measured offline and for free.
+
+    Attributes:
+        settings (MockServerSettings): The behaviour of the server.
+        counts (Dict[str, int]): The number of requests received, completed, rate limited and failed.
+    """
+
+    def __init__(
+        self,
+        settings: Optional[MockServerSettings] = None,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        Initialize the MockServer instance. The server does not listen until started.
+
+        Args:
+            settings (Optional[MockServerSettings]): The behaviour of the server. Defaults to MockServerSettings().
+            host (str, optional): The host to listen on. Defaults to 127.0.0.1.
+            port (int, optional): The port to listen on, 0 for a free port. Defaults to 0.
+        """
+        self.settings = settings if settings else MockServerSettings()
+        self.random = random.Random(self.settings.seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "completed": 0, "rate_limited": 0, "errors": 0}
+        self.server = ThreadingHTTPServer((host, port), make_handler(self))
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockServer":
+        """
+        Serve requests from a background thread.
+
+        Returns:
+            MockServer: The server itself.
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving requests and close the socket.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def count(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+    def sample_latency(self) -> float:
+        """
+        Draw the latency of a request from the configured distribution.
+
+        Returns:
+            float: The latency in seconds, never negative.
+        """
+        mean, stddev = self.settings.latency, self.settings.latency_stddev
+        with self.lock:
+            if self.settings.distribution == "constant":
+                latency = mean
+            elif self.settings.distribution == "uniform":
+                half_width = math.sqrt(3) * stddev
+                latency = self.random.uniform(mean - half_width, mean + half_width)
+            elif self.settings.distribution == "normal":
+                latency = self.random.gauss(mean, stddev)
+            elif self.settings.distribution == "lognormal":
+                if mean <= 0:
+                    return 0.0
+                sigma = math.sqrt(math.log(1 + (stddev / mean) ** 2))
+                latency = self.random.lognormvariate(
+                    math.log(mean) - sigma**2 / 2, sigma
+                )
+            else:
+                latency = self.random.expovariate(1 / mean) if mean > 0 else 0.0
+        return max(latency, 0.0)
+
+    def sample_failure(self) -> Optional[int]:
+        """
+        Decide whether a request fails.
+
+        Returns:
+            Optional[int]: The status code of the injected error, None if the request succeeds.
+        """
+        with self.lock:
+            draw = self.random.random()
+            if draw < self.settings.rate_limit_rate:
+                return 429
+            if draw < self.settings.rate_limit_rate + self.settings.server_error_rate:
+                return self.random.choice([500, 503])
+        return None
+
+    def get_content(self, messages: List[Dict[str, Any]]) -> str:
+        """
+        Build the canned completion of a request.
+
+        Args:
+            messages (List[Dict[str, Any]]): The messages of the request.
+
+        Returns:
+            str: Question/Answer pairs about the last message.
+        """
+        topic = " ".join(str(messages[-1]["content"]).split()[:8]) if messages else ""
+        answer = " ".join(["word"] * self.settings.answer_words)
+        return "\n".join(
+            f"Question: What is point {i + 1} of {topic}?\nAnswer: {answer}"
+            for i in range(self.settings.num_qa_pairs)
+        )
+
+    def split_content(self, content: str) -> List[str]:
+        """
+        Split a completion into the pieces of content of a stream, about one token each.
+
+        Args:
+            content (str): The completion.
+
+        Returns:
+            List[str]: The pieces, which join back into the completion.
+        """
+        return [content[start : start + 4] for start in range(0, len(content), 4)]
+
+
+def make_handler(mock_server: MockServer):
+    """
+    Create the request handler class of a mock server.
+
+    Args:
+        mock_server (MockServer): The server the handler answers for.
+
+    Returns:
+        type: A BaseHTTPRequestHandler subclass.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(
+            self,
+            status_code: int,
+            body: Dict[str, Any],
+            headers: Optional[Dict[str, str]] = None,
+        ):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status_code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_error_response(self, status_code: int):
+            if status_code == 429:
+                mock_server.count("rate_limited")
+                retry_after = mock_server.settings.retry_after
+                self.send_json(
+                    429,
+                    {
+                        "error": {
+                            "message": "Rate limit reached (mock server)",
+                            "type": "requests",
+                            "code": "rate_limit_exceeded",
+                        }
+                    },
+                    {
+                        "retry-after": str(math.ceil(retry_after)),
+                        "retry-after-ms": str(int(retry_after * 1000)),
+                    },
+                )
+            else:
+                mock_server.count("errors")
+                self.send_json(
+                    status_code,
+                    {
+                        "error": {
+                            "message": "The server had an error (mock server)",
+                            "type": "server_error",
+                            "code": None,
+                        }
+                    },
+                )
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length)
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+            mock_server.count("requests")
+            try:
+                request = json.loads(body)
+            except ValueError:
+                self.send_json(400, {"error": {"message": "Invalid JSON body"}})
+                return
+            status_code = mock_server.sample_failure()
+            if status_code is not None:
+                self.send_error_response(status_code)
+                return
+            time.sleep(mock_server.sample_latency())
+            messages = request.get("messages") or []
+            content = mock_server.get_content(messages)
+            prompt_tokens = estimate_messages_tokens(messages)
+            completion_tokens = estimate_tokens(content)
+            metadata = {
+                "id": f"chatcmpl-mock-{uuid.uuid4().hex}",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+            }
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+            if request.get("stream"):
+                self.stream(content, metadata, usage)
+            else:
+                if mock_server.settings.tokens_per_second:
+                    time.sleep(
+                        completion_tokens / mock_server.settings.tokens_per_second
+                    )
+                self.send_json(
+                    200,
+                    {
+                        **metadata,
+                        "object": "chat.completion",
+                        "choices": [
+                            {
+                                "index": 0,
+                                "finish_reason": "stop",
+                                "message": {"role": "assistant", "content": content},
+                            }
+                        ],
+                        "usage": usage,
+                    },
+                )
+            mock_server.count("completed")
+
+        def stream(self, content: str, metadata: Dict[str, Any], usage: Dict[str, Any]):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            pieces = mock_server.split_content(content)
+            delay = (
+                1 / mock_server.settings.tokens_per_second
+                if mock_server.settings.tokens_per_second
+                else 0
+            )
+            chunks = [{"index": 0, "delta": {"role": "assistant", "content": ""}}]
+            chunks += [{"index": 0, "delta": {"content": piece}} for piece in pieces]
+            chunks.append({"index": 0, "delta": {}, "finish_reason": "stop"})
+            for i, choice in enumerate(chunks):
+                chunk = {
+                    **metadata,
+                    "object": "chat.completion.chunk",
+                    "choices": [choice],
+                }
+                if i == len(chunks) - 1:
+                    chunk["usage"] = usage
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if delay and 0 < i < len(chunks) - 1:
+                    time.sleep(delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def serve(
+    settings: MockServerSettings,
+    host: str,
+    port: int,
+    connection,
+    stop_event,
+):
+    """
+    Run a mock server until `stop_event` is set, sending its base URL and final counts over `connection`.
+
+    This is the target of the process started by MockServerProcess.
+
+    Args:
+        settings (MockServerSettings): The behaviour of the server.
+        host (str): The host to listen on.
+        port (int): The port to listen on, 0 for a free port.
+        connection: The end of the pipe of the child process.
+        stop_event: The event stopping the server.
+    """
+    with MockServer(settings, host=host, port=port) as mock_server:
+        connection.send(mock_server.base_url)
+        stop_event.wait()
+        connection.send(dict(mock_server.counts))
+
+
+class MockServerProcess(object):
+    """
+    A mock server running in a child process, so that its CPU time does not count against the process being measured.
+
+    Attributes:
+        base_url (str): The base URL of the server.
+        counts (Optional[Dict[str, int]]): The request counts of the server, available once stopped.
+    """
+
+    def __init__(
+        self,
+        settings: Optional[MockServerSettings] = None,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        Start the mock server process and wait until it listens.
+
+        Args:
+            settings (Optional[MockServerSettings]): The behaviour of the server. Defaults to MockServerSettings().
+            host (str, optional): The host to listen on. Defaults to 127.0.0.1.
+            port (int, optional): The port to listen on, 0 for a free port. Defaults to 0.
+        """
+        context = multiprocessing.get_context("spawn")
+        self.connection, child_connection = context.Pipe()
+        self.stop_event = context.Event()
+        self.process = context.Process(
+            target=serve,
+            args=(
+                settings if settings else MockServerSettings(),
+                host,
+                port,
+                child_connection,
+                self.stop_event,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+        self.base_url = self.connection.recv()
+        self.counts: Optional[Dict[str, int]] = None
+
+    def stop(self):
+        """
+        Stop the server process and collect its counts.
+        """
+        self.stop_event.set()
+        if self.connection.poll(5):
+            self.counts = self.connection.recv()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def __enter__(self) -> "MockServerProcess":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,116 @@
+import os
+import sys
+import argparse
+import syphus
+
+import syphus.data_generator.batch_api as batch_api
+import syphus.data_generator.response as syphus_response
+
+from syphus.cli.data_generator import get_file
+from syphus.data_generator.syphus import Syphus
+from syphus.utils.file_format import create_output_folder
+
+
+def batch_command(subparsers):
+    batch_parser = subparsers.add_parser(
+        "batch", help="Export requests to and ingest results from the OpenAI Batch API."
+    )
+    batch_subparsers = batch_parser.add_subparsers(
+        title="batch subcommands", dest="batch_subcommand"
+    )
+
+    export_parser = batch_subparsers.add_parser(
+        "export", help="Write the Batch API request file of the infos."
+    )
+    export_parser.add_argument(
+        "file", help="The project folder.", nargs="?", default=None
+    )
+    export_parser.add_argument(
+        "-c", "--config", help="OpenAI Config File", default=None
+    )
+    export_parser.add_argument(
+        "-i", "--input", help="Input File of Information", default=None
+    )
+    export_parser.add_argument(
+        "-o",
+        "--output",
+        help="Request file to write, defaults to batch_requests.jsonl in the project folder",
+        default=None,
+    )
+    export_parser.add_argument("-p", "--prompts", help="Prompts File", default=None)
+    export_parser.add_argument(
+        "--num-examples",
+        help="Number of in-context examples sent with every request, the most similar to its info, defaults to all of them",
+        default=None,
+        type=int,
+    )
+    export_parser.set_defaults(func=export)
+
+    ingest_parser = batch_subparsers.add_parser(
+        "ingest", help="Save Batch API results as responses."
+    )
+    ingest_parser.add_argument(
+        "results", help="Batch API output and error files", nargs="+"
+    )
+    ingest_parser.add_argument(
+        "-o", "--output", help="Output File of Responses", required=True
+    )
+    ingest_parser.add_argument(
+        "-s", "--split", action="store_true", help="Split every information"
+    )
+    ingest_parser.add_argument(
+        "--output_format",
+        help="Format of output file",
+        default="json",
+        choices=["json", "jsonl", "yaml", "yml"],
+    )
+    ingest_parser.set_defaults(func=ingest)
+
+
+def get_export_files_from_args(args: argparse.Namespace):
+    if args.file is None:
+        args.file = os.getcwd()
+    resources_path = os.path.join(args.file, "resources")
+    config_path = os.path.join(args.file, "config")
+    if args.config is None:
+        args.config = os.path.join(config_path, "gpt_info.yaml")
+    if args.input is None:
+        args.input = get_file(resources_path, "media_infos")
+    if args.prompts is None:
+        args.prompts = os.path.join(config_path, "prompts.yaml")
+    if args.output is None:
+        args.output = os.path.join(args.file, "batch_requests.jsonl")
+    assert os.path.exists(args.config), f"Config file {args.config} does not exist."
+    assert os.path.exists(args.input), f"Input file {args.input} does not exist."
+    assert os.path.exists(args.prompts), f"Prompts file {args.prompts} does not exist."
+
+
+def export(args: argparse.Namespace):
+    get_export_files_from_args(args)
+    syphus_object = Syphus(
+        gpt_info_path=args.config,
+        prompts=args.prompts,
+        num_examples=args.num_examples,
+    )
+    infos = syphus.prompts.info.load(args.input)
+    num_requests = batch_api.export_requests(syphus_object, infos, args.output)
+    print(f"Wrote {num_requests} requests to {args.output}", file=sys.stderr)
+
+
+def ingest(args: argparse.Namespace):
+    if args.output_format == "yml":
+        args.output_format = "yaml"
+    for path in args.results:
+        assert os.path.exists(path), f"Result file {path} does not exist."
+    responses = batch_api.ingest_results(*args.results)
+    create_output_folder(args.output)
+    syphus_response.save_all(
+        responses, args.output, format=args.output_format, split=args.split
+    )
+    num_errors = sum(
+        1 for response in responses.values() if "error" in response.full_response
+    )
+    print(
+        f"Saved {len(responses)} responses to {args.output}, {num_errors} failed",
+        file=sys.stderr,
+    )
@@ -0,0 +1,145 @@
+import json
+import argparse
+
+from syphus.bench.benchmark import run_query_benchmark, format_report
+from syphus.bench.mock_server import DISTRIBUTIONS, MockServerSettings
+
+
+def bench_command(subparsers):
+    bench_parser = subparsers.add_parser(
+        "bench", help="Benchmark the query pipeline against a local mock server."
+    )
+    bench_subparsers = bench_parser.add_subparsers(
+        title="bench subcommands", dest="bench_subcommand"
+    )
+
+    query_parser = bench_subparsers.add_parser(
+        "query", help="Measure the throughput and latency of syphus query, offline."
+    )
+    query_parser.add_argument(
+        "--infos", help="Number of synthetic infos", default=1000, type=int
+    )
+    query_parser.add_argument(
+        "--info-words", help="Number of words of every info", default=50, type=int
+    )
+    query_parser.add_argument(
+        "--engine",
+        help="Query engine, a thread pool or a single asyncio event loop",
+        default="thread",
+        choices=["thread", "async"],
+    )
+    query_parser.add_argument(
+        "--threads", "-t", help="Number of threads to use", default=16, type=int
+    )
+    query_parser.add_argument(
+        "--concurrency",
+        help="Maximum number of requests in flight with the async engine",
+        default=256,
+        type=int,
+    )
+    query_parser.add_argument(
+        "--batch-size", help="Number of infos per request", default=1, type=int
+    )
+    query_parser.add_argument(
+        "--stream", action="store_true", help="Stream completions"
+    )
+    query_parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Adapt the number of requests in flight, up to --threads or --concurrency",
+    )
+    query_parser.add_argument(
+        "--latency",
+        help="Mean latency of the mock server in seconds",
+        default=0.2,
+        type=float,
+    )
+    query_parser.add_argument(
+        "--latency-stddev",
+        help="Standard deviation of the latency in seconds",
+        default=0.05,
+        type=float,
+    )
+    query_parser.add_argument(
+        "--latency-distribution",
+        help="Distribution of the latency",
+        default="lognormal",
+        choices=DISTRIBUTIONS,
+    )
+    query_parser.add_argument(
+        "--tokens-per-second",
+        help="Generation speed of the mock server, instant if not given",
+        default=None,
+        type=float,
+    )
+    query_parser.add_argument(
+        "--rate-limit-rate",
+        help="Fraction of requests answered with a 429 error",
+        default=0.0,
+        type=float,
+    )
+    query_parser.add_argument(
+        "--server-error-rate",
+        help="Fraction of requests answered with a 500 or 503 error",
+        default=0.0,
+        type=float,
+    )
+    query_parser.add_argument(
+        "--qa-pairs",
+        help="Number of QA pairs of every completion",
+        default=3,
+        type=int,
+    )
+    query_parser.add_argument(
+        "--seed", help="Seed of the mock server", default=None, type=int
+    )
+    query_parser.add_argument(
+        "--retry-base-delay",
+        help="Backoff ceiling of the first retry in seconds",
+        default=0.1,
+        type=float,
+    )
+    query_parser.add_argument(
+        "-p", "--prompts", help="Prompts File, defaults to the template", default=None
+    )
+    query_parser.add_argument(
+        "-o",
+        "--output",
+        help="Keep the responses in this folder instead of a temporary one",
+        default=None,
+    )
+    query_parser.add_argument(
+        "--json", action="store_true", help="Print the report as JSON"
+    )
+    query_parser.set_defaults(func=bench_query)
+
+
+def bench_query(args: argparse.Namespace):
+    server_settings = MockServerSettings(
+        latency=args.latency,
+        latency_stddev=args.latency_stddev,
+        distribution=args.latency_distribution,
+        tokens_per_second=args.tokens_per_second,
+        rate_limit_rate=args.rate_limit_rate,
+        server_error_rate=args.server_error_rate,
+        num_qa_pairs=args.qa_pairs,
+        seed=args.seed,
+    )
+    report = run_query_benchmark(
+        num_infos=args.infos,
+        info_words=args.info_words,
+        server_settings=server_settings,
+        engine=args.engine,
+        threads=args.threads,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        stream=args.stream,
+        adaptive=args.adaptive,
+        retry_base_delay=args.retry_base_delay,
+        output=args.output,
+        prompts=args.prompts,
+    )
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
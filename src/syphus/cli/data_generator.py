@@ -1,11 +1,31 @@
 import os
+import sys
+import shutil
+import asyncio
+import signal
 import argparse
+import multiprocessing
 import syphus
 
+import syphus.data_generator.journal as journal
+import syphus.data_generator.response as syphus_response
+
 from glob import glob
 
+from syphus.data_generator.cache import ResponseCache
+from syphus.data_generator.cancellation import DEFAULT_GRACE_PERIOD, parse_duration
+from syphus.data_generator.concurrency import AIMDController
+from syphus.data_generator.scheduler import (
+    CostEstimator,
+    DEFAULT_LOOKAHEAD,
+    LongestJobFirst,
+    SCHEDULES,
+)
 from syphus.data_generator.syphus import Syphus
 from syphus.utils.file_format import create_output_folder
+from syphus.utils.sharding import filter_shard, parse_shard
+
+SHARDS_FOLDER_NAME = "shards"
 
 
 def query_command(subparsers):
@@ -33,6 +53,138 @@ def query_command(subparsers):
     query_parser.add_argument(
         "--threads", "-t", help="Number of threads to use", default=4, type=int
     )
+    query_parser.add_argument(
+        "--max-in-flight",
+        help="Maximum number of infos queued with the thread engine, defaults to twice the number of threads",
+        default=None,
+        type=int,
+    )
+    query_parser.add_argument(
+        "--ordered",
+        action="store_true",
+        help="Save responses in input order instead of completion order",
+    )
+    query_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Reuse the output folder and skip the infos finished by a previous run",
+    )
+    query_parser.add_argument(
+        "--cache-dir",
+        help="Folder of the persistent response cache, defaults to <file>/cache",
+        default=None,
+    )
+    query_parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="Disable the persistent response cache",
+    )
+    query_parser.add_argument(
+        "--cache-max-size",
+        help="Maximum size of the response cache in MB",
+        default=None,
+        type=float,
+    )
+    query_parser.add_argument(
+        "--cache-max-age",
+        help="Maximum age of cached responses in days",
+        default=None,
+        type=float,
+    )
+    query_parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Adapt the number of requests in flight to the latency and rate limit errors of the server, starting from --threads",
+    )
+    query_parser.add_argument(
+        "--min-threads",
+        help="Smallest number of requests in flight with --adaptive",
+        default=1,
+        type=int,
+    )
+    query_parser.add_argument(
+        "--max-threads",
+        help="Largest number of requests in flight with --adaptive",
+        default=64,
+        type=int,
+    )
+    query_parser.add_argument(
+        "--no-coalesce",
+        dest="coalesce",
+        action="store_false",
+        help="Send a separate request for every info, even when identical infos are in flight",
+    )
+    query_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream completions and record the time to first token and tokens per second of every request",
+    )
+    query_parser.add_argument(
+        "--batch-size",
+        help="Number of infos sent in a single request, sharing the prompt and in-context examples",
+        default=1,
+        type=int,
+    )
+    query_parser.add_argument(
+        "--num-examples",
+        help="Number of in-context examples sent with every request, the most similar to its info, defaults to all of them",
+        default=None,
+        type=int,
+    )
+    query_parser.add_argument(
+        "--engine",
+        help="Query engine, a thread pool or a single asyncio event loop",
+        default="thread",
+        choices=["thread", "async"],
+    )
+    query_parser.add_argument(
+        "--concurrency",
+        help="Maximum number of requests in flight with the async engine",
+        default=256,
+        type=int,
+    )
+    query_parser.add_argument(
+        "--shard",
+        help="Only query the infos of shard i out of N, e.g. 0/4, partitioned by a stable hash of the info ID. Results go to <output>/shards/i",
+        default=None,
+    )
+    query_parser.add_argument(
+        "--workers",
+        help="Run N shard processes in parallel and merge their results into the output folder",
+        default=None,
+        type=int,
+    )
+    query_parser.add_argument(
+        "--schedule",
+        help="Order of the requests: input order, or longest job first, by _priority field then estimated size",
+        default="fifo",
+        choices=SCHEDULES,
+    )
+    query_parser.add_argument(
+        "--lookahead",
+        help="Number of infos the longest job first schedule picks the next request from",
+        default=DEFAULT_LOOKAHEAD,
+        type=int,
+    )
+    query_parser.add_argument(
+        "--deadline",
+        help="Stop dispatching new infos after this long, e.g. 3600, 90m or 6h, then save the results completed so far",
+        default=None,
+        type=parse_duration,
+    )
+    query_parser.add_argument(
+        "--grace-period",
+        help="Seconds the requests in flight at the deadline or on SIGINT/SIGTERM may still take",
+        default=DEFAULT_GRACE_PERIOD,
+        type=float,
+    )
+    query_parser.add_argument(
+        "--metrics-port",
+        help="Serve the live metrics of the run in the Prometheus format on this port. Shard i of --workers serves on port + i",
+        default=None,
+        type=int,
+    )
     query_parser.set_defaults(func=query)
 
 
@@ -61,6 +213,8 @@ def get_files_from_args(args: argparse.Namespace):
         args.prompts = os.path.join(config_path, "prompts.yaml")
     if args.output is None:
         args.output = os.path.join(args.file, "responses")
+    if args.cache_dir is None:
+        args.cache_dir = os.path.join(args.file, "cache")
     if args.output_format == "yml":
         args.output_format = "yaml"
     if args.split:
@@ -76,17 +230,170 @@ def get_files_from_args(args: argparse.Namespace):
     assert os.path.exists(args.config), f"Config file {args.config} does not exist."
     assert os.path.exists(args.input), f"Input file {args.input} does not exist."
     assert os.path.exists(args.prompts), f"Prompts file {args.prompts} does not exist."
-    create_output_folder(args.output)
+    assert not (
+        args.shard and args.workers
+    ), "--shard and --workers cannot be used together."
+    # Shards of several machines may share the output folder.
+    create_output_folder(args.output, exist_ok=args.resume or args.shard is not None)
+
+
+def get_shard_path(output: str, index: int) -> str:
+    return os.path.join(output, SHARDS_FOLDER_NAME, str(index))
+
+
+def merge_shards(output: str, num_shards: int, *, split: bool, format: str):
+    """
+    Merge the results of the shards in `output` into the normal output layout of `output`.
+
+    With split output, the folder of every info is moved out of its shard. Otherwise the responses recorded in the shard journals are saved together. The shard folders are kept, so that the run can still be resumed.
+
+    Args:
+        output (str): The output folder of the run.
+        num_shards (int): The number of shards.
+        split (bool): Whether every response is saved in its own folder.
+        format (str): The output format.
+    """
+    responses = {}
+    for index in range(num_shards):
+        shard_path = get_shard_path(output, index)
+        if split:
+            for id in os.listdir(shard_path):
+                if not os.path.isdir(os.path.join(shard_path, id)):
+                    continue
+                if os.path.exists(os.path.join(output, id)):
+                    shutil.rmtree(os.path.join(output, id))
+                os.replace(os.path.join(shard_path, id), os.path.join(output, id))
+        else:
+            responses.update(journal.load(shard_path))
+    if not split:
+        syphus_response.save_all(responses, output, format=format)
+
+
+def run_workers(args: argparse.Namespace):
+    """
+    Query every shard in its own process, then merge the results.
+
+    Args:
+        args (argparse.Namespace): The resolved arguments of the query command.
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    # Ctrl+C reaches the shard processes directly, SIGTERM is forwarded to them.
+    previous_handlers = {
+        signal.SIGINT: signal.signal(signal.SIGINT, signal.SIG_IGN),
+        signal.SIGTERM: signal.signal(
+            signal.SIGTERM,
+            lambda signum, frame: [process.terminate() for process in processes],
+        ),
+    }
+    for index in range(args.workers):
+        worker_args = argparse.Namespace(**vars(args))
+        worker_args.workers = None
+        worker_args.shard = f"{index}/{args.workers}"
+        process = context.Process(target=run_query, args=(worker_args,))
+        process.start()
+        processes.append(process)
+    for process in processes:
+        process.join()
+    for signum, previous_handler in previous_handlers.items():
+        signal.signal(signum, previous_handler)
+    failed = [index for index, process in enumerate(processes) if process.exitcode != 0]
+    if failed:
+        print(
+            f"Shards {failed} failed, rerun with --resume to finish them",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    merge_shards(args.output, args.workers, split=args.split, format=args.output_format)
 
 
 def query(args: argparse.Namespace):
     get_files_from_args(args)
-    syphus_object = Syphus(gpt_info_path=args.config, prompts=args.prompts)
-    infos = list(syphus.prompts.info.load(args.input))
-    syphus_object.query_all_infos_and_save(
-        infos,
-        args.output,
-        num_threads=args.threads,
-        format=args.output_format,
-        split=args.split,
+    if args.workers:
+        run_workers(args)
+    else:
+        run_query(args)
+
+
+def run_query(args: argparse.Namespace):
+    infos = syphus.prompts.info.load(args.input)
+    output = args.output
+    index = 0
+    if args.shard is not None:
+        index, num_shards = parse_shard(args.shard)
+        infos = filter_shard(infos, index, num_shards)
+        output = get_shard_path(args.output, index)
+        create_output_folder(output, exist_ok=args.resume)
+    cache = None
+    if args.cache:
+        cache = ResponseCache(
+            args.cache_dir,
+            max_size_bytes=(
+                int(args.cache_max_size * 1024 * 1024) if args.cache_max_size else None
+            ),
+            max_age=args.cache_max_age * 24 * 3600 if args.cache_max_age else None,
+        )
+    syphus_object = Syphus(
+        gpt_info_path=args.config,
+        prompts=args.prompts,
+        cache=cache,
+        coalesce=args.coalesce,
+        stream=args.stream,
+        batch_size=args.batch_size,
+        num_examples=args.num_examples,
     )
+    if args.metrics_port is not None:
+        syphus_object.metrics.serve(args.metrics_port + index)
+    scheduler = None
+    if args.schedule == "ljf":
+        gpt_manager = syphus_object.gpt_manager
+        scheduler = LongestJobFirst(
+            CostEstimator(
+                gpt_manager.token_budget.counter,
+                max_completion_tokens=gpt_manager.gpt_params.max_tokens,
+            ),
+            lookahead=args.lookahead,
+        )
+    controller = None
+    if args.adaptive:
+        controller = AIMDController(
+            min_limit=args.min_threads,
+            max_limit=args.max_threads,
+            initial_limit=args.threads,
+        )
+    syphus_object.cancellation.set_deadline(args.deadline, args.grace_period)
+    with syphus_object.cancellation.handle_signals():
+        if args.engine == "async":
+            asyncio.run(
+                syphus_object.aquery_all_infos_and_save(
+                    infos,
+                    output,
+                    max_concurrency=args.concurrency,
+                    ordered=args.ordered,
+                    controller=controller,
+                    scheduler=scheduler,
+                    format=args.output_format,
+                    split=args.split,
+                    resume=args.resume,
+                )
+            )
+        else:
+            syphus_object.query_all_infos_and_save(
+                infos,
+                output,
+                num_threads=args.threads,
+                max_in_flight=args.max_in_flight,
+                ordered=args.ordered,
+                controller=controller,
+                scheduler=scheduler,
+                format=args.output_format,
+                split=args.split,
+                resume=args.resume,
+            )
+    syphus_object.metrics.stop_serving()
+    print(syphus_object.metrics.report(), file=sys.stderr)
+    if len(syphus_object.gpt_manager.load_balancer.endpoints) > 1:
+        print(syphus_object.gpt_manager.load_balancer.summary(), file=sys.stderr)
+    if cache is not None:
+        print(cache.summary(), file=sys.stderr)
+        cache.close()
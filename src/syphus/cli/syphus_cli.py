@@ -4,6 +4,8 @@ from syphus.cli.data_generator import query_command
 from syphus.cli.initializer import init_command
 from syphus.cli.output_merger import merge_command
 from syphus.cli.converter import convert_command
+from syphus.cli.batch import batch_command
+from syphus.cli.bench import bench_command
 
 
 def main():
@@ -14,6 +16,8 @@ def main():
     query_command(subparsers)
     merge_command(subparsers)
     convert_command(subparsers)
+    batch_command(subparsers)
+    bench_command(subparsers)
 
     args = parser.parse_args()
 
@@ -0,0 +1,123 @@
+import json
+import sys
+
+import syphus.utils.jsonl as jsonl
+
+from syphus.data_generator.response import Response
+from syphus.data_generator.syphus import Syphus
+from syphus.data_generator.token_budget import TokenBudgetError
+from syphus.prompts.info import Info
+from typing import Iterable, Iterator, Dict, Tuple, Any
+
+BATCH_URL = "/v1/chat/completions"
+
+
+def get_batch_request(syphus_object: Syphus, info: Info) -> Dict[str, Any]:
+    """
+    Build the Batch API request of an info, with the same body `Syphus.query_single_info` would send.
+
+    Args:
+        syphus_object (Syphus): The Syphus instance holding the prompts and GPT parameters.
+        info (Info): The info to build the request of.
+
+    Returns:
+        Dict[str, Any]: The request, with the info ID as `custom_id`.
+
+    Raises:
+        TokenBudgetError: If the info does not fit in the context window and the token budget rejects it.
+    """
+    gpt_manager = syphus_object.gpt_manager
+    messages, max_tokens = gpt_manager.token_budget.plan(
+        syphus_object.get_messages(info), gpt_manager.gpt_params.max_tokens
+    )
+    body = gpt_manager.get_request_kwargs(messages, max_tokens=max_tokens)
+    body.pop("stream", None)
+    if gpt_manager.gpt_params.n > 1:
+        # The Batch API supports n, even if the live endpoints need parallel requests.
+        body["n"] = gpt_manager.gpt_params.n
+    return {"custom_id": info.id, "method": "POST", "url": BATCH_URL, "body": body}
+
+
+def get_batch_requests(
+    syphus_object: Syphus, infos: Iterable[Info]
+) -> Iterator[Dict[str, Any]]:
+    """
+    Build the Batch API requests of several infos, skipping the ones the token budget rejects.
+
+    Args:
+        syphus_object (Syphus): The Syphus instance holding the prompts and GPT parameters.
+        infos (Iterable[Info]): The infos to build the requests of.
+
+    Yields:
+        Dict[str, Any]: The requests, in input order.
+    """
+    for info in infos:
+        try:
+            yield get_batch_request(syphus_object, info)
+        except TokenBudgetError as e:
+            print(f"Skipping info {info.id}: {e}", file=sys.stderr)
+
+
+def export_requests(syphus_object: Syphus, infos: Iterable[Info], path: str) -> int:
+    """
+    Write the Batch API request file of several infos.
+
+    Args:
+        syphus_object (Syphus): The Syphus instance holding the prompts and GPT parameters.
+        infos (Iterable[Info]): The infos to build the requests of.
+        path (str): The path of the JSONL file to write.
+
+    Returns:
+        int: The number of requests written.
+    """
+    num_requests = 0
+    with open(path, "w") as f:
+        for request in get_batch_requests(syphus_object, infos):
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            num_requests += 1
+    return num_requests
+
+
+def parse_batch_result(result: Dict[str, Any]) -> Tuple[str, Response]:
+    """
+    Turn a line of a Batch API output or error file into a Response.
+
+    Args:
+        result (Dict[str, Any]): The line, with the `custom_id` of the request and either its `response` or an `error`.
+
+    Returns:
+        Tuple[str, Response]: The info ID and its response, holding the error messages if the request failed.
+    """
+    id = result["custom_id"]
+    error = result.get("error")
+    response = result.get("response") or {}
+    if error:
+        message = error.get("message") if isinstance(error, dict) else str(error)
+        return id, Response(gpt_error_messages=message or str(error))
+    status_code = response.get("status_code", 200)
+    body = response.get("body")
+    if status_code != 200 or not body or "choices" not in body:
+        error = body.get("error") if isinstance(body, dict) else None
+        message = error.get("message") if isinstance(error, dict) else None
+        return id, Response(
+            gpt_error_messages=message or f"Request failed with status {status_code}"
+        )
+    return id, Response(gpt_response=body)
+
+
+def ingest_results(*paths: str) -> Dict[str, Response]:
+    """
+    Read Batch API output and error files into responses.
+
+    Args:
+        *paths (str): The paths of the JSONL files. If an info appears in several of them, the last one wins.
+
+    Returns:
+        Dict[str, Response]: The responses keyed by info ID.
+    """
+    responses = {}
+    for path in paths:
+        for result in jsonl.load(path):
+            id, response = parse_batch_result(result)
+            responses[id] = response
+    return responses
@@ -0,0 +1,100 @@
+import re
+
+from syphus.prompts.info import Info
+from typing import List, Dict, Any
+
+INFO_DELIMITER = "### Info {id}"
+
+BATCH_INSTRUCTION = (
+    "The following infos are each introduced by a line of the form "
+    f"`{INFO_DELIMITER.format(id='<id>')}`. Treat every info independently, as if it "
+    "were the only one. Start the answer of each info with its own delimiter line, "
+    "copied exactly, followed by its questions and answers."
+)
+
+# Matches a delimiter line, tolerating markdown emphasis and a trailing colon.
+DELIMITER_PATTERN = re.compile(r"^[#*_\s]*Info\s+(.+?)[*_:\s]*$", re.IGNORECASE)
+
+
+def get_batch_content(infos: List[Info]) -> str:
+    """
+    Build the content of a user message asking for the responses of several infos at once.
+
+    Args:
+        infos (List[Info]): The infos of the batch, with unique IDs.
+
+    Returns:
+        str: The instruction followed by every info under its delimiter line.
+    """
+    sections = [BATCH_INSTRUCTION]
+    for info in infos:
+        sections.append(f"{INFO_DELIMITER.format(id=info.id)}\n{info.content}")
+    return "\n\n".join(sections)
+
+
+def split_batch_content(content: str, ids: List[str]) -> Dict[str, str]:
+    """
+    Split the content of a batched completion into the sections of each info.
+
+    Delimiter lines naming an ID outside of the batch are kept as content. If an ID appears several times, only its first section is kept.
+
+    Args:
+        content (str): The content of the completion.
+        ids (List[str]): The IDs of the infos of the batch.
+
+    Returns:
+        Dict[str, str]: The content of the section of every ID found in the completion.
+    """
+    known_ids = {str(id) for id in ids}
+    sections: Dict[str, List[str]] = {}
+    current = None
+    for line in content.splitlines():
+        match = DELIMITER_PATTERN.match(line)
+        if match and match.group(1) in known_ids:
+            id = match.group(1)
+            current = sections.setdefault(id, []) if id not in sections else None
+            continue
+        if current is not None:
+            current.append(line)
+    return {id: "\n".join(lines).strip() for id, lines in sections.items()}
+
+
+def split_batch_response(
+    gpt_response: Dict[str, Any], ids: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Split a batched completion into one completion per info, so that each can be parsed by Response as usual.
+
+    The usage of the batch is not copied, since it is shared by all of its infos, and the IDs of the batch are recorded under `batch` instead. If the batch has several choices, every info gets its section of each choice it is found in.
+
+    Args:
+        gpt_response (Dict[str, Any]): The completion of the batch.
+        ids (List[str]): The IDs of the infos of the batch.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The completion of every ID found in the batched completion.
+    """
+    choices: Dict[str, List[Dict[str, Any]]] = {}
+    for choice in gpt_response["choices"]:
+        sections = split_batch_content(choice["message"]["content"] or "", ids)
+        for id, section in sections.items():
+            choices.setdefault(id, []).append(
+                {
+                    **choice,
+                    "index": len(choices.get(id, [])),
+                    "message": {**choice["message"], "content": section},
+                }
+            )
+    metadata = {
+        key: value
+        for key, value in gpt_response.items()
+        if key not in ["choices", "usage"]
+    }
+    return {
+        id: {
+            **metadata,
+            "batch": [str(id) for id in ids],
+            "choices": id_choices,
+        }
+        for id, id_choices in choices.items()
+    }
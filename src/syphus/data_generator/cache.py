@@ -0,0 +1,186 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+
+import syphus.prompts.prompts as prompts
+
+from typing import Optional, List, Dict, Any
+
+CACHE_FILE_NAME = "responses.sqlite3"
+
+
+def dump_json(obj: Any) -> str:
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def fingerprint(
+    messages: List[Dict[str, Any]], params: Dict[str, Any], engine: str
+) -> str:
+    """
+    Compute a stable fingerprint of a chat completion request.
+
+    Args:
+        messages (List[Dict[str, Any]]): The exact messages sent to the engine.
+        params (Dict[str, Any]): The GPT parameters, as returned by GPTParamsSettings.to_dict().
+        engine (str): The engine the request is sent to.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest of the canonical JSON encoding of the request.
+    """
+    # Keys in sorted order, so this is the canonical encoding of the whole request, with the messages encoded by the prompts.
+    payload = f'{{"engine":{dump_json(engine)},"messages":{prompts.dump_messages(messages)},"params":{dump_json(params)}}}'
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(object):
+    """
+    A persistent, content-addressed cache of GPT responses backed by a local SQLite database.
+
+    Responses are keyed by the fingerprint of the request that produced them, so reruns, prompt tweaks that leave some infos untouched and runs of other team members sharing the cache folder only pay for requests that were never sent before. The database is opened in WAL mode so several processes can share it.
+
+    Attributes:
+        path (str): The path of the SQLite database.
+        max_size_bytes (Optional[int]): The maximum total size of cached responses, least recently used entries are evicted beyond it. None for no limit.
+        max_age (Optional[float]): The maximum age of cached responses in seconds. None for no limit.
+        hits (int): The number of lookups answered from the cache.
+        misses (int): The number of lookups not found in the cache.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_size_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+        evict_every: int = 1000,
+    ):
+        """
+        Open, or create, the cache in the folder `path`.
+
+        Args:
+            path (str): The cache folder.
+            max_size_bytes (Optional[int], optional): The maximum total size of cached responses. Defaults to no limit.
+            max_age (Optional[float], optional): The maximum age of cached responses in seconds. Defaults to no limit.
+            evict_every (int, optional): Run eviction after this many insertions. Defaults to 1000.
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = os.path.join(path, CACHE_FILE_NAME)
+        self.max_size_bytes = max_size_bytes
+        self.max_age = max_age
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self.insertions = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.evict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached response.
+
+        Args:
+            key (str): The request fingerprint.
+
+        Returns:
+            Optional[Dict[str, Any]]: The cached response, or None on a miss or if the entry has expired.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (
+                self.max_age is not None and now - row[1] > self.max_age
+            ):
+                self.misses += 1
+                return None
+            self.connection.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, response: Dict[str, Any]):
+        """
+        Store a response in the cache.
+
+        Args:
+            key (str): The request fingerprint.
+            response (Dict[str, Any]): The response to store, which must be JSON serializable.
+        """
+        data = json.dumps(response)
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self.insertions += 1
+            should_evict = self.insertions % self.evict_every == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove expired entries, then the least recently used entries until the cache fits in max_size_bytes.
+        """
+        with self.lock:
+            if self.max_age is not None:
+                self.connection.execute(
+                    "DELETE FROM responses WHERE created < ?",
+                    (time.time() - self.max_age,),
+                )
+            if self.max_size_bytes is None:
+                return
+            total_size = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            if total_size <= self.max_size_bytes:
+                return
+            evicted_keys = []
+            for key, size in self.connection.execute(
+                "SELECT key, size FROM responses ORDER BY accessed"
+            ):
+                if total_size <= self.max_size_bytes:
+                    break
+                evicted_keys.append((key,))
+                total_size -= size
+            self.connection.executemany(
+                "DELETE FROM responses WHERE key = ?", evicted_keys
+            )
+
+    def __len__(self) -> int:
+        with self.lock:
+            row = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        return row[0]
+
+    def summary(self) -> str:
+        """
+        Describe the hit and miss counters.
+
+        Returns:
+            str: A one-line summary of the cache usage.
+        """
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return f"Response cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate)"
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self.lock:
+            self.connection.close()
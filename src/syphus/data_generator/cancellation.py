@@ -0,0 +1,187 @@
+import contextlib
+import re
+import signal
+import sys
+import threading
+import time
+
+from typing import Optional
+
+DEFAULT_GRACE_PERIOD = 30.0
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class RunCancelledError(Exception):
+    """
+    Raised instead of sending or retrying a request once its run was cancelled or ran past its deadline and grace period.
+    """
+
+
+def parse_duration(duration: str) -> float:
+    """
+    Parse a duration such as 90, 90s, 30m, 1.5h or 1d.
+
+    Args:
+        duration (str): The duration, in seconds if it has no unit.
+
+    Returns:
+        float: The duration in seconds.
+
+    Raises:
+        ValueError: If the duration cannot be parsed or is negative.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d*)?|\.\d+)\s*([smhd]?)\s*", duration)
+    if match is None:
+        raise ValueError(f"Invalid duration: {duration}")
+    return float(match.group(1)) * DURATION_UNITS.get(match.group(2), 1)
+
+
+class Cancellation(object):
+    """
+    Stops a run cooperatively, on a deadline or a signal.
+
+    Once the run is stopped, no new infos are dispatched, and the requests in flight get `grace_period` more seconds to finish: their attempts time out by then and are not retried afterwards, failing with RunCancelledError instead. Everything completed up to that point is saved as usual.
+
+    All methods are thread safe.
+
+    Attributes:
+        deadline (Optional[float]): The monotonic time after which no new infos are dispatched, None if there is none.
+        hard_deadline (Optional[float]): The monotonic time after which no request is sent or retried, None if there is none.
+        reason (Optional[str]): Why the run was stopped, None while it goes on.
+    """
+
+    def __init__(self):
+        self.deadline: Optional[float] = None
+        self.hard_deadline: Optional[float] = None
+        self.grace_period = DEFAULT_GRACE_PERIOD
+        self.reason: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def set_deadline(
+        self, seconds: Optional[float], grace_period: float = DEFAULT_GRACE_PERIOD
+    ):
+        """
+        Stop the run `seconds` from now.
+
+        Args:
+            seconds (Optional[float]): The number of seconds new infos are dispatched for, None for no deadline.
+            grace_period (float, optional): The number of seconds the requests in flight at the deadline may still take. Defaults to 30.
+        """
+        with self.lock:
+            self.grace_period = grace_period
+            if seconds is None:
+                self.deadline = None
+                self.hard_deadline = None
+                return
+            self.deadline = time.monotonic() + seconds
+            self.hard_deadline = self.deadline + grace_period
+
+    def cancel(self, reason: str = "cancelled"):
+        """
+        Stop dispatching new infos now, and give the requests in flight the grace period to finish.
+
+        Args:
+            reason (str, optional): Why the run is stopped. Defaults to "cancelled".
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.reason is None:
+                self.reason = reason
+            self.deadline = now if self.deadline is None else min(self.deadline, now)
+            hard_deadline = now + self.grace_period
+            if self.hard_deadline is None or hard_deadline < self.hard_deadline:
+                self.hard_deadline = hard_deadline
+
+    def abort(self, reason: str = "aborted"):
+        """
+        Stop the run now, without sending or retrying any more request.
+
+        Args:
+            reason (str, optional): Why the run is stopped. Defaults to "aborted".
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.reason is None:
+                self.reason = reason
+            self.deadline = now
+            self.hard_deadline = now
+
+    @property
+    def stopped(self) -> bool:
+        """
+        Whether new infos may no longer be dispatched.
+
+        Returns:
+            bool: True once the deadline passed or the run was cancelled.
+        """
+        deadline = self.deadline
+        if deadline is None or time.monotonic() < deadline:
+            return False
+        with self.lock:
+            if self.reason is None:
+                self.reason = "deadline reached"
+        return True
+
+    def remaining(self) -> Optional[float]:
+        """
+        The time left for requests, grace period included.
+
+        Returns:
+            Optional[float]: The number of seconds until the hard deadline, negative once it passed, or None if there is none.
+        """
+        hard_deadline = self.hard_deadline
+        if hard_deadline is None:
+            return None
+        return hard_deadline - time.monotonic()
+
+    def check(self, delay: float = 0.0):
+        """
+        Make sure a request may still be sent, `delay` seconds from now.
+
+        Args:
+            delay (float, optional): The number of seconds until the request would be sent, e.g. a retry backoff. Defaults to 0.
+
+        Raises:
+            RunCancelledError: If the request would be sent after the hard deadline.
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining <= delay:
+            raise RunCancelledError(f"Run {self.reason or 'deadline reached'}")
+
+    @contextlib.contextmanager
+    def handle_signals(self, signals=(signal.SIGINT, signal.SIGTERM)):
+        """
+        Cancel the run on the first SIGINT or SIGTERM, abort it on the second one, and restore the previous handlers afterwards.
+
+        Signal handlers can only be installed from the main thread. Elsewhere the signals are left alone.
+
+        Args:
+            signals (Tuple[signal.Signals, ...], optional): The signals to handle. Defaults to SIGINT and SIGTERM.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+        received = []
+
+        def handler(signum, frame):
+            name = signal.Signals(signum).name
+            received.append(name)
+            if len(received) == 1:
+                self.cancel(f"cancelled by {name}")
+                print(
+                    f"Received {name}, saving the results completed so far. The requests in flight have {self.grace_period:.0f} seconds to finish, send it again to stop now.",
+                    file=sys.stderr,
+                )
+            else:
+                self.abort(f"aborted by {name}")
+                print(f"Received {name} again, stopping now.", file=sys.stderr)
+
+        previous_handlers = {
+            signum: signal.signal(signum, handler) for signum in signals
+        }
+        try:
+            yield
+        finally:
+            for signum, previous_handler in previous_handlers.items():
+                signal.signal(signum, previous_handler)
@@ -0,0 +1,224 @@
+import threading
+
+import syphus.utils.yaml as yaml
+
+from syphus.data_generator.gpt_manager import GPTManager
+from syphus.data_generator.openai_settings import OpenAISettings
+from syphus.data_generator.response import Response
+from syphus.utils.settings import Settings
+from typing import Optional, List, Dict, Union, Any
+
+# Connection settings a tier inherits from the first endpoint when it does not set them.
+INHERITED_SETTINGS = ("type", "base", "key", "version")
+
+
+class CascadeSettings(Settings):
+    """
+    Represents the stronger engines responses are escalated to when the primary engine gets an info wrong.
+
+    Attributes:
+        tiers (List[Union[Dict[str, Any], List[Dict[str, Any]]]]): The endpoint, or list of endpoints, of every tier after the primary one, from the cheapest to the strongest. Endpoints are OpenAI_API mappings, whose type, base, key and version default to those of the first primary endpoint.
+        min_qa_pairs (int): Responses with fewer QA pairs are escalated.
+        escalate_on_unmatched (bool): Whether responses with a question without an answer or an answer without a question are escalated.
+    """
+
+    def __init__(
+        self,
+        *,
+        tiers: Optional[List[Union[Dict[str, Any], List[Dict[str, Any]]]]] = None,
+        min_qa_pairs: int = 1,
+        escalate_on_unmatched: bool = True,
+    ):
+        """
+        Initialize the CascadeSettings instance.
+
+        Args:
+            tiers (Optional[List[Union[Dict[str, Any], List[Dict[str, Any]]]]]): The endpoint, or list of endpoints, of every tier after the primary one. Defaults to no cascade.
+            min_qa_pairs (int): Responses with fewer QA pairs are escalated. Defaults to 1.
+            escalate_on_unmatched (bool): Whether responses with unmatched questions or answers are escalated. Defaults to True.
+
+        Raises:
+            ValueError: If min_qa_pairs is negative or a tier has no endpoint or no engine.
+        """
+        if min_qa_pairs < 0:
+            raise ValueError("min_qa_pairs must be non-negative")
+        self.tiers = tiers if tiers else []
+        for tier in self.tiers:
+            endpoints = tier if isinstance(tier, list) else [tier]
+            if not endpoints or any("engine" not in endpoint for endpoint in endpoints):
+                raise ValueError("Every cascade tier needs endpoints with an engine")
+        self.min_qa_pairs = min_qa_pairs
+        self.escalate_on_unmatched = escalate_on_unmatched
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the CascadeSettings instance to a dictionary representation.
+
+        Returns:
+            dict: A dictionary containing the cascade settings.
+        """
+        return {
+            "tiers": self.tiers,
+            "min_qa_pairs": self.min_qa_pairs,
+            "escalate_on_unmatched": self.escalate_on_unmatched,
+        }
+
+    def get_tier_endpoints(self, primary: OpenAISettings) -> List[List[OpenAISettings]]:
+        """
+        Resolve the endpoints of every tier after the primary one.
+
+        Args:
+            primary (OpenAISettings): The first primary endpoint, whose connection settings the tiers inherit.
+
+        Returns:
+            List[List[OpenAISettings]]: The endpoints of every tier.
+        """
+        inherited = {
+            name: value
+            for name, value in primary.to_dict().items()
+            if name in INHERITED_SETTINGS
+        }
+        return [
+            [
+                OpenAISettings(**{**inherited, **endpoint})
+                for endpoint in (tier if isinstance(tier, list) else [tier])
+            ]
+            for tier in self.tiers
+        ]
+
+
+def read_yaml(yaml_path: str) -> CascadeSettings:
+    """
+    Read cascade settings from the optional `Cascade` section of a YAML file.
+
+    Args:
+        yaml_path (str): The path to the YAML file containing the settings.
+
+    Returns:
+        CascadeSettings: The settings from the YAML file, or settings without tiers if the section is missing.
+    """
+    cascade_settings_dict = yaml.load(yaml_path).get("Cascade") or {}
+    return CascadeSettings(**cascade_settings_dict)
+
+
+class Cascade(object):
+    """
+    Queries a cheap primary engine first, and escalates an info to the next tier only when its response has a problem.
+
+    A response has a problem if it has fewer than `min_qa_pairs` QA pairs, which includes failed requests, or, with `escalate_on_unmatched`, if the parser found a question without an answer or an answer without a question. The escalated response replaces the previous one, unless it has no QA pair while the previous one had some.
+
+    Every tier counts the responses it produced and the ones accepted, without a problem, so the share of the traffic the primary engine can handle is known. All methods are thread safe.
+
+    Attributes:
+        settings (CascadeSettings): The cascade settings.
+        managers (List[GPTManager]): The manager of every tier, the primary one first.
+        queried (List[int]): The number of responses produced by every tier.
+        accepted (List[int]): The number of responses of every tier without a problem.
+    """
+
+    def __init__(self, settings: CascadeSettings, primary: GPTManager):
+        """
+        Initialize the Cascade instance.
+
+        Args:
+            settings (CascadeSettings): The cascade settings.
+            primary (GPTManager): The manager of the primary engine. The managers of the other tiers share its settings.
+        """
+        self.settings = settings
+        self.managers = [primary] + [
+            primary.with_endpoints(endpoints)
+            for endpoints in settings.get_tier_endpoints(primary.openai_api)
+        ]
+        self.queried = [0] * len(self.managers)
+        self.accepted = [0] * len(self.managers)
+        self.lock = threading.Lock()
+
+    def get_problem(self, response: Response) -> Optional[str]:
+        """
+        Decide whether a response should be escalated.
+
+        Args:
+            response (Response): The response.
+
+        Returns:
+            Optional[str]: Why the response should be escalated, None if it is accepted.
+        """
+        if len(response.qa_pairs) < self.settings.min_qa_pairs:
+            return f"{len(response.qa_pairs)} QA pairs, fewer than {self.settings.min_qa_pairs}"
+        if self.settings.escalate_on_unmatched and response.stats.get("unmatched"):
+            return f"{response.stats['unmatched']} unmatched questions or answers"
+        return None
+
+    def record(self, tier: int, response: Response) -> Optional[str]:
+        """
+        Count the response of a tier and decide whether it should be escalated.
+
+        Args:
+            tier (int): The index of the tier that produced the response.
+            response (Response): The response.
+
+        Returns:
+            Optional[str]: Why the response should be escalated, None if it is accepted, cancelled or there is no stronger tier. Cancelled responses are not counted.
+        """
+        if response.stats.get("cancelled"):
+            return None
+        problem = self.get_problem(response)
+        with self.lock:
+            self.queried[tier] += 1
+            if problem is None:
+                self.accepted[tier] += 1
+        return problem if tier + 1 < len(self.managers) else None
+
+    def choose(
+        self, tier: int, response: Response, escalated: Response, problem: str
+    ) -> Response:
+        """
+        Choose between a response and the response of the next tier, and note the escalation in its warnings.
+
+        Args:
+            tier (int): The index of the tier of `response`.
+            response (Response): The response that was escalated.
+            escalated (Response): The response of the next tier.
+            problem (str): Why the response was escalated.
+
+        Returns:
+            Response: The escalated response, or the previous one if the escalated one has no QA pair while the previous one had some.
+        """
+        chosen = response if not escalated.qa_pairs and response.qa_pairs else escalated
+        if chosen is escalated:
+            chosen.stats["cascade_tier"] = tier + 1
+        chosen.warning_message.insert(
+            0,
+            f"Escalated from {self.managers[tier].openai_api.engine} to {self.managers[tier + 1].openai_api.engine}: {problem}.",
+        )
+        return chosen
+
+    def set_pool_size(self, pool_size: int):
+        """
+        Size the connection pool of every endpoint of every tier.
+
+        Args:
+            pool_size (int): The number of connections per endpoint.
+        """
+        for manager in self.managers:
+            manager.set_pool_size(pool_size)
+
+    def report(self) -> str:
+        """
+        Format the hit rate of every tier for the terminal.
+
+        Returns:
+            str: One line per tier with the number of responses it produced and the share of them accepted.
+        """
+        lines = []
+        with self.lock:
+            for tier, manager in enumerate(self.managers):
+                rate = (
+                    f"{self.accepted[tier] / self.queried[tier]:.1%}"
+                    if self.queried[tier]
+                    else "n/a"
+                )
+                lines.append(
+                    f"Cascade tier {tier} ({manager.openai_api.engine}): {self.accepted[tier]}/{self.queried[tier]} accepted ({rate})"
+                )
+        return "\n".join(lines)
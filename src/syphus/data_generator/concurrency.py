@@ -0,0 +1,117 @@
+import collections
+import math
+import threading
+
+from typing import Optional
+
+
+class AIMDController(object):
+    """
+    An additive-increase, multiplicative-decrease controller of the number of requests in flight.
+
+    While requests complete without overload errors and their p95 latency stays close to the best p95 seen so far, the limit grows by `increase` every `limit` completions. On a rate limit, a timeout or a p95 rising above `latency_tolerance` times the baseline, the limit is multiplied by `decrease`, at most once per `limit` completions so that a burst of errors caused by the same overload only shrinks the window once. The baseline slowly drifts upwards so that a lasting change of the server latency is eventually accepted.
+
+    Attributes:
+        min_limit (int): The smallest limit.
+        max_limit (int): The largest limit.
+        limit (int): The current number of requests allowed in flight.
+        increases (int): The number of times the limit was increased.
+        decreases (int): The number of times the limit was decreased.
+    """
+
+    def __init__(
+        self,
+        *,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        initial_limit: Optional[int] = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_window: int = 100,
+        latency_tolerance: float = 2.0,
+        baseline_drift: float = 0.001,
+        min_samples: int = 20,
+    ):
+        """
+        Initialize the AIMDController instance.
+
+        Args:
+            min_limit (int, optional): The smallest limit. Defaults to 1.
+            max_limit (int, optional): The largest limit. Defaults to 64.
+            initial_limit (Optional[int], optional): The starting limit. Defaults to min_limit.
+            increase (float, optional): The amount added to the limit per window of successful requests. Defaults to 1.
+            decrease (float, optional): The factor applied to the limit on overload. Defaults to 0.5.
+            latency_window (int, optional): The number of recent latencies the p95 is computed over. Defaults to 100.
+            latency_tolerance (float, optional): How many times the baseline p95 may be exceeded before the limit is decreased. Defaults to 2.
+            baseline_drift (float, optional): The relative amount the baseline p95 rises per completion. Defaults to 0.001.
+            min_samples (int, optional): The number of latencies needed before the p95 is used. Defaults to 20.
+
+        Raises:
+            ValueError: If the bounds are invalid.
+        """
+        if min_limit < 1 or max_limit < min_limit:
+            raise ValueError("Must have 1 <= min_limit <= max_limit")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.baseline_drift = baseline_drift
+        self.min_samples = min_samples
+        self.latencies = collections.deque(maxlen=latency_window)
+        self.baseline = math.inf
+        self.window = float(min(max(initial_limit or min_limit, min_limit), max_limit))
+        # The first overload shrinks the window immediately.
+        self.completions_since_decrease = self.limit
+        self.increases = 0
+        self.decreases = 0
+        self.lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return int(self.window)
+
+    def p95(self) -> Optional[float]:
+        """
+        Compute the 95th percentile of the recent latencies.
+
+        Returns:
+            Optional[float]: The p95 in seconds, or None if there are fewer than min_samples latencies.
+        """
+        if len(self.latencies) < self.min_samples:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def record(self, latency: float, *, overloaded: bool = False):
+        """
+        Record a completed request and adjust the limit.
+
+        Args:
+            latency (float): The time the request took in seconds.
+            overloaded (bool, optional): Whether the request hit a rate limit, a timeout or another overload error.
+        """
+        with self.lock:
+            self.latencies.append(latency)
+            self.completions_since_decrease += 1
+            p95 = self.p95()
+            if p95 is not None:
+                self.baseline = min(p95, self.baseline * (1 + self.baseline_drift))
+                overloaded = overloaded or p95 > self.latency_tolerance * self.baseline
+            if overloaded:
+                if (
+                    self.completions_since_decrease >= self.limit
+                    and self.window > self.min_limit
+                ):
+                    self.window = max(self.min_limit, self.window * self.decrease)
+                    self.completions_since_decrease = 0
+                    self.decreases += 1
+                    # Latencies measured at the old limit no longer describe the server.
+                    self.latencies.clear()
+            elif self.window < self.max_limit:
+                previous_limit = self.limit
+                self.window = min(
+                    self.max_limit, self.window + self.increase / self.limit
+                )
+                if self.limit > previous_limit:
+                    self.increases += 1
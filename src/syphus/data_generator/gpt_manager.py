@@ -1,11 +1,156 @@
-import openai
+import asyncio
+import copy
+import math
+import queue
+import threading
 import time
 import sys
 
 import syphus.data_generator.gpt_params_settings as gpt_params_settings
+import syphus.data_generator.hedging as hedging
+import syphus.data_generator.http_client as http_client
 import syphus.data_generator.openai_settings as openai_settings
+import syphus.data_generator.rate_limiter as rate_limiter
+import syphus.data_generator.load_balancer as load_balancer
+import syphus.data_generator.retry as retry
+import syphus.data_generator.cache as response_cache
+import syphus.data_generator.token_budget as token_budget
 
-from typing import Optional, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from syphus.data_generator.cancellation import Cancellation, RunCancelledError
+from syphus.data_generator.metrics import Metrics
+from syphus.data_generator.streaming import StreamAccumulator
+
+from typing import Optional, List, Dict, Tuple, Union, Callable, Any
+
+
+def to_dict(obj: Any) -> Any:
+    """
+    Convert an OpenAI response object to plain data, so that it can be parsed, cached and saved like the responses of the legacy API.
+
+    Args:
+        obj (Any): An OpenAI model, or data that is already plain.
+
+    Returns:
+        Any: The plain data.
+    """
+    return obj.model_dump() if hasattr(obj, "model_dump") else obj
+
+
+def merge_completions(responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge the completions of duplicate requests into one completion holding all of their choices.
+
+    Args:
+        responses (List[Dict[str, Any]]): The completions, at least one.
+
+    Returns:
+        Dict[str, Any]: The metadata of the first completion, the choices of all of them numbered in order, and their summed usage.
+    """
+    merged = {
+        key: value
+        for key, value in responses[0].items()
+        if key not in ["choices", "usage"]
+    }
+    choices = [choice for response in responses for choice in response["choices"]]
+    merged["choices"] = [
+        {**choice, "index": index} for index, choice in enumerate(choices)
+    ]
+    usages = [response["usage"] for response in responses if response.get("usage")]
+    if usages:
+        merged["usage"] = {
+            key: sum(usage.get(key) or 0 for usage in usages)
+            for key in ["prompt_tokens", "completion_tokens", "total_tokens"]
+        }
+    return merged
+
+
+def merge_duplicate_stats(
+    stats: Optional[Dict[str, Any]], duplicate_stats: List[Dict[str, Any]]
+):
+    """
+    Merge the statistics of duplicate requests into the statistics of the request they stand for.
+
+    Args:
+        stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+        duplicate_stats (List[Dict[str, Any]]): The statistics of every duplicate request.
+    """
+    if stats is None:
+        return
+    stats.update(duplicate_stats[0])
+    stats["attempts"] = sum(
+        duplicate.get("attempts", 0) for duplicate in duplicate_stats
+    )
+    errors = [
+        error for duplicate in duplicate_stats for error in duplicate.get("errors", [])
+    ]
+    if errors:
+        stats["errors"] = errors
+    if any(duplicate.get("overloaded") for duplicate in duplicate_stats):
+        stats["overloaded"] = True
+    if all("completion_tokens" in duplicate for duplicate in duplicate_stats):
+        stats["completion_tokens"] = sum(
+            duplicate["completion_tokens"] for duplicate in duplicate_stats
+        )
+
+
+def get_duplicate_result(outcomes: List[Any]) -> Dict[str, Any]:
+    """
+    Merge the outcomes of duplicate requests, ignoring the ones that failed unless all of them did.
+
+    Args:
+        outcomes (List[Any]): The completion or the error of every duplicate request.
+
+    Returns:
+        Dict[str, Any]: The merged completion of the duplicate requests that succeeded.
+
+    Raises:
+        Exception: The error of the first duplicate request if all of them failed.
+    """
+    responses = [
+        outcome for outcome in outcomes if not isinstance(outcome, BaseException)
+    ]
+    if not responses:
+        raise outcomes[0]
+    if len(responses) < len(outcomes):
+        print(
+            f"{len(outcomes) - len(responses)} of {len(outcomes)} duplicate requests failed",
+            file=sys.stderr,
+        )
+    return merge_completions(responses)
+
+
+class RequestTimeoutError(TimeoutError):
+    """
+    Raised when an attempt takes longer than `request_timeout`, or than the time left before the run stops.
+    """
+
+
+class RequestAbandonedError(Exception):
+    """
+    Raised instead of retrying a hedged request, or reading more of its stream, once its duplicate completed.
+    """
+
+
+def get_token_budget(
+    settings: token_budget.TokenBudgetSettings,
+    endpoints: List[openai_settings.OpenAISettings],
+) -> token_budget.TokenBudget:
+    """
+    Build the token budget of a set of endpoints, for the smallest known context window among them.
+
+    Args:
+        settings (token_budget.TokenBudgetSettings): The token budget settings.
+        endpoints (List[openai_settings.OpenAISettings]): The settings of the endpoints.
+
+    Returns:
+        token_budget.TokenBudget: The token budget.
+    """
+    engine = min(
+        (endpoint.engine for endpoint in endpoints),
+        key=lambda engine: token_budget.get_context_window(engine) or math.inf,
+    )
+    return token_budget.TokenBudget(settings, engine)
 
 
 class GPTManager(object):
@@ -14,8 +159,16 @@ class GPTManager(object):
 
     Attributes:
         gpt_info_path (str, optional): Path to a YAML file containing OpenAI API and GPT parameters settings.
-        openai_api (openai_settings.OpenAISettings, optional): An instance of OpenAISettings containing OpenAI API settings.
+        openai_api (openai_settings.OpenAISettings): The settings of the first endpoint.
         gpt_params (gpt_params_settings.GPTParamsSettings, optional): An instance of GPTParamsSettings containing GPT parameters settings.
+        load_balancer (load_balancer.LoadBalancer): The router distributing requests over the endpoints, each with its own rate limiter and pooled client.
+        retry_policy (retry.RetryPolicy): The policy deciding which failed requests are retried and when.
+        token_budget (token_budget.TokenBudget): Sizes max_tokens of every request to the context window, and truncates or rejects infos that are too long.
+        cache (Optional[response_cache.ResponseCache]): The persistent response cache, None if responses are not cached.
+        stream (bool): Whether completions are streamed, to measure the time to first token and hand out content as it is generated.
+        metrics (Metrics): Collects the time spent waiting for the limiters and on the network.
+        cancellation (Cancellation): Stops requests from being sent or retried once the run is cancelled or past its deadline.
+        hedger (Optional[hedging.Hedger]): Sends a duplicate of the requests that are slow to complete, None if requests are not hedged.
 
     Raises:
         ValueError: If neither gpt_info_path nor openai_api is provided during initialization.
@@ -26,16 +179,38 @@ class GPTManager(object):
         self,
         *,
         gpt_info_path: Optional[str] = None,
-        openai_api: Optional[openai_settings.OpenAISettings] = None,
+        openai_api: Optional[
+            Union[openai_settings.OpenAISettings, List[openai_settings.OpenAISettings]]
+        ] = None,
         gpt_params: Optional[gpt_params_settings.GPTParamsSettings] = None,
+        rate_limit: Optional[rate_limiter.RateLimitSettings] = None,
+        load_balancing: Optional[load_balancer.LoadBalancerSettings] = None,
+        http: Optional[http_client.HTTPSettings] = None,
+        retry_policy: Optional[retry.RetryPolicy] = None,
+        token_budget_settings: Optional[token_budget.TokenBudgetSettings] = None,
+        cache: Optional[response_cache.ResponseCache] = None,
+        stream: bool = False,
+        metrics: Optional[Metrics] = None,
+        cancellation: Optional[Cancellation] = None,
+        hedge_settings: Optional[hedging.HedgeSettings] = None,
     ):
         """
         Initialize the GPTManager instance.
 
         Args:
             gpt_info_path (str, optional): Path to a YAML file containing OpenAI API and GPT parameters settings.
-            openai_api (openai_settings.OpenAISettings, optional): An instance of OpenAISettings containing OpenAI API settings.
+            openai_api (openai_settings.OpenAISettings or List[openai_settings.OpenAISettings], optional): The settings of one endpoint, or of several endpoints to balance requests over.
             gpt_params (gpt_params_settings.GPTParamsSettings, optional): An instance of GPTParamsSettings containing GPT-3 parameters settings.
+            rate_limit (rate_limiter.RateLimitSettings, optional): Requests and tokens per minute quotas of each endpoint. Read from the `Rate_limit` section of gpt_info_path if not given.
+            load_balancing (load_balancer.LoadBalancerSettings, optional): How requests are routed to the endpoints. Read from the `Load_balancer` section of gpt_info_path if not given.
+            http (http_client.HTTPSettings, optional): The connection pool and timeouts of the clients of each endpoint. Read from the `HTTP` section of gpt_info_path if not given.
+            retry_policy (retry.RetryPolicy, optional): The retry policy. Built from the `Retry` section of gpt_info_path if not given.
+            token_budget_settings (token_budget.TokenBudgetSettings, optional): How max_tokens is sized to the context window. Read from the `Token_budget` section of gpt_info_path if not given.
+            cache (response_cache.ResponseCache, optional): A persistent cache of responses keyed by request fingerprint.
+            stream (bool, optional): Whether to stream completions. Defaults to False.
+            metrics (Metrics, optional): The metrics of the run. Defaults to new metrics.
+            cancellation (Cancellation, optional): The cancellation of the run. Defaults to a run without deadline.
+            hedge_settings (hedging.HedgeSettings, optional): When a duplicate of a slow request is sent. Read from the `Hedging` section of gpt_info_path if not given.
 
         """
         if gpt_info_path:
@@ -45,17 +220,50 @@ class GPTManager(object):
                     flush=True,
                     file=sys.stderr,
                 )
-            self.openai_api = openai_settings.read_yaml(gpt_info_path)
+            endpoints = openai_settings.read_yaml_all(gpt_info_path)
             self.gpt_params = gpt_params_settings.read_yaml(gpt_info_path)
+            if rate_limit is None:
+                rate_limit = rate_limiter.read_yaml(gpt_info_path)
+            if load_balancing is None:
+                load_balancing = load_balancer.read_yaml(gpt_info_path)
+            if http is None:
+                http = http_client.read_yaml(gpt_info_path)
+            if retry_policy is None:
+                retry_policy = retry.RetryPolicy(retry.read_yaml(gpt_info_path))
+            if token_budget_settings is None:
+                token_budget_settings = token_budget.read_yaml(gpt_info_path)
+            if hedge_settings is None:
+                hedge_settings = hedging.read_yaml(gpt_info_path)
         elif openai_api:
-            self.openai_api = openai_api
+            endpoints = openai_api if isinstance(openai_api, list) else [openai_api]
             if gpt_params:
                 self.gpt_params = gpt_params
             else:
                 self.gpt_params = gpt_params_settings.GPTParamsSettings()
         else:
             raise ValueError("Must provide either gpt_info_path or openai_api")
-        openai.api_key = self.openai_api.key
+        self.openai_api = endpoints[0]
+        self.load_balancer = load_balancer.LoadBalancer(
+            endpoints, load_balancing, rate_limit=rate_limit, http_settings=http
+        )
+        self.retry_policy = retry_policy if retry_policy else retry.RetryPolicy()
+        self.token_budget = get_token_budget(
+            (
+                token_budget_settings
+                if token_budget_settings
+                else token_budget.TokenBudgetSettings()
+            ),
+            endpoints,
+        )
+        self.cache = cache
+        self.stream = stream
+        self.metrics = metrics if metrics else Metrics()
+        self.cancellation = cancellation if cancellation else Cancellation()
+        self.hedger = (
+            hedging.Hedger(hedge_settings)
+            if hedge_settings is not None and hedge_settings.enabled
+            else None
+        )
 
     def set_gpt_params(self, gpt_params: gpt_params_settings.GPTParamsSettings):
         """
@@ -67,36 +275,950 @@ class GPTManager(object):
         """
         self.gpt_params = gpt_params
 
-    def query_gpt(self, prompt: List[Any]):
+    def set_pool_size(self, pool_size: int):
+        """
+        Size the connection pool of every endpoint, usually to the number of workers of a run.
+
+        Args:
+            pool_size (int): The number of connections per endpoint.
+
+        """
+        self.load_balancer.set_pool_size(pool_size)
+
+    def with_endpoints(
+        self, endpoints: List[openai_settings.OpenAISettings]
+    ) -> "GPTManager":
+        """
+        Make a manager sending the same requests to other endpoints, e.g. a stronger engine.
+
+        The new manager has its own load balancer, token budget and hedger, with the routing, quotas, connection, token budget and hedging settings of this one. It shares its GPT parameters, retry policy, cache, metrics and cancellation.
+
+        Args:
+            endpoints (List[openai_settings.OpenAISettings]): The settings of the endpoints of the new manager.
+
+        Returns:
+            GPTManager: The new manager, of the same class as this one.
+
+        """
+        manager = copy.copy(self)
+        first_endpoint = self.load_balancer.endpoints[0]
+        manager.openai_api = endpoints[0]
+        manager.load_balancer = load_balancer.LoadBalancer(
+            endpoints,
+            self.load_balancer.settings,
+            rate_limit=first_endpoint.rate_limiter.settings,
+            http_settings=first_endpoint.http_settings,
+        )
+        manager.token_budget = get_token_budget(self.token_budget.settings, endpoints)
+        if self.hedger is not None:
+            manager.hedger = hedging.Hedger(self.hedger.settings)
+        return manager
+
+    def get_request_kwargs(
+        self,
+        prompt: List[Any],
+        endpoint: Optional[load_balancer.Endpoint] = None,
+        max_tokens: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Build the keyword arguments of a chat completion request.
+
+        Args:
+            prompt (List[Any]): The conversation messages to send.
+            endpoint (load_balancer.Endpoint, optional): The endpoint the request is sent to. Defaults to the model of the first endpoint.
+            max_tokens (int, optional): The number of completion tokens planned for the request. Defaults to max_tokens of the GPT parameters.
+
+        Returns:
+            Dict[str, Any]: The keyword arguments passed to the chat completion API.
+
+        """
+        if endpoint is None:
+            endpoint_kwargs = {"model": self.openai_api.engine}
+        else:
+            endpoint_kwargs = endpoint.get_request_kwargs()
+        return {
+            **endpoint_kwargs,
+            "messages": prompt,
+            "temperature": self.gpt_params.temperature,
+            "max_tokens": (
+                self.gpt_params.max_tokens if max_tokens is None else max_tokens
+            ),
+            "top_p": self.gpt_params.top_p,
+            "frequency_penalty": self.gpt_params.frequency_penalty,
+            "presence_penalty": self.gpt_params.presence_penalty,
+            "stop": self.gpt_params.stop,
+            **({"n": self.get_request_n()} if self.get_request_n() > 1 else {}),
+            **({"stream": True} if self.stream else {}),
+        }
+
+    def get_request_n(self) -> int:
+        """
+        Get the number of completions asked for in a single request.
+
+        Returns:
+            int: n of the GPT parameters, or 1 if n parallel requests are sent instead.
+
+        """
+        return 1 if self.gpt_params.parallel_n else self.gpt_params.n
+
+    def estimate_request_tokens(
+        self, prompt: List[Any], max_tokens: Optional[int] = None
+    ) -> int:
+        """
+        Count the number of tokens a request may consume, used to charge the rate limiter before sending it.
+
+        Args:
+            prompt (List[Any]): The conversation messages to send.
+            max_tokens (int, optional): The number of completion tokens planned for the request. Defaults to max_tokens of the GPT parameters.
+
+        Returns:
+            int: The prompt tokens plus the maximum number of completion tokens of every completion.
+
+        """
+        if max_tokens is None:
+            max_tokens = self.gpt_params.max_tokens
+        return (
+            self.token_budget.counter.count_messages_tokens(prompt)
+            + max_tokens * self.get_request_n()
+        )
+
+    def get_attempt_timeout(self, endpoint: load_balancer.Endpoint) -> Optional[float]:
+        """
+        Compute how long an attempt may take: the `request_timeout` of the endpoint, capped by the time left before the run stops.
+
+        Args:
+            endpoint (load_balancer.Endpoint): The endpoint the attempt is sent to.
+
+        Returns:
+            Optional[float]: The timeout in seconds, None for no limit.
+
+        Raises:
+            RunCancelledError: If the run already stopped.
+
+        """
+        self.cancellation.check()
+        timeouts = [
+            timeout
+            for timeout in (
+                endpoint.http_settings.request_timeout,
+                self.cancellation.remaining(),
+            )
+            if timeout is not None
+        ]
+        return min(timeouts) if timeouts else None
+
+    def get_attempt_kwargs(
+        self,
+        prompt: List[Any],
+        endpoint: load_balancer.Endpoint,
+        max_tokens: int,
+        timeout: Optional[float],
+    ) -> Dict[str, Any]:
+        """
+        Build the keyword arguments of an attempt, with its timeouts capped to the time it may take.
+
+        Args:
+            prompt (List[Any]): The conversation messages to send.
+            endpoint (load_balancer.Endpoint): The endpoint the attempt is sent to.
+            max_tokens (int): The number of completion tokens planned for the request.
+            timeout (Optional[float]): The time the attempt may take, None for no limit.
+
+        Returns:
+            Dict[str, Any]: The keyword arguments passed to the chat completion API.
+
+        """
+        kwargs = self.get_request_kwargs(prompt, endpoint, max_tokens)
+        if timeout is not None:
+            kwargs["timeout"] = endpoint.http_settings.get_timeout(timeout)
+        return kwargs
+
+    def get_cache_key(self, prompt: List[Any]) -> str:
+        """
+        Compute the cache key of a request, from its messages, the GPT parameters and the engines of the endpoints.
+
+        Args:
+            prompt (List[Any]): The conversation messages to send.
+
+        Returns:
+            str: The request fingerprint.
+
+        """
+        engines = sorted(
+            {endpoint.settings.engine for endpoint in self.load_balancer.endpoints}
+        )
+        return response_cache.fingerprint(
+            prompt, self.gpt_params.to_dict(), ",".join(engines)
+        )
+
+    def get_cached_response(
+        self, prompt: List[Any], stats: Optional[Dict[str, Any]], use_cache: bool
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Look up a request in the response cache.
+
+        Args:
+            prompt (List[Any]): The conversation messages to send.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+            use_cache (bool): Whether the request may use the response cache.
+
+        Returns:
+            Tuple[Optional[str], Optional[Dict[str, Any]]]: The cache key, None if the cache is not used, and the cached response, None on a miss.
+
+        """
+        if self.cache is None or not use_cache:
+            return None, None
+        key = self.get_cache_key(prompt)
+        cached_response = self.cache.get(key)
+        if stats is not None:
+            stats["cached"] = cached_response is not None
+        return key, cached_response
+
+    def finish_query(
+        self,
+        response: Dict[str, Any],
+        stats: Optional[Dict[str, Any]],
+        cache_key: Optional[str],
+        request_start: float,
+    ) -> Dict[str, Any]:
+        """
+        Record how long a request took, retries included, and store its completion in the response cache.
+
+        Args:
+            response (Dict[str, Any]): The completion.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+            cache_key (Optional[str]): The cache key of the request, None if the cache is not used.
+            request_start (float): The monotonic time the request started.
+
+        Returns:
+            Dict[str, Any]: The completion.
+
+        """
+        if stats is not None:
+            stats["latency"] = time.monotonic() - request_start
+        if cache_key is not None:
+            self.cache.put(cache_key, response)
+        return response
+
+    def plan_request(
+        self, prompt: List[Any], stats: Optional[Dict[str, Any]]
+    ) -> Tuple[List[Any], int, int]:
+        """
+        Size a request to the context window and count the tokens charged to the rate limiter for every attempt.
+
+        Args:
+            prompt (List[Any]): The conversation messages to send.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+
+        Returns:
+            Tuple[List[Any], int, int]: The messages, truncated if needed, the max_tokens of the request, and its estimated number of tokens.
+
+        """
+        prompt, max_tokens = self.token_budget.plan(
+            prompt, self.gpt_params.max_tokens, stats
+        )
+        return prompt, max_tokens, self.estimate_request_tokens(prompt, max_tokens)
+
+    def record_attempt(
+        self,
+        attempt: int,
+        endpoint: load_balancer.Endpoint,
+        stats: Optional[Dict[str, Any]],
+    ):
+        """
+        Record the number of an attempt and the endpoint it was routed to.
+
+        Args:
+            attempt (int): The number of the attempt.
+            endpoint (load_balancer.Endpoint): The endpoint the attempt is sent to.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+
+        """
+        if stats is not None:
+            stats["attempts"] = attempt
+            stats["endpoint"] = endpoint.name
+
+    def finish_request(
+        self, endpoint: load_balancer.Endpoint, raw_response: Any, response: Any
+    ) -> Dict[str, Any]:
+        """
+        Update the rate limiter of an endpoint from the headers of the attempt that succeeded.
+
+        Args:
+            endpoint (load_balancer.Endpoint): The endpoint the attempt was sent to.
+            raw_response (Any): The raw response, holding the headers.
+            response (Any): The completion.
+
+        Returns:
+            Dict[str, Any]: The completion.
+
+        """
+        endpoint.rate_limiter.update_from_headers(
+            rate_limiter.get_headers(raw_response)
+        )
+        return response
+
+    def is_endpoint_failure(self, error: Exception) -> bool:
+        """
+        Decide whether an error counts against the health of the endpoint that raised it.
+
+        Transient errors and authentication errors do; errors caused by the request itself, such as an invalid prompt, do not.
+
+        Args:
+            error (Exception): The error raised by the attempt.
+
+        Returns:
+            bool: True if the endpoint should be considered as failing.
+
+        """
+        return self.retry_policy.is_retryable(error) or retry.get_status_code(
+            error
+        ) in (401, 403)
+
+    def handle_error(
+        self,
+        error: Exception,
+        attempt: int,
+        stats: Optional[Dict[str, Any]],
+        endpoint: load_balancer.Endpoint,
+    ) -> float:
+        """
+        Record a failed attempt and decide whether to retry it.
+
+        Args:
+            error (Exception): The error raised by the attempt.
+            attempt (int): The number of attempts made so far.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+            endpoint (load_balancer.Endpoint): The endpoint the attempt was sent to.
+
+        Returns:
+            float: The delay in seconds before the next attempt.
+
+        Raises:
+            Exception: The error itself if it is fatal or the retries are exhausted.
+
+        """
+        endpoint.rate_limiter.update_from_headers(rate_limiter.get_headers(error))
+        if stats is not None:
+            stats.setdefault("errors", []).append(type(error).__name__)
+            if retry.is_overload(error):
+                stats["overloaded"] = True
+        delay = self.retry_policy.next_delay(attempt, error)
+        if delay is None:
+            raise error
+        print(
+            f"Error: {error}, retrying in {delay:.1f} seconds",
+            flush=True,
+            file=sys.stderr,
+        )
+        return delay
+
+    def get_stream_accumulator(
+        self,
+        start: float,
+        attempt: int,
+        on_delta: Optional[Callable[[str, int], None]],
+    ) -> StreamAccumulator:
+        """
+        Create the accumulator of a streamed attempt.
+
+        Args:
+            start (float): The monotonic time the attempt was sent.
+            attempt (int): The number of the attempt.
+            on_delta (Optional[Callable[[str, int], None]]): The callback receiving the content of the stream.
+
+        Returns:
+            StreamAccumulator: The accumulator passing the content to `on_delta`.
+
+        """
+        return StreamAccumulator(
+            start=start,
+            on_delta=(
+                (lambda content: on_delta(content, attempt)) if on_delta else None
+            ),
+        )
+
+    def finish_stream(
+        self, accumulator: StreamAccumulator, stats: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Rebuild the completion of a finished stream and record its speed.
+
+        Args:
+            accumulator (StreamAccumulator): The accumulator of the stream.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+
+        Returns:
+            Dict[str, Any]: The rebuilt completion.
+
+        """
+        if stats is not None:
+            accumulator.record_stats(stats)
+        return accumulator.to_response()
+
+    def send(
+        self,
+        endpoint: load_balancer.Endpoint,
+        kwargs: Dict[str, Any],
+        start: float,
+        attempt: int,
+        stats: Optional[Dict[str, Any]],
+        on_delta: Optional[Callable[[str, int], None]],
+        timeout: Optional[float],
+        abandoned: Optional[threading.Event],
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Send an attempt and read its completion, streamed or not.
+
+        Args:
+            endpoint (load_balancer.Endpoint): The endpoint the attempt is sent to.
+            kwargs (Dict[str, Any]): The keyword arguments passed to the chat completion API.
+            start (float): The monotonic time the attempt was sent.
+            attempt (int): The number of the attempt.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+            on_delta (Optional[Callable[[str, int], None]]): In streaming mode, the callback receiving the content of the stream.
+            timeout (Optional[float]): The time the attempt may take, None for no limit.
+            abandoned (Optional[threading.Event]): Set once the completion is no longer needed.
+
+        Returns:
+            Tuple[Any, Dict[str, Any]]: The raw response, holding the headers, and the completion.
+
+        Raises:
+            RequestTimeoutError: If a stream takes longer than `timeout`.
+            RequestAbandonedError: If `abandoned` is set while the completion is streamed.
+
+        """
+        client = endpoint.get_client()
+        raw_response = client.chat.completions.with_raw_response.create(**kwargs)
+        response = raw_response.parse()
+        if not self.stream:
+            return raw_response, to_dict(response)
+        accumulator = self.get_stream_accumulator(start, attempt, on_delta)
+        for chunk in response:
+            accumulator.add(to_dict(chunk))
+            # The read timeout only bounds the gap between two chunks.
+            if timeout is not None and time.monotonic() - start > timeout:
+                response.close()
+                raise RequestTimeoutError(
+                    f"Request timed out after {timeout:.1f} seconds"
+                )
+            if abandoned is not None and abandoned.is_set():
+                response.close()
+                raise RequestAbandonedError("Request abandoned for its duplicate")
+        return raw_response, self.finish_stream(accumulator, stats)
+
+    def query_gpt(
+        self,
+        prompt: List[Any],
+        *,
+        stats: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        on_delta: Optional[Callable[[str, int], None]] = None,
+    ):
         """
         Generate a response from the GPT-3 engine based on the provided prompt.
 
+        Responses found in the response cache are returned without sending a request. Every attempt is routed to an endpoint by the load balancer. Failed attempts are retried according to the retry policy. max_tokens is sized to the context window by the token budget, which may also truncate or reject the prompt. The time the request took, retries included, is added to `stats`, and in streaming mode the time to first token and the generation speed too. With n larger than 1 in the GPT parameters, the completion holds n choices, generated by a single request, or by n parallel requests if `parallel_n` is set. With hedging, a duplicate of a request still in flight after the hedging delay is sent, and the first completion is kept.
+
         Args:
             prompt (List[Any]): An instance of Prompts containing the conversation prompt and messages.
+            stats (Optional[Dict[str, Any]]): A dictionary filled with statistics of the request, such as the number of attempts.
+            use_cache (bool): Whether to look up and store the response in the response cache.
+            on_delta (Optional[Callable[[str, int], None]]): In streaming mode, called with every piece of content as it arrives and the number of the attempt it belongs to, so that the content of failed attempts can be discarded. Raising from it aborts the attempt.
 
         Returns:
-            dict: A dictionary containing the response generated by the GPT-3 engine.
+            dict: A dictionary containing the response generated by the GPT-3 engine. Streamed completions are rebuilt into the same layout.
 
         """
-        success = False
-        while not success:
+        request_start = time.monotonic()
+        cache_key, cached_response = self.get_cached_response(prompt, stats, use_cache)
+        if cached_response is not None:
+            return cached_response
+        if self.gpt_params.n > 1 and self.gpt_params.parallel_n:
+            response = self.request_duplicates(prompt, stats, on_delta)
+        elif self.hedges(on_delta):
+            response = self.request_hedged(prompt, stats)
+        else:
+            response = self.request_gpt(prompt, stats, on_delta)
+        return self.finish_query(response, stats, cache_key, request_start)
+
+    def request_gpt(
+        self,
+        prompt: List[Any],
+        stats: Optional[Dict[str, Any]],
+        on_delta: Optional[Callable[[str, int], None]],
+        *,
+        avoid: Optional[load_balancer.Endpoint] = None,
+        abandoned: Optional[threading.Event] = None,
+    ) -> Dict[str, Any]:
+        """
+        Send a request, bypassing the cache, and retry its failed attempts.
+
+        Args:
+            prompt (List[Any]): The conversation messages to send.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+            on_delta (Optional[Callable[[str, int], None]]): In streaming mode, called with every piece of content of the first choice and the number of its attempt.
+            avoid (Optional[load_balancer.Endpoint], optional): An endpoint to route around while another one has capacity. Defaults to None.
+            abandoned (Optional[threading.Event], optional): Set once the completion is no longer needed, e.g. by the duplicate of a hedged request. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: The completion.
+
+        Raises:
+            RequestAbandonedError: If `abandoned` is set before the request completes. An attempt already waiting for a non streamed completion runs to the end.
+
+        """
+        prompt, max_tokens, num_tokens = self.plan_request(prompt, stats)
+        attempt = 0
+        while True:
+            if abandoned is not None and abandoned.is_set():
+                raise RequestAbandonedError("Request abandoned for its duplicate")
+            attempt += 1
+            wait_start = time.monotonic()
+            endpoint = self.load_balancer.acquire(avoid)
+            self.record_attempt(attempt, endpoint, stats)
+            failed = False
             try:
-                response = openai.ChatCompletion.create(
-                    model=self.openai_api.engine,
-                    messages=prompt,
-                    temperature=self.gpt_params.temperature,
-                    max_tokens=self.gpt_params.max_tokens,
-                    top_p=self.gpt_params.top_p,
-                    frequency_penalty=self.gpt_params.frequency_penalty,
-                    presence_penalty=self.gpt_params.presence_penalty,
-                    stop=self.gpt_params.stop,
+                endpoint.rate_limiter.acquire(num_tokens)
+                start = time.monotonic()
+                self.metrics.observe("limiter", start - wait_start)
+                timeout = self.get_attempt_timeout(endpoint)
+                raw_response, response = self.send(
+                    endpoint,
+                    self.get_attempt_kwargs(prompt, endpoint, max_tokens, timeout),
+                    start,
+                    attempt,
+                    stats,
+                    on_delta,
+                    timeout,
+                    abandoned,
                 )
-                success = True
+                self.metrics.observe("network", time.monotonic() - start)
+                break
+            except (RunCancelledError, RequestAbandonedError):
+                raise
             except Exception as e:
-                print(f"Error: {e}")
-                if "rate limit" in str(e) or "Rate limit" in str(e):
-                    print("Sleeping for 3 seconds")
-                    time.sleep(3)
-                else:
-                    raise e
-        return response
+                failed = self.is_endpoint_failure(e)
+                delay = self.handle_error(e, attempt, stats, endpoint)
+            finally:
+                self.load_balancer.release(endpoint, failed=failed)
+            self.cancellation.check(delay)
+            time.sleep(delay)
+        return self.finish_request(endpoint, raw_response, response)
+
+    def request_duplicates(
+        self,
+        prompt: List[Any],
+        stats: Optional[Dict[str, Any]],
+        on_delta: Optional[Callable[[str, int], None]],
+    ) -> Dict[str, Any]:
+        """
+        Send n parallel requests of one completion each, for backends that do not support n, and merge their completions.
+
+        Args:
+            prompt (List[Any]): The conversation messages to send.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected, merged from the ones of the duplicate requests.
+            on_delta (Optional[Callable[[str, int], None]]): In streaming mode, called with the content of the first duplicate request.
+
+        Returns:
+            Dict[str, Any]: The completion holding the choices of every duplicate request that succeeded.
+
+        Raises:
+            Exception: The error of the first duplicate request if all of them failed.
+
+        """
+
+        def request(index: int) -> Any:
+            try:
+                return self.request_gpt(
+                    prompt, duplicate_stats[index], on_delta if index == 0 else None
+                )
+            except Exception as e:
+                return e
+
+        duplicate_stats = [{} for _ in range(self.gpt_params.n)]
+        with ThreadPoolExecutor(max_workers=self.gpt_params.n - 1) as executor:
+            futures = [
+                executor.submit(request, index) for index in range(1, self.gpt_params.n)
+            ]
+            outcomes = [request(0)] + [future.result() for future in futures]
+        merge_duplicate_stats(stats, duplicate_stats)
+        return get_duplicate_result(outcomes)
+
+    def hedges(self, on_delta: Optional[Callable[[str, int], None]]) -> bool:
+        """
+        Decide whether a request may be hedged.
+
+        Args:
+            on_delta (Optional[Callable[[str, int], None]]): The callback of the request receiving the content of its stream.
+
+        Returns:
+            bool: True if hedging is enabled, unless the request streams its content to a callback, which cannot tell two streams apart.
+
+        """
+        return self.hedger is not None and not (self.stream and on_delta is not None)
+
+    def get_hedge_avoid(
+        self, stats: Dict[str, Any]
+    ) -> Optional[load_balancer.Endpoint]:
+        """
+        Get the endpoint the duplicate of a hedged request should be routed around.
+
+        Args:
+            stats (Dict[str, Any]): The statistics of the request being hedged.
+
+        Returns:
+            Optional[load_balancer.Endpoint]: The endpoint of its last attempt, or None if the duplicate may go to any endpoint.
+
+        """
+        if not self.hedger.settings.other_endpoint:
+            return None
+        name = stats.get("endpoint")
+        return next(
+            (
+                endpoint
+                for endpoint in self.load_balancer.endpoints
+                if endpoint.name == name
+            ),
+            None,
+        )
+
+    def finish_hedge(
+        self,
+        outcomes: List[Tuple[int, Any]],
+        hedge_stats: List[Dict[str, Any]],
+        stats: Optional[Dict[str, Any]],
+        start: float,
+        hedged: bool,
+    ) -> Dict[str, Any]:
+        """
+        Keep the first completion of a request and of its duplicate, if one was sent, and record the outcome of the hedge.
+
+        Args:
+            outcomes (List[Tuple[int, Any]]): The index, 0 for the request and 1 for the duplicate, and the completion or the error of every request that finished, in the order they did.
+            hedge_stats (List[Dict[str, Any]]): The statistics of the request and of its duplicate.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected, merged from the ones of the request that won, with the attempts of both.
+            start (float): The monotonic time the request was sent.
+            hedged (bool): Whether the duplicate was sent.
+
+        Returns:
+            Dict[str, Any]: The first completion.
+
+        Raises:
+            Exception: The error of the request if neither it nor its duplicate succeeded.
+
+        """
+        winner = next(
+            (
+                (index, outcome)
+                for index, outcome in outcomes
+                if not isinstance(outcome, BaseException)
+            ),
+            None,
+        )
+        if stats is not None:
+            stats.update(hedge_stats[winner[0] if winner else 0])
+            stats["attempts"] = sum(
+                request_stats.get("attempts", 0) for request_stats in hedge_stats
+            )
+            if hedged:
+                stats["hedged"] = True
+                stats["hedge_won"] = winner is not None and winner[0] == 1
+        if hedged:
+            self.metrics.record_hedge(winner is not None and winner[0] == 1)
+        if winner is None:
+            raise dict(outcomes)[0]
+        self.hedger.observe(time.monotonic() - start)
+        return winner[1]
+
+    def request_hedged(
+        self, prompt: List[Any], stats: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Send a request, and a duplicate of it if it is still in flight after the hedging delay, keeping the first completion.
+
+        The request and its duplicate run in their own threads. The one that loses stops before its next attempt or stream chunk, but an attempt already waiting for a non streamed completion cannot be interrupted and runs to the end in the background, its completion discarded.
+
+        Args:
+            prompt (List[Any]): The conversation messages to send.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+
+        Returns:
+            Dict[str, Any]: The completion of the request or of its duplicate, whichever succeeded first.
+
+        Raises:
+            Exception: The error of the request if neither it nor its duplicate succeeded.
+
+        """
+        start = time.monotonic()
+        delay = self.hedger.get_delay()
+        if delay is None:
+            response = self.request_gpt(prompt, stats, None)
+            self.hedger.observe(time.monotonic() - start)
+            return response
+        hedge_stats = [{}, {}]
+        finished = queue.Queue()
+        abandoned = threading.Event()
+
+        def request(index: int, avoid: Optional[load_balancer.Endpoint]):
+            try:
+                finished.put(
+                    (
+                        index,
+                        self.request_gpt(
+                            prompt,
+                            hedge_stats[index],
+                            None,
+                            avoid=avoid,
+                            abandoned=abandoned,
+                        ),
+                    )
+                )
+            except Exception as e:
+                finished.put((index, e))
+
+        threading.Thread(target=request, args=(0, None), daemon=True).start()
+        outcomes = []
+        sent = 1
+        try:
+            outcomes.append(finished.get(timeout=delay))
+        except queue.Empty:
+            if self.hedger.try_hedge():
+                avoid = self.get_hedge_avoid(hedge_stats[0])
+                threading.Thread(target=request, args=(1, avoid), daemon=True).start()
+                sent = 2
+        while len(outcomes) < sent and all(
+            isinstance(outcome, BaseException) for _, outcome in outcomes
+        ):
+            outcomes.append(finished.get())
+        abandoned.set()
+        return self.finish_hedge(outcomes, hedge_stats, stats, start, sent > 1)
+
+
+class AsyncGPTManager(GPTManager):
+    """
+    A GPTManager that can also query the OpenAI GPT engine from an asyncio event loop.
+
+    The synchronous `query_gpt` is inherited unchanged, so one instance can serve both the thread based and the asyncio based query engines.
+
+    """
+
+    async def asend(
+        self,
+        endpoint: load_balancer.Endpoint,
+        kwargs: Dict[str, Any],
+        start: float,
+        attempt: int,
+        stats: Optional[Dict[str, Any]],
+        on_delta: Optional[Callable[[str, int], None]],
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Send an attempt and read its completion, streamed or not.
+
+        Args:
+            endpoint (load_balancer.Endpoint): The endpoint the attempt is sent to.
+            kwargs (Dict[str, Any]): The keyword arguments passed to the chat completion API.
+            start (float): The monotonic time the attempt was sent.
+            attempt (int): The number of the attempt.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+            on_delta (Optional[Callable[[str, int], None]]): In streaming mode, the callback receiving the content of the stream.
+
+        Returns:
+            Tuple[Any, Dict[str, Any]]: The raw response, holding the headers, and the completion.
+
+        """
+        client = endpoint.get_async_client()
+        raw_response = await client.chat.completions.with_raw_response.create(**kwargs)
+        response = raw_response.parse()
+        if self.stream:
+            accumulator = self.get_stream_accumulator(start, attempt, on_delta)
+            async for chunk in response:
+                accumulator.add(to_dict(chunk))
+            return raw_response, self.finish_stream(accumulator, stats)
+        return raw_response, to_dict(response)
+
+    async def aquery_gpt(
+        self,
+        prompt: List[Any],
+        *,
+        stats: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        on_delta: Optional[Callable[[str, int], None]] = None,
+    ):
+        """
+        Asynchronously generate a response from the GPT-3 engine based on the provided prompt.
+
+        Responses found in the response cache are returned without sending a request. Every attempt is routed to an endpoint by the load balancer. Failed attempts are retried according to the retry policy. max_tokens is sized to the context window by the token budget, which may also truncate or reject the prompt. The time the request took, retries included, is added to `stats`, and in streaming mode the time to first token and the generation speed too. With n larger than 1 in the GPT parameters, the completion holds n choices, generated by a single request, or by n parallel requests if `parallel_n` is set. With hedging, a duplicate of a request still in flight after the hedging delay is sent, and the first completion is kept.
+
+        Args:
+            prompt (List[Any]): An instance of Prompts containing the conversation prompt and messages.
+            stats (Optional[Dict[str, Any]]): A dictionary filled with statistics of the request, such as the number of attempts.
+            use_cache (bool): Whether to look up and store the response in the response cache.
+            on_delta (Optional[Callable[[str, int], None]]): In streaming mode, called with every piece of content as it arrives and the number of the attempt it belongs to, so that the content of failed attempts can be discarded. Raising from it aborts the attempt.
+
+        Returns:
+            dict: A dictionary containing the response generated by the GPT-3 engine. Streamed completions are rebuilt into the same layout.
+
+        """
+        request_start = time.monotonic()
+        cache_key, cached_response = self.get_cached_response(prompt, stats, use_cache)
+        if cached_response is not None:
+            return cached_response
+        if self.gpt_params.n > 1 and self.gpt_params.parallel_n:
+            response = await self.arequest_duplicates(prompt, stats, on_delta)
+        elif self.hedges(on_delta):
+            response = await self.arequest_hedged(prompt, stats)
+        else:
+            response = await self.arequest_gpt(prompt, stats, on_delta)
+        return self.finish_query(response, stats, cache_key, request_start)
+
+    async def arequest_gpt(
+        self,
+        prompt: List[Any],
+        stats: Optional[Dict[str, Any]],
+        on_delta: Optional[Callable[[str, int], None]],
+        *,
+        avoid: Optional[load_balancer.Endpoint] = None,
+    ) -> Dict[str, Any]:
+        """
+        Asynchronously send a request, bypassing the cache, and retry its failed attempts.
+
+        Args:
+            prompt (List[Any]): The conversation messages to send.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+            on_delta (Optional[Callable[[str, int], None]]): In streaming mode, called with every piece of content of the first choice and the number of its attempt.
+            avoid (Optional[load_balancer.Endpoint], optional): An endpoint to route around while another one has capacity. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: The completion.
+
+        """
+        prompt, max_tokens, num_tokens = self.plan_request(prompt, stats)
+        attempt = 0
+        while True:
+            attempt += 1
+            wait_start = time.monotonic()
+            endpoint = await self.load_balancer.aacquire(avoid)
+            self.record_attempt(attempt, endpoint, stats)
+            failed = False
+            try:
+                await endpoint.rate_limiter.aacquire(num_tokens)
+                start = time.monotonic()
+                self.metrics.observe("limiter", start - wait_start)
+                timeout = self.get_attempt_timeout(endpoint)
+                try:
+                    raw_response, response = await asyncio.wait_for(
+                        self.asend(
+                            endpoint,
+                            self.get_attempt_kwargs(
+                                prompt, endpoint, max_tokens, timeout
+                            ),
+                            start,
+                            attempt,
+                            stats,
+                            on_delta,
+                        ),
+                        timeout,
+                    )
+                except asyncio.TimeoutError:
+                    raise RequestTimeoutError(
+                        f"Request timed out after {timeout:.1f} seconds"
+                    )
+                self.metrics.observe("network", time.monotonic() - start)
+                break
+            except RunCancelledError:
+                raise
+            except Exception as e:
+                failed = self.is_endpoint_failure(e)
+                delay = self.handle_error(e, attempt, stats, endpoint)
+            finally:
+                self.load_balancer.release(endpoint, failed=failed)
+            self.cancellation.check(delay)
+            await asyncio.sleep(delay)
+        return self.finish_request(endpoint, raw_response, response)
+
+    async def arequest_duplicates(
+        self,
+        prompt: List[Any],
+        stats: Optional[Dict[str, Any]],
+        on_delta: Optional[Callable[[str, int], None]],
+    ) -> Dict[str, Any]:
+        """
+        Asynchronously send n concurrent requests of one completion each, for backends that do not support n, and merge their completions.
+
+        Args:
+            prompt (List[Any]): The conversation messages to send.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected, merged from the ones of the duplicate requests.
+            on_delta (Optional[Callable[[str, int], None]]): In streaming mode, called with the content of the first duplicate request.
+
+        Returns:
+            Dict[str, Any]: The completion holding the choices of every duplicate request that succeeded.
+
+        Raises:
+            Exception: The error of the first duplicate request if all of them failed.
+
+        """
+        duplicate_stats = [{} for _ in range(self.gpt_params.n)]
+        outcomes = await asyncio.gather(
+            *(
+                self.arequest_gpt(
+                    prompt, duplicate_stats[index], on_delta if index == 0 else None
+                )
+                for index in range(self.gpt_params.n)
+            ),
+            return_exceptions=True,
+        )
+        merge_duplicate_stats(stats, duplicate_stats)
+        return get_duplicate_result(list(outcomes))
+
+    async def arequest_hedged(
+        self, prompt: List[Any], stats: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Asynchronously send a request, and a duplicate of it if it is still in flight after the hedging delay, keeping the first completion.
+
+        The one that loses is cancelled, closing its connection.
+
+        Args:
+            prompt (List[Any]): The conversation messages to send.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, if collected.
+
+        Returns:
+            Dict[str, Any]: The completion of the request or of its duplicate, whichever succeeded first.
+
+        Raises:
+            Exception: The error of the request if neither it nor its duplicate succeeded.
+
+        """
+        start = time.monotonic()
+        delay = self.hedger.get_delay()
+        if delay is None:
+            response = await self.arequest_gpt(prompt, stats, None)
+            self.hedger.observe(time.monotonic() - start)
+            return response
+        hedge_stats = [{}, {}]
+        tasks = [asyncio.ensure_future(self.arequest_gpt(prompt, hedge_stats[0], None))]
+        outcomes = []
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self.hedger.try_hedge():
+                avoid = self.get_hedge_avoid(hedge_stats[0])
+                tasks.append(
+                    asyncio.ensure_future(
+                        self.arequest_gpt(prompt, hedge_stats[1], None, avoid=avoid)
+                    )
+                )
+            pending = set(tasks)
+            while pending and all(
+                isinstance(outcome, BaseException) for _, outcome in outcomes
+            ):
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for index, task in enumerate(tasks):
+                    if task in done:
+                        error = task.exception()
+                        outcomes.append((index, error if error else task.result()))
+        finally:
+            for task in tasks:
+                task.cancel()
+        return self.finish_hedge(outcomes, hedge_stats, stats, start, len(tasks) > 1)
@@ -19,6 +19,8 @@ class GPTParamsSettings(Settings):
         frequency_penalty (float): The frequency penalty applied to encourage diversity.
         presence_penalty (float): The presence penalty applied to discourage repetition.
         stop (Optional[List[str]]): A list of custom tokens to stop generation on.
+        n (int): The number of completions generated per request, whose QA pairs are merged.
+        parallel_n (bool): Whether to send n parallel requests of one completion each instead of one request of n completions, for backends that do not support n.
 
     Methods:
         __init__: Initialize the GPTParamsSettings instance with specified GPT parameters.
@@ -37,6 +39,8 @@ class GPTParamsSettings(Settings):
         frequency_penalty: float = 0,
         presence_penalty: float = 0,
         stop: Optional[List[str]] = None,
+        n: int = 1,
+        parallel_n: bool = False,
     ):
         """
         Initialize the GPTParamsSettings instance with specified GPT parameters.
@@ -48,13 +52,22 @@ class GPTParamsSettings(Settings):
             frequency_penalty (float): The frequency penalty applied to encourage diversity.
             presence_penalty (float): The presence penalty applied to discourage repetition.
             stop (Optional[List[str]]): A list of custom tokens to stop generation on.
+            n (int): The number of completions generated per request, whose QA pairs are merged.
+            parallel_n (bool): Whether to send n parallel requests of one completion each instead of one request of n completions.
+
+        Raises:
+            ValueError: If n is smaller than 1.
         """
+        if n < 1:
+            raise ValueError("n must be at least 1")
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.top_p = top_p
         self.frequency_penalty = frequency_penalty
         self.presence_penalty = presence_penalty
         self.stop = stop
+        self.n = n
+        self.parallel_n = parallel_n
 
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -63,7 +76,7 @@ class GPTParamsSettings(Settings):
         Returns:
             dict: A dictionary containing GPT parameters.
         """
-        return {
+        params = {
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
             "top_p": self.top_p,
@@ -71,6 +84,11 @@ class GPTParamsSettings(Settings):
             "presence_penalty": self.presence_penalty,
             "stop": self.stop,
         }
+        # Left out by default, so that the fingerprints of cached responses stay valid.
+        if self.n != 1:
+            params["n"] = self.n
+            params["parallel_n"] = self.parallel_n
+        return params
 
 
 def read_yaml(yaml_path: str) -> GPTParamsSettings:
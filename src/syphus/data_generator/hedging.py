@@ -0,0 +1,165 @@
+import threading
+
+import syphus.utils.yaml as yaml
+
+from syphus.data_generator.metrics import StageStats
+from syphus.utils.settings import Settings
+from typing import Optional, Dict, Any
+
+# The number of latencies observed between two computations of the hedging delay, which sorts the sample.
+DELAY_REFRESH_INTERVAL = 16
+
+
+class HedgeSettings(Settings):
+    """
+    Represents when a duplicate of a slow request is sent, to cut the tail latency of a run.
+
+    Attributes:
+        enabled (bool): Whether slow requests are hedged.
+        percentile (float): A duplicate is sent once a request has taken longer than this percentile of the latencies observed so far.
+        max_fraction (float): The largest fraction of requests that may be hedged.
+        min_samples (int): The number of latencies observed before any request is hedged.
+        min_delay (float): The shortest time in seconds a request is given before it is hedged.
+        other_endpoint (bool): Whether the duplicate is routed to another endpoint than the request, when one has capacity.
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled: bool = False,
+        percentile: float = 0.95,
+        max_fraction: float = 0.05,
+        min_samples: int = 20,
+        min_delay: float = 1.0,
+        other_endpoint: bool = True,
+    ):
+        """
+        Initialize the HedgeSettings instance.
+
+        Args:
+            enabled (bool): Whether slow requests are hedged. Defaults to False.
+            percentile (float): The percentile of the observed latencies after which a duplicate is sent. Defaults to 0.95.
+            max_fraction (float): The largest fraction of requests that may be hedged. Defaults to 0.05.
+            min_samples (int): The number of latencies observed before any request is hedged. Defaults to 20.
+            min_delay (float): The shortest time in seconds a request is given before it is hedged. Defaults to 1.
+            other_endpoint (bool): Whether the duplicate is routed to another endpoint when one has capacity. Defaults to True.
+
+        Raises:
+            ValueError: If percentile is not between 0 and 1, max_fraction is not between 0 and 1, or min_samples or min_delay is negative.
+        """
+        if not 0 < percentile < 1:
+            raise ValueError("percentile must be between 0 and 1")
+        if not 0 <= max_fraction <= 1:
+            raise ValueError("max_fraction must be between 0 and 1")
+        if min_samples < 0 or min_delay < 0:
+            raise ValueError("min_samples and min_delay must be non-negative")
+        self.enabled = enabled
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.other_endpoint = other_endpoint
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the HedgeSettings instance to a dictionary representation.
+
+        Returns:
+            dict: A dictionary containing the hedging settings.
+        """
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "max_fraction": self.max_fraction,
+            "min_samples": self.min_samples,
+            "min_delay": self.min_delay,
+            "other_endpoint": self.other_endpoint,
+        }
+
+
+def read_yaml(yaml_path: str) -> HedgeSettings:
+    """
+    Read hedging settings from the optional `Hedging` section of a YAML file.
+
+    Args:
+        yaml_path (str): The path to the YAML file containing the settings.
+
+    Returns:
+        HedgeSettings: The settings from the YAML file, or settings without hedging if the section is missing.
+    """
+    hedge_settings_dict = yaml.load(yaml_path).get("Hedging") or {}
+    return HedgeSettings(**hedge_settings_dict)
+
+
+class Hedger(object):
+    """
+    Decides when a duplicate of a request in flight is sent, from the latencies of the requests that completed.
+
+    A request still in flight after the `percentile` of the observed latencies, and at least `min_delay` seconds, gets a duplicate, unless `max_fraction` of the requests were already hedged. The first of the two to succeed is kept. From asyncio the other is cancelled, while from threads it is abandoned: it stops before its next attempt or stream chunk, but an attempt already waiting for a non streamed completion runs to the end, holding its endpoint slot and rate limit tokens. No request is hedged until `min_samples` latencies were observed.
+
+    All methods are thread safe.
+
+    Attributes:
+        settings (HedgeSettings): The hedging settings.
+        latencies (StageStats): The latencies of the requests that completed.
+        requests (int): The number of requests that could be hedged.
+        hedged (int): The number of requests hedged.
+    """
+
+    def __init__(self, settings: HedgeSettings):
+        """
+        Initialize the Hedger instance.
+
+        Args:
+            settings (HedgeSettings): The hedging settings.
+        """
+        self.settings = settings
+        self.latencies = StageStats()
+        self.requests = 0
+        self.hedged = 0
+        self.delay: Optional[float] = None
+        self.delay_count = 0
+        self.lock = threading.Lock()
+
+    def get_delay(self) -> Optional[float]:
+        """
+        Count a new request and get how long it may take before it is hedged.
+
+        Returns:
+            Optional[float]: The delay in seconds, or None if too few latencies were observed to hedge it.
+        """
+        with self.lock:
+            self.requests += 1
+            count = self.latencies.count
+            if count < max(1, self.settings.min_samples):
+                return None
+            if self.delay is None or count - self.delay_count >= DELAY_REFRESH_INTERVAL:
+                self.delay = max(
+                    self.settings.min_delay,
+                    self.latencies.quantile(self.settings.percentile),
+                )
+                self.delay_count = count
+            return self.delay
+
+    def observe(self, seconds: float):
+        """
+        Record the latency of a request that succeeded.
+
+        Args:
+            seconds (float): The time from the first attempt to the first completion, duplicate included.
+        """
+        with self.lock:
+            self.latencies.observe(seconds)
+
+    def try_hedge(self) -> bool:
+        """
+        Count a hedged request, unless it would hedge more than `max_fraction` of the requests.
+
+        Returns:
+            bool: Whether the duplicate may be sent.
+        """
+        with self.lock:
+            if self.hedged + 1 > self.settings.max_fraction * self.requests:
+                return False
+            self.hedged += 1
+            return True
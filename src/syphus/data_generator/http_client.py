@@ -0,0 +1,173 @@
+import httpx
+import openai
+
+import syphus.utils.yaml as yaml
+
+from syphus.utils.settings import Settings
+from typing import Optional, Dict, Any
+
+
+class HTTPSettings(Settings):
+    """
+    Represents the connection pool and timeouts of the HTTP clients talking to the endpoints.
+
+    Every endpoint owns one persistent client per GPTManager, so connections, and the TLS sessions established on them, are kept alive and reused by all workers instead of being renegotiated.
+
+    Attributes:
+        max_connections (Optional[int]): The maximum number of connections per endpoint. None to match the number of workers of the run.
+        max_keepalive_connections (Optional[int]): The maximum number of idle connections kept alive per endpoint. None to keep as many as max_connections.
+        keepalive_expiry (float): The number of seconds an idle connection is kept alive.
+        connect_timeout (float): The number of seconds to wait for a connection to be established.
+        read_timeout (float): The number of seconds to wait for the next chunk of a response.
+        write_timeout (float): The number of seconds to wait for a request to be sent.
+        pool_timeout (float): The number of seconds to wait for a free connection of the pool.
+        request_timeout (Optional[float]): The number of seconds an attempt may take in total, streaming included. None for no limit beyond the other timeouts.
+        http2 (bool): Whether to use HTTP/2, which requires the `h2` package.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: float = 60.0,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 600.0,
+        write_timeout: float = 60.0,
+        pool_timeout: float = 60.0,
+        request_timeout: Optional[float] = None,
+        http2: bool = False,
+    ):
+        """
+        Initialize the HTTPSettings instance.
+
+        Args:
+            max_connections (Optional[int]): The maximum number of connections per endpoint. None to match the number of workers of the run.
+            max_keepalive_connections (Optional[int]): The maximum number of idle connections kept alive per endpoint. None to keep as many as max_connections.
+            keepalive_expiry (float): The number of seconds an idle connection is kept alive.
+            connect_timeout (float): The number of seconds to wait for a connection to be established.
+            read_timeout (float): The number of seconds to wait for the next chunk of a response.
+            write_timeout (float): The number of seconds to wait for a request to be sent.
+            pool_timeout (float): The number of seconds to wait for a free connection of the pool.
+            request_timeout (Optional[float]): The number of seconds an attempt may take in total. None for no limit beyond the other timeouts.
+            http2 (bool): Whether to use HTTP/2.
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.pool_timeout = pool_timeout
+        self.request_timeout = request_timeout
+        self.http2 = http2
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the HTTPSettings instance to a dictionary representation.
+
+        Returns:
+            dict: A dictionary containing the HTTP settings.
+        """
+        return {
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "connect_timeout": self.connect_timeout,
+            "read_timeout": self.read_timeout,
+            "write_timeout": self.write_timeout,
+            "pool_timeout": self.pool_timeout,
+            "request_timeout": self.request_timeout,
+            "http2": self.http2,
+        }
+
+    def get_timeout(self, limit: Optional[float] = None) -> openai.Timeout:
+        """
+        Build the timeouts of a client or of a single request.
+
+        Args:
+            limit (Optional[float]): If given, no timeout is longer than this, e.g. the time left for an attempt.
+
+        Returns:
+            openai.Timeout: The connect, read, write and pool timeouts.
+        """
+
+        def cap(timeout: float) -> float:
+            return timeout if limit is None else max(0.0, min(timeout, limit))
+
+        return openai.Timeout(
+            connect=cap(self.connect_timeout),
+            read=cap(self.read_timeout),
+            write=cap(self.write_timeout),
+            pool=cap(self.pool_timeout),
+        )
+
+    def get_limits(self, pool_size: int) -> httpx.Limits:
+        """
+        Build the connection limits of a client.
+
+        Args:
+            pool_size (int): The number of connections to use if max_connections is not set.
+
+        Returns:
+            httpx.Limits: The connection limits.
+        """
+        max_connections = self.max_connections or pool_size
+        max_keepalive_connections = self.max_keepalive_connections or max_connections
+        return httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+def read_yaml(yaml_path: str) -> HTTPSettings:
+    """
+    Read HTTP settings from the optional `HTTP` section of a YAML file.
+
+    Args:
+        yaml_path (str): The path to the YAML file containing the settings.
+
+    Returns:
+        HTTPSettings: The settings from the YAML file, or the default settings if the section is missing.
+    """
+    http_settings_dict = yaml.load(yaml_path).get("HTTP") or {}
+    return HTTPSettings(**http_settings_dict)
+
+
+def create_http_client(settings: HTTPSettings, pool_size: int) -> httpx.Client:
+    """
+    Create a pooled HTTP client for the thread based query engine.
+
+    Args:
+        settings (HTTPSettings): The HTTP settings.
+        pool_size (int): The number of connections to use if max_connections is not set.
+
+    Returns:
+        httpx.Client: The HTTP client.
+    """
+    return openai.DefaultHttpxClient(
+        limits=settings.get_limits(pool_size),
+        timeout=settings.get_timeout(),
+        http2=settings.http2,
+    )
+
+
+def create_async_http_client(
+    settings: HTTPSettings, pool_size: int
+) -> httpx.AsyncClient:
+    """
+    Create a pooled HTTP client for the asyncio based query engine.
+
+    Args:
+        settings (HTTPSettings): The HTTP settings.
+        pool_size (int): The number of connections to use if max_connections is not set.
+
+    Returns:
+        httpx.AsyncClient: The HTTP client.
+    """
+    return openai.DefaultAsyncHttpxClient(
+        limits=settings.get_limits(pool_size),
+        timeout=settings.get_timeout(),
+        http2=settings.http2,
+    )
@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import threading
+import time
+
+from typing import Dict
+
+from syphus.data_generator.response import Response
+
+JOURNAL_FILE_NAME = "journal.jsonl"
+
+
+class Journal(object):
+    """
+    An append-only journal of completed responses, written to the output folder while a query runs.
+
+    Every completed response is appended as one JSON line and flushed immediately, so a run that dies halfway can be resumed from the journal instead of being restarted. The file is additionally fsynced at most once every `fsync_interval` seconds to survive machine crashes.
+
+    Attributes:
+        path (str): The path of the journal file.
+        fsync_interval (float): The minimum number of seconds between two fsyncs.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        file_name: str = JOURNAL_FILE_NAME,
+        fsync_interval: float = 1.0,
+    ):
+        """
+        Open the journal in `path` for appending, creating the folder if necessary.
+
+        Args:
+            path (str): The output folder of the run.
+            file_name (str, optional): The file name of the journal. Defaults to "journal.jsonl".
+            fsync_interval (float, optional): The minimum number of seconds between two fsyncs. Defaults to 1.
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = os.path.join(path, file_name)
+        self.fsync_interval = fsync_interval
+        self.file = open(self.path, "a")
+        if self.file.tell() > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # Terminate a line truncated by a crash, so that it does not swallow the next record.
+                    self.file.write("\n")
+        self.last_fsync = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, id: str, response: Response):
+        """
+        Append a completed response to the journal.
+
+        Args:
+            id (str): The ID of the info.
+            response (Response): The response of the info.
+        """
+        line = json.dumps({"id": id, "response": response.to_dict()}) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            now = time.monotonic()
+            if now - self.last_fsync >= self.fsync_interval:
+                os.fsync(self.file.fileno())
+                self.last_fsync = now
+
+    def close(self):
+        """
+        Flush, fsync and close the journal.
+        """
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load(path: str, *, file_name: str = JOURNAL_FILE_NAME) -> Dict[str, Response]:
+    """
+    Load the completed responses recorded in the journal of an output folder.
+
+    A truncated last line, left behind by a crash in the middle of a write, is ignored.
+
+    Args:
+        path (str): The output folder of the run.
+        file_name (str, optional): The file name of the journal. Defaults to "journal.jsonl".
+
+    Returns:
+        Dict[str, Response]: A dictionary mapping info IDs to their recorded responses, empty if there is no journal.
+    """
+    journal_path = os.path.join(path, file_name)
+    responses = {}
+    if not os.path.exists(journal_path):
+        return responses
+    with open(journal_path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                print(
+                    f"Ignoring corrupted line {line_number} of {journal_path}",
+                    file=sys.stderr,
+                )
+                continue
+            responses[entry["id"]] = Response(data=entry["response"])
+    return responses
@@ -0,0 +1,484 @@
+import asyncio
+import openai
+import random
+import threading
+import time
+
+import syphus.utils.yaml as yaml
+
+from collections import Counter
+from syphus.data_generator.http_client import (
+    HTTPSettings,
+    create_http_client,
+    create_async_http_client,
+)
+from syphus.data_generator.openai_settings import OpenAISettings
+from syphus.data_generator.rate_limiter import RateLimiter, RateLimitSettings
+from syphus.utils.settings import Settings
+from typing import Optional, List, Dict, Any
+
+STRATEGIES = ("least_loaded", "weighted")
+
+AZURE_API_TYPES = ("azure", "azure_ad", "azuread")
+
+DEFAULT_POOL_SIZE = 100
+
+
+class LoadBalancerSettings(Settings):
+    """
+    Represents how requests are distributed over several OpenAI endpoints.
+
+    Attributes:
+        strategy (str): "least_loaded" to route each request to the endpoint with the fewest requests in flight relative to its weight, idle endpoints taking turns, or "weighted" to pick endpoints at random in proportion to their weight.
+        failure_threshold (int): The number of consecutive failures after which an endpoint is considered unhealthy.
+        cooldown (float): The number of seconds an unhealthy endpoint is avoided before it is tried again.
+    """
+
+    def __init__(
+        self,
+        *,
+        strategy: str = "least_loaded",
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+    ):
+        """
+        Initialize the LoadBalancerSettings instance.
+
+        Args:
+            strategy (str): "least_loaded" or "weighted".
+            failure_threshold (int): The number of consecutive failures after which an endpoint is considered unhealthy.
+            cooldown (float): The number of seconds an unhealthy endpoint is avoided.
+
+        Raises:
+            ValueError: If the strategy is unknown.
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(
+                f"Unknown load balancing strategy {strategy}, expected one of {STRATEGIES}"
+            )
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the LoadBalancerSettings instance to a dictionary representation.
+
+        Returns:
+            dict: A dictionary containing the load balancer settings.
+        """
+        return {
+            "strategy": self.strategy,
+            "failure_threshold": self.failure_threshold,
+            "cooldown": self.cooldown,
+        }
+
+
+def read_yaml(yaml_path: str) -> LoadBalancerSettings:
+    """
+    Read load balancer settings from the optional `Load_balancer` section of a YAML file.
+
+    Args:
+        yaml_path (str): The path to the YAML file containing the settings.
+
+    Returns:
+        LoadBalancerSettings: The settings from the YAML file, or the default settings if the section is missing.
+    """
+    load_balancer_settings_dict = yaml.load(yaml_path).get("Load_balancer") or {}
+    return LoadBalancerSettings(**load_balancer_settings_dict)
+
+
+async def close_async_client(client: openai.AsyncOpenAI):
+    """
+    Close an async client and its connection pool.
+
+    Args:
+        client (openai.AsyncOpenAI): The client.
+    """
+    await client.close()
+
+
+class Endpoint(object):
+    """
+    An OpenAI deployment requests can be routed to, with its own client, quotas and health.
+
+    The OpenAI clients of the endpoint are created on first use and then reused, so that their connection pool is shared by every request. Retries are left to the retry policy of the GPTManager, the clients never retry on their own.
+
+    Attributes:
+        settings (OpenAISettings): The settings of the endpoint.
+        name (str): The name of the endpoint in statistics and summaries, unique within its LoadBalancer.
+        http_settings (HTTPSettings): The connection pool and timeouts of the clients.
+        pool_size (int): The number of connections of the pool, unless set by http_settings.
+        rate_limiter (RateLimiter): The limiter enforcing the quotas of the endpoint.
+        in_flight (int): The number of requests currently sent to the endpoint.
+        consecutive_failures (int): The number of failures since the last success.
+        unhealthy_until (float): The monotonic time until which the endpoint is avoided.
+        requests (int): The total number of requests sent to the endpoint.
+        failures (int): The total number of failed requests.
+    """
+
+    def __init__(
+        self,
+        settings: OpenAISettings,
+        rate_limit: Optional[RateLimitSettings] = None,
+        http_settings: Optional[HTTPSettings] = None,
+    ):
+        """
+        Initialize the Endpoint instance.
+
+        Args:
+            settings (OpenAISettings): The settings of the endpoint.
+            rate_limit (Optional[RateLimitSettings]): The quotas of the endpoint. Defaults to no limit.
+            http_settings (Optional[HTTPSettings]): The connection pool and timeouts of the clients. Defaults to HTTPSettings().
+        """
+        self.settings = settings
+        self.name = f"{settings.engine}@{settings.base}"
+        self.http_settings = http_settings if http_settings else HTTPSettings()
+        self.pool_size = DEFAULT_POOL_SIZE
+        self.client = None
+        self.async_client = None
+        self.async_client_loop = None
+        self.client_lock = threading.Lock()
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def load(self) -> float:
+        return self.in_flight / self.settings.weight
+
+    def has_capacity(self) -> bool:
+        """
+        Check whether another request may be sent to the endpoint.
+
+        Returns:
+            bool: False if the endpoint already has max_concurrency requests in flight.
+        """
+        return (
+            self.settings.max_concurrency is None
+            or self.in_flight < self.settings.max_concurrency
+        )
+
+    def is_healthy(self, now: float) -> bool:
+        """
+        Check whether the endpoint is out of its cooldown.
+
+        Args:
+            now (float): The current monotonic time.
+
+        Returns:
+            bool: True if the endpoint is healthy.
+        """
+        return now >= self.unhealthy_until
+
+    def get_request_kwargs(self) -> Dict[str, Any]:
+        """
+        Build the model keyword arguments of a request sent to the endpoint.
+
+        Returns:
+            Dict[str, Any]: The keyword arguments passed to the chat completion API. For Azure endpoints, the engine is the name of the deployment.
+        """
+        return {"model": self.settings.engine}
+
+    def get_client_kwargs(self) -> Dict[str, Any]:
+        """
+        Build the keyword arguments of the OpenAI clients of the endpoint.
+
+        Returns:
+            Dict[str, Any]: The credentials and base URL of the endpoint.
+        """
+        kwargs = {"max_retries": 0}
+        if self.settings.type in AZURE_API_TYPES:
+            if self.settings.type == "azure":
+                kwargs["api_key"] = self.settings.key
+            else:
+                kwargs["azure_ad_token"] = self.settings.key
+            kwargs["azure_endpoint"] = self.settings.base
+            kwargs["api_version"] = self.settings.version
+        else:
+            kwargs["api_key"] = self.settings.key
+            kwargs["base_url"] = self.settings.base
+        return kwargs
+
+    def get_client(self) -> openai.OpenAI:
+        """
+        Get the client of the endpoint for the thread based query engine, creating it on first use.
+
+        Returns:
+            openai.OpenAI: The client, an AzureOpenAI client for Azure endpoints.
+        """
+        with self.client_lock:
+            if self.client is None:
+                client_class = (
+                    openai.AzureOpenAI
+                    if self.settings.type in AZURE_API_TYPES
+                    else openai.OpenAI
+                )
+                self.client = client_class(
+                    **self.get_client_kwargs(),
+                    http_client=create_http_client(self.http_settings, self.pool_size),
+                )
+            return self.client
+
+    def get_async_client(self) -> openai.AsyncOpenAI:
+        """
+        Get the client of the endpoint for the asyncio based query engine, creating it on first use.
+
+        Connections cannot be shared across event loops, so a new client is created whenever the running event loop changes, and the previous one is closed on its own loop.
+
+        Returns:
+            openai.AsyncOpenAI: The client, an AsyncAzureOpenAI client for Azure endpoints.
+        """
+        loop = asyncio.get_running_loop()
+        with self.client_lock:
+            if self.async_client is None or self.async_client_loop is not loop:
+                self.retire_async_client()
+                client_class = (
+                    openai.AsyncAzureOpenAI
+                    if self.settings.type in AZURE_API_TYPES
+                    else openai.AsyncOpenAI
+                )
+                self.async_client = client_class(
+                    **self.get_client_kwargs(),
+                    http_client=create_async_http_client(
+                        self.http_settings, self.pool_size
+                    ),
+                )
+                self.async_client_loop = loop
+            return self.async_client
+
+    def retire_async_client(self):
+        """
+        Forget the async client, closing it on its event loop once the loop runs. Must be called with the client lock held.
+
+        A client whose event loop is already closed cannot be closed cleanly any more and is only dropped.
+        """
+        client, loop = self.async_client, self.async_client_loop
+        self.async_client = None
+        self.async_client_loop = None
+        if client is None or loop.is_closed():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(close_async_client(client), loop)
+        except RuntimeError:
+            # The loop closed in the meantime.
+            pass
+
+    async def aclose(self):
+        """
+        Close the async client if it belongs to the running event loop, e.g. at the end of an asyncio run.
+        """
+        loop = asyncio.get_running_loop()
+        with self.client_lock:
+            if self.async_client is None or self.async_client_loop is not loop:
+                return
+            client = self.async_client
+            self.async_client = None
+            self.async_client_loop = None
+        await close_async_client(client)
+
+    def set_pool_size(self, pool_size: int):
+        """
+        Size the connection pool of the clients, recreating them if they already exist with another size.
+
+        The previous sync client is only replaced, so that the threads still using it finish their requests, and its connections are released once it is no longer referenced. The previous async client is closed on its event loop.
+
+        Args:
+            pool_size (int): The number of connections, capped by the concurrency limit of the endpoint.
+        """
+        if self.settings.max_concurrency is not None:
+            pool_size = min(pool_size, self.settings.max_concurrency)
+        with self.client_lock:
+            if pool_size == self.pool_size:
+                return
+            self.pool_size = pool_size
+            self.client = None
+            self.retire_async_client()
+
+
+class LoadBalancer(object):
+    """
+    A thread-safe router distributing requests over several endpoints.
+
+    Endpoints failing `failure_threshold` times in a row are avoided for `cooldown` seconds, unless every endpoint is unhealthy. Endpoints at their concurrency cap are skipped; if every usable endpoint is at its cap, callers wait until a request completes.
+
+    Attributes:
+        endpoints (List[Endpoint]): The endpoints requests are routed to.
+        settings (LoadBalancerSettings): The routing settings.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[OpenAISettings],
+        settings: Optional[LoadBalancerSettings] = None,
+        *,
+        rate_limit: Optional[RateLimitSettings] = None,
+        http_settings: Optional[HTTPSettings] = None,
+        poll_interval: float = 0.05,
+    ):
+        """
+        Initialize the LoadBalancer instance.
+
+        Args:
+            endpoints (List[OpenAISettings]): The settings of every endpoint.
+            settings (Optional[LoadBalancerSettings]): The routing settings. Defaults to least loaded routing.
+            rate_limit (Optional[RateLimitSettings]): The quotas applied to each endpoint. Defaults to no limit.
+            http_settings (Optional[HTTPSettings]): The connection pool and timeouts of the clients of each endpoint.
+            poll_interval (float): The maximum number of seconds between two routing attempts while waiting for an endpoint.
+
+        Raises:
+            ValueError: If no endpoint is given.
+        """
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.endpoints = [
+            Endpoint(endpoint, rate_limit, http_settings) for endpoint in endpoints
+        ]
+        # Several keys of one deployment share their engine and base, so they are told apart by their position.
+        counts = Counter(endpoint.name for endpoint in self.endpoints)
+        for index, endpoint in enumerate(self.endpoints):
+            if counts[endpoint.name] > 1:
+                endpoint.name = f"{endpoint.name}#{index}"
+        self.settings = settings if settings else LoadBalancerSettings()
+        self.poll_interval = poll_interval
+        self.condition = threading.Condition()
+
+    def set_pool_size(self, pool_size: int):
+        """
+        Size the connection pool of every endpoint, usually to the number of workers of a run.
+
+        Args:
+            pool_size (int): The number of connections per endpoint.
+        """
+        for endpoint in self.endpoints:
+            endpoint.set_pool_size(pool_size)
+
+    def select(
+        self, now: float, avoid: Optional[Endpoint] = None
+    ) -> Optional[Endpoint]:
+        """
+        Choose the endpoint of the next request, without reserving it. Must be called with the condition held.
+
+        Args:
+            now (float): The current monotonic time.
+            avoid (Optional[Endpoint]): An endpoint to route around while another one has capacity, e.g. the one a hedged request is slow on.
+
+        Returns:
+            Optional[Endpoint]: The chosen endpoint, or None if every usable endpoint is at its concurrency cap.
+        """
+        candidates = [
+            endpoint for endpoint in self.endpoints if endpoint.is_healthy(now)
+        ] or self.endpoints
+        candidates = [endpoint for endpoint in candidates if endpoint.has_capacity()]
+        if not candidates:
+            return None
+        if avoid is not None:
+            candidates = [
+                endpoint for endpoint in candidates if endpoint is not avoid
+            ] or candidates
+        if self.settings.strategy == "weighted":
+            return random.choices(
+                candidates,
+                weights=[endpoint.settings.weight for endpoint in candidates],
+            )[0]
+        # Ties, such as idle endpoints, are broken by the weighted number of requests sent so far.
+        return min(
+            candidates,
+            key=lambda endpoint: (
+                endpoint.load,
+                endpoint.requests / endpoint.settings.weight,
+            ),
+        )
+
+    def try_acquire(self, avoid: Optional[Endpoint] = None) -> Optional[Endpoint]:
+        """
+        Reserve a slot on the endpoint chosen for the next request, if any is available.
+
+        Args:
+            avoid (Optional[Endpoint]): An endpoint to route around while another one has capacity.
+
+        Returns:
+            Optional[Endpoint]: The reserved endpoint, or None if every usable endpoint is at its concurrency cap.
+        """
+        with self.condition:
+            endpoint = self.select(time.monotonic(), avoid)
+            if endpoint is not None:
+                endpoint.in_flight += 1
+                endpoint.requests += 1
+            return endpoint
+
+    def acquire(self, avoid: Optional[Endpoint] = None) -> Endpoint:
+        """
+        Block the current thread until a slot on an endpoint is reserved.
+
+        Args:
+            avoid (Optional[Endpoint]): An endpoint to route around while another one has capacity.
+
+        Returns:
+            Endpoint: The reserved endpoint, to be passed to `release` once the request completes.
+        """
+        with self.condition:
+            while True:
+                endpoint = self.try_acquire(avoid)
+                if endpoint is not None:
+                    return endpoint
+                self.condition.wait(self.poll_interval)
+
+    async def aacquire(self, avoid: Optional[Endpoint] = None) -> Endpoint:
+        """
+        Wait, without blocking the event loop, until a slot on an endpoint is reserved.
+
+        Args:
+            avoid (Optional[Endpoint]): An endpoint to route around while another one has capacity.
+
+        Returns:
+            Endpoint: The reserved endpoint, to be passed to `release` once the request completes.
+        """
+        while True:
+            endpoint = self.try_acquire(avoid)
+            if endpoint is not None:
+                return endpoint
+            await asyncio.sleep(self.poll_interval)
+
+    def release(self, endpoint: Endpoint, *, failed: bool = False):
+        """
+        Release the slot reserved on an endpoint and record the outcome of the request.
+
+        Args:
+            endpoint (Endpoint): The endpoint returned by `acquire`.
+            failed (bool): Whether the request failed because of the endpoint.
+        """
+        with self.condition:
+            endpoint.in_flight -= 1
+            if failed:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.settings.failure_threshold:
+                    endpoint.unhealthy_until = time.monotonic() + self.settings.cooldown
+            else:
+                endpoint.consecutive_failures = 0
+                endpoint.unhealthy_until = 0.0
+            self.condition.notify_all()
+
+    async def aclose(self):
+        """
+        Close the async clients of every endpoint created on the running event loop, e.g. at the end of an asyncio run.
+        """
+        for endpoint in self.endpoints:
+            await endpoint.aclose()
+
+    def summary(self) -> str:
+        """
+        Describe how requests were distributed over the endpoints.
+
+        Returns:
+            str: One line per endpoint with its number of requests and failures.
+        """
+        with self.condition:
+            return "\n".join(
+                f"{endpoint.name}: {endpoint.requests} requests, {endpoint.failures} failures"
+                for endpoint in self.endpoints
+            )
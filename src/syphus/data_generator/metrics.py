@@ -0,0 +1,365 @@
+import collections
+import contextlib
+import json
+import math
+import os
+import random
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, List, Dict, Iterable, Iterator, Any
+
+STAGES = ("render", "prompt", "queue", "limiter", "network", "parse", "write")
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+METRICS_JSON_FILE_NAME = "metrics.json"
+
+METRICS_PROMETHEUS_FILE_NAME = "metrics.prom"
+
+
+class StageStats(object):
+    """
+    Counts the durations of a stage and keeps a uniform sample of them for percentiles.
+
+    Attributes:
+        count (int): The number of durations observed.
+        total (float): The sum of the durations in seconds.
+        max (float): The longest duration in seconds.
+        samples (List[float]): A uniform random sample of at most `sample_size` durations.
+    """
+
+    def __init__(self, sample_size: int = 4096):
+        self.sample_size = sample_size
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: List[float] = []
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.samples) < self.sample_size:
+            self.samples.append(seconds)
+        else:
+            # Reservoir sampling keeps every duration with the same probability.
+            index = random.randrange(self.count)
+            if index < self.sample_size:
+                self.samples[index] = seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a quantile of the durations with the nearest-rank method.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            Optional[float]: The quantile in seconds, or None if nothing was observed.
+        """
+        if not self.samples:
+            return None
+        samples = sorted(self.samples)
+        return samples[min(len(samples), max(1, math.ceil(q * len(samples)))) - 1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            **{f"p{int(q * 100)}": self.quantile(q) for q in QUANTILES},
+            "max": self.max if self.count else None,
+        }
+
+
+class Metrics(object):
+    """
+    Collects the latency of every stage of a query run, the tokens used and the errors met.
+
+    The stages are:
+        render: loading and rendering the infos, e.g. dumping them to YAML.
+        prompt: assembling the messages of a request.
+        queue: waiting for a free worker.
+        limiter: waiting for the load balancer and the rate limiter of the endpoint.
+        network: sending a request and receiving its completion.
+        parse: parsing the completion into QA pairs.
+        write: saving responses to disk.
+
+    All methods are thread safe.
+
+    Attributes:
+        stages (Dict[str, StageStats]): The durations of every stage.
+        tokens (Dict[str, int]): The prompt and completion tokens reported by the usage of completions.
+        errors (collections.Counter): The number of errors per error class, failed attempts included.
+        counts (Dict[str, int]): The number of requests, attempts, cached responses, failed requests, hedged requests and hedged requests won by their duplicate.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.stages: Dict[str, StageStats] = {stage: StageStats() for stage in STAGES}
+        self.tokens = {"prompt": 0, "completion": 0}
+        self.errors = collections.Counter()
+        self.counts = {
+            "requests": 0,
+            "attempts": 0,
+            "cached": 0,
+            "failed": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+        }
+        self.server = None
+
+    def observe(self, stage: str, seconds: float):
+        """
+        Record the duration of a stage.
+
+        Args:
+            stage (str): The name of the stage.
+            seconds (float): The duration in seconds.
+        """
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = StageStats()
+            self.stages[stage].observe(seconds)
+
+    @contextlib.contextmanager
+    def time(self, stage: str):
+        """
+        Time the body of a `with` block as a stage.
+
+        Args:
+            stage (str): The name of the stage.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - start)
+
+    def time_iter(self, items: Iterable[Any], stage: str) -> Iterator[Any]:
+        """
+        Time how long every item of an iterable takes to produce, e.g. to load and render infos lazily.
+
+        Args:
+            items (Iterable[Any]): The items.
+            stage (str): The name of the stage.
+
+        Yields:
+            Any: The items.
+        """
+        iterator = iter(items)
+        while True:
+            start = time.monotonic()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.monotonic() - start)
+            yield item
+
+    def record_request(
+        self,
+        stats: Dict[str, Any],
+        usage: Optional[Dict[str, Any]] = None,
+        error: Optional[BaseException] = None,
+    ):
+        """
+        Record the outcome of a request.
+
+        Args:
+            stats (Dict[str, Any]): The statistics of the request, with the number of attempts and the classes of the errors of failed attempts.
+            usage (Optional[Dict[str, Any]]): The usage of the completion, if any.
+            error (Optional[BaseException]): The error the request finally failed with, if any.
+        """
+        with self.lock:
+            self.counts["requests"] += 1
+            self.counts["attempts"] += stats.get("attempts", 0)
+            if stats.get("cached"):
+                self.counts["cached"] += 1
+            for error_class in stats.get("errors", []):
+                self.errors[error_class] += 1
+            if error is not None:
+                self.counts["failed"] += 1
+                if type(error).__name__ not in stats.get("errors", [])[-1:]:
+                    self.errors[type(error).__name__] += 1
+            if usage and not stats.get("cached"):
+                self.tokens["prompt"] += usage.get("prompt_tokens") or 0
+                self.tokens["completion"] += usage.get("completion_tokens") or 0
+
+    def record_hedge(self, won: bool):
+        """
+        Record a request a duplicate was sent for because it was slow.
+
+        Args:
+            won (bool): Whether the duplicate completed first.
+        """
+        with self.lock:
+            self.counts["hedged"] += 1
+            if won:
+                self.counts["hedge_wins"] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize the metrics.
+
+        Returns:
+            Dict[str, Any]: The elapsed time, the statistics of every stage, the tokens, the errors and the request counts.
+        """
+        with self.lock:
+            return {
+                "elapsed": time.time() - self.start,
+                "stages": {
+                    stage: stats.to_dict() for stage, stats in self.stages.items()
+                },
+                "tokens": dict(self.tokens),
+                "errors": dict(self.errors),
+                **self.counts,
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        summary = self.summary()
+        lines = [
+            "# HELP syphus_stage_seconds Time spent in each stage of the query pipeline.",
+            "# TYPE syphus_stage_seconds summary",
+        ]
+        for stage, stats in summary["stages"].items():
+            for q in QUANTILES:
+                value = stats[f"p{int(q * 100)}"]
+                if value is not None:
+                    lines.append(
+                        f'syphus_stage_seconds{{stage="{stage}",quantile="{q}"}} {value}'
+                    )
+            lines.append(
+                f'syphus_stage_seconds_sum{{stage="{stage}"}} {stats["total"]}'
+            )
+            lines.append(
+                f'syphus_stage_seconds_count{{stage="{stage}"}} {stats["count"]}'
+            )
+        lines += [
+            "# HELP syphus_tokens_total Tokens reported by the usage of completions.",
+            "# TYPE syphus_tokens_total counter",
+        ]
+        for kind, count in summary["tokens"].items():
+            lines.append(f'syphus_tokens_total{{kind="{kind}"}} {count}')
+        lines += [
+            "# HELP syphus_errors_total Errors per error class, failed attempts included.",
+            "# TYPE syphus_errors_total counter",
+        ]
+        for error_class, count in sorted(summary["errors"].items()):
+            lines.append(
+                f'syphus_errors_total{{error_class="{escape_label(error_class)}"}} {count}'
+            )
+        for name in [
+            "requests",
+            "attempts",
+            "cached",
+            "failed",
+            "hedged",
+            "hedge_wins",
+        ]:
+            lines += [
+                f"# TYPE syphus_{name}_total counter",
+                f"syphus_{name}_total {summary[name]}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def save(self, path: str):
+        """
+        Write the JSON summary and the Prometheus text file of the metrics to a folder.
+
+        Args:
+            path (str): The folder, usually the output folder of the run.
+        """
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, METRICS_JSON_FILE_NAME), "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        with open(os.path.join(path, METRICS_PROMETHEUS_FILE_NAME), "w") as f:
+            f.write(self.to_prometheus())
+
+    def report(self) -> str:
+        """
+        Format the stages that were observed for the terminal.
+
+        Returns:
+            str: One line per stage with its count, total, p50 and p95 durations.
+        """
+        summary = self.summary()
+        lines = []
+        for stage, stats in summary["stages"].items():
+            if not stats["count"]:
+                continue
+            lines.append(
+                f"{stage:<8} count={stats['count']} total={stats['total']:.2f}s p50={stats['p50'] * 1000:.1f}ms p95={stats['p95'] * 1000:.1f}ms"
+            )
+        lines.append(
+            f"tokens prompt={summary['tokens']['prompt']} completion={summary['tokens']['completion']}, {summary['failed']} failed requests"
+        )
+        if summary["hedged"]:
+            lines.append(
+                f"hedged {summary['hedged']} of {summary['requests']} requests ({summary['hedged'] / max(1, summary['requests']):.1%}), {summary['hedge_wins']} won by the duplicate"
+            )
+        return "\n".join(lines)
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Expose the metrics live in the Prometheus format from a background thread.
+
+        Args:
+            port (int): The port to listen on, 0 for a free port.
+            host (str, optional): The host to listen on. Defaults to 127.0.0.1.
+
+        Returns:
+            ThreadingHTTPServer: The server, stopped by `stop_serving`.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ["/", "/metrics"]:
+                    self.send_error(404)
+                    return
+                data = metrics.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def stop_serving(self):
+        """
+        Stop the live endpoint, if it is running.
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def escape_label(value: str) -> str:
+    """
+    Escape a Prometheus label value.
+
+    Args:
+        value (str): The value.
+
+    Returns:
+        str: The value with backslashes, quotes and newlines escaped.
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,4 +1,5 @@
 from syphus.utils.settings import Settings
+from typing import Optional, List
 
 import syphus.utils.yaml as yaml
 
@@ -15,8 +16,10 @@ class OpenAISettings(Settings):
         type (str): The type of OpenAI instance (e.g., "local" or "remote").
         base (str): The base URL for making API requests.
         key (str): The API key used for authentication.
-        version (str): The OpenAI API version to use.
+        version (Optional[str]): The OpenAI API version to use, required by Azure deployments.
         engine (str): The OpenAI engine to utilize for generating responses.
+        weight (float): The relative share of requests routed to this endpoint when several are configured.
+        max_concurrency (Optional[int]): The maximum number of requests in flight to this endpoint, None for no limit.
 
     Methods:
         __init__: Initialize the OpenAISettings instance with specified settings.
@@ -33,6 +36,9 @@ class OpenAISettings(Settings):
         base: str = "http://localhost:8000",
         key: str = "",
         engine: str = "chatgpt0301",
+        version: Optional[str] = None,
+        weight: float = 1.0,
+        max_concurrency: Optional[int] = None,
     ):
         """
         Initialize the OpenAISettings instance with specified OpenAI settings.
@@ -42,36 +48,75 @@ class OpenAISettings(Settings):
             base (str): The base URL for making API requests.
             key (str): The API key used for authentication.
             engine (str): The OpenAI engine to utilize for generating responses.
+            version (Optional[str]): The OpenAI API version to use, required by Azure deployments.
+            weight (float): The relative share of requests routed to this endpoint when several are configured.
+            max_concurrency (Optional[int]): The maximum number of requests in flight to this endpoint, None for no limit.
         """
         self.type = type
         self.base = base
         self.key = key
         self.engine = engine
+        self.version = version
+        self.weight = weight
+        self.max_concurrency = max_concurrency
 
     def to_dict(self):
         """
         Convert the OpenAISettings instance to a dictionary representation.
 
+        Optional attributes are only included when they differ from their defaults.
+
         Returns:
             dict: A dictionary containing OpenAI settings attributes.
         """
-        return {
+        settings_dict = {
             "type": self.type,
             "base": self.base,
             "key": self.key,
             "engine": self.engine,
         }
+        if self.version is not None:
+            settings_dict["version"] = self.version
+        if self.weight != 1.0:
+            settings_dict["weight"] = self.weight
+        if self.max_concurrency is not None:
+            settings_dict["max_concurrency"] = self.max_concurrency
+        return settings_dict
 
 
 def read_yaml(yaml_path: str) -> OpenAISettings:
     """
     Read OpenAI API settings from a YAML file.
 
+    If the `OpenAI_API` section lists several endpoints, the first one is returned.
+
     Args:
         yaml_path (str): The path to the YAML file containing OpenAI API settings.
 
     Returns:
         OpenAISettings: An OpenAISettings instance initialized with the settings from the YAML file.
     """
-    open_ai_settings_dict = yaml.load(yaml_path)["OpenAI_API"]
-    return OpenAISettings(**open_ai_settings_dict)
+    return read_yaml_all(yaml_path)[0]
+
+
+def read_yaml_all(yaml_path: str) -> List[OpenAISettings]:
+    """
+    Read every endpoint of the OpenAI API settings from a YAML file.
+
+    The `OpenAI_API` section is either a single mapping or a list of mappings, one per endpoint.
+
+    Args:
+        yaml_path (str): The path to the YAML file containing OpenAI API settings.
+
+    Returns:
+        List[OpenAISettings]: One OpenAISettings instance per endpoint.
+
+    Raises:
+        ValueError: If the `OpenAI_API` section is an empty list.
+    """
+    open_ai_settings = yaml.load(yaml_path)["OpenAI_API"]
+    if isinstance(open_ai_settings, dict):
+        open_ai_settings = [open_ai_settings]
+    if not open_ai_settings:
+        raise ValueError(f"No OpenAI_API endpoint configured in {yaml_path}")
+    return [OpenAISettings(**settings_dict) for settings_dict in open_ai_settings]
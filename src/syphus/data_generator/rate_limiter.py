@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import time
+
+import syphus.utils.yaml as yaml
+
+from syphus.utils.settings import Settings
+from typing import Optional, Mapping, Dict, Any
+
+
+class RateLimitSettings(Settings):
+    """
+    Represents the request and token quotas of an OpenAI deployment.
+
+    Attributes:
+        requests_per_minute (Optional[int]): The number of requests allowed per minute, None for no limit.
+        tokens_per_minute (Optional[int]): The number of tokens allowed per minute, None for no limit.
+    """
+
+    def __init__(
+        self,
+        *,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ):
+        """
+        Initialize the RateLimitSettings instance.
+
+        Args:
+            requests_per_minute (Optional[int]): The number of requests allowed per minute, None for no limit.
+            tokens_per_minute (Optional[int]): The number of tokens allowed per minute, None for no limit.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the RateLimitSettings instance to a dictionary representation.
+
+        Returns:
+            dict: A dictionary containing the rate limit settings.
+        """
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+        }
+
+
+def read_yaml(yaml_path: str) -> RateLimitSettings:
+    """
+    Read rate limit settings from the optional `Rate_limit` section of a YAML file.
+
+    Args:
+        yaml_path (str): The path to the YAML file containing the settings.
+
+    Returns:
+        RateLimitSettings: The settings from the YAML file, or unlimited settings if the section is missing.
+    """
+    rate_limit_settings_dict = yaml.load(yaml_path).get("Rate_limit") or {}
+    return RateLimitSettings(**rate_limit_settings_dict)
+
+
+class TokenBucket(object):
+    """
+    A token bucket that refills continuously up to its capacity.
+
+    Reservations may drive the bucket into debt; the caller is then told how long to wait until its reservation is covered. This queues concurrent callers one after another instead of letting them all retry at the same moment.
+
+    Attributes:
+        capacity (float): The maximum number of tokens the bucket can hold.
+        refill_rate (float): The number of tokens added per second.
+        level (float): The current number of tokens, negative when in debt.
+    """
+
+    def __init__(self, capacity: float, *, period: float = 60.0):
+        """
+        Initialize a full TokenBucket.
+
+        Args:
+            capacity (float): The maximum number of tokens, refilled completely once per period.
+            period (float, optional): The refill period in seconds. Defaults to 60.
+        """
+        self.capacity = capacity
+        self.refill_rate = capacity / period
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = max(0.0, now - self.updated_at)
+        self.level = min(self.capacity, self.level + elapsed * self.refill_rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float, now: Optional[float] = None) -> float:
+        """
+        Take `amount` tokens from the bucket.
+
+        Args:
+            amount (float): The number of tokens to take.
+            now (Optional[float]): The current monotonic time, mostly useful for testing.
+
+        Returns:
+            float: The number of seconds to wait before the reserved tokens are actually available.
+        """
+        self._refill(time.monotonic() if now is None else now)
+        self.level -= amount
+        if self.level >= 0:
+            return 0.0
+        return -self.level / self.refill_rate
+
+    def sync(self, remaining: float, now: Optional[float] = None):
+        """
+        Lower the bucket level to the remaining quota reported by the server.
+
+        The level is never raised, because the server does not yet know about requests that are still in flight.
+
+        Args:
+            remaining (float): The remaining quota reported by the server.
+            now (Optional[float]): The current monotonic time, mostly useful for testing.
+        """
+        self._refill(time.monotonic() if now is None else now)
+        self.level = min(self.level, remaining)
+
+
+class RateLimiter(object):
+    """
+    A thread-safe limiter enforcing requests-per-minute and tokens-per-minute quotas.
+
+    One limiter is shared by every worker of a GPTManager, both the threads of the thread engine and the tasks of the asyncio engine, so they queue up behind a single budget.
+
+    Attributes:
+        settings (RateLimitSettings): The quotas to enforce.
+        requests (Optional[TokenBucket]): The request bucket, None if requests are not limited.
+        tokens (Optional[TokenBucket]): The token bucket, None if tokens are not limited.
+    """
+
+    def __init__(self, settings: Optional[RateLimitSettings] = None):
+        """
+        Initialize the RateLimiter instance.
+
+        Args:
+            settings (Optional[RateLimitSettings]): The quotas to enforce. Defaults to no limit.
+        """
+        self.settings = settings if settings else RateLimitSettings()
+        self.requests = (
+            TokenBucket(self.settings.requests_per_minute)
+            if self.settings.requests_per_minute
+            else None
+        )
+        self.tokens = (
+            TokenBucket(self.settings.tokens_per_minute)
+            if self.settings.tokens_per_minute
+            else None
+        )
+        self.lock = threading.Lock()
+
+    def reserve(self, num_tokens: int) -> float:
+        """
+        Reserve one request and `num_tokens` tokens.
+
+        Args:
+            num_tokens (int): The number of tokens the request may consume.
+
+        Returns:
+            float: The number of seconds to wait before sending the request.
+        """
+        wait = 0.0
+        with self.lock:
+            now = time.monotonic()
+            if self.requests:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens:
+                wait = max(wait, self.tokens.reserve(num_tokens, now))
+        return wait
+
+    def acquire(self, num_tokens: int):
+        """
+        Block the current thread until a request of `num_tokens` tokens may be sent.
+
+        Args:
+            num_tokens (int): The number of tokens the request may consume.
+        """
+        wait = self.reserve(num_tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, num_tokens: int):
+        """
+        Wait, without blocking the event loop, until a request of `num_tokens` tokens may be sent.
+
+        Args:
+            num_tokens (int): The number of tokens the request may consume.
+        """
+        wait = self.reserve(num_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]):
+        """
+        Synchronize the buckets with the `x-ratelimit-remaining-*` headers of a response, if present.
+
+        Args:
+            headers (Optional[Mapping[str, str]]): The HTTP headers of a response.
+        """
+        if not headers:
+            return
+        with self.lock:
+            now = time.monotonic()
+            for bucket, header in [
+                (self.requests, "x-ratelimit-remaining-requests"),
+                (self.tokens, "x-ratelimit-remaining-tokens"),
+            ]:
+                remaining = headers.get(header)
+                if bucket is None or remaining is None:
+                    continue
+                try:
+                    bucket.sync(float(remaining), now)
+                except ValueError:
+                    continue
+
+
+def get_headers(obj: Any) -> Optional[Mapping[str, str]]:
+    """
+    Get the HTTP headers attached to an OpenAI response or error, if any.
+
+    Args:
+        obj (Any): An OpenAI response object or exception.
+
+    Returns:
+        Optional[Mapping[str, str]]: The headers, or None if they are not available.
+    """
+    headers = getattr(obj, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(obj, "response", None), "headers", None)
+    return headers
@@ -0,0 +1,231 @@
+import collections
+import threading
+
+import syphus.data_generator.response as syphus_response
+import syphus.utils.yaml as yaml
+
+from syphus.data_generator.response import Response
+from syphus.utils.settings import Settings
+from typing import Optional, List, Dict, Any
+
+# The warnings a response is asked again for by default. Stray lines are usually harmless comments around the pairs.
+DEFAULT_WARNINGS = {
+    syphus_response.NO_QA_PAIRS: True,
+    syphus_response.UNANSWERED_QUESTION: True,
+    syphus_response.UNASKED_ANSWER: True,
+    syphus_response.STRAY_LINE: False,
+    syphus_response.NOT_ASSISTANT: False,
+}
+
+FEEDBACK = {
+    syphus_response.NO_QA_PAIRS: "it has no question and answer pair",
+    syphus_response.UNANSWERED_QUESTION: "some questions have no answer",
+    syphus_response.UNASKED_ANSWER: "some answers have no question",
+    syphus_response.STRAY_LINE: "some lines are neither part of a question nor of an answer",
+    syphus_response.NOT_ASSISTANT: "it is not an assistant message",
+}
+
+FEEDBACK_TEMPLATE = 'Your answer could not be parsed: {problems}. Answer again with only question and answer pairs, every question on a line starting with "Question:" and followed by its answer on a line starting with "Answer:".'
+
+
+class RequerySettings(Settings):
+    """
+    Represents when a response whose completion could not be parsed cleanly is asked again.
+
+    Attributes:
+        max_requeries (int): The number of times an info is asked again at most, 0 to never ask again.
+        warnings (Dict[str, bool]): Whether every type of parser warning triggers a requery. Types left out keep their default: every warning but stray lines and non assistant messages.
+        feedback (bool): Whether the requery shows the previous completion and what was wrong with it, rather than sending the same messages again.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_requeries: int = 0,
+        warnings: Optional[Dict[str, bool]] = None,
+        feedback: bool = True,
+    ):
+        """
+        Initialize the RequerySettings instance.
+
+        Args:
+            max_requeries (int): The number of times an info is asked again at most. Defaults to 0.
+            warnings (Optional[Dict[str, bool]]): Whether every type of parser warning triggers a requery. Defaults to DEFAULT_WARNINGS.
+            feedback (bool): Whether the requery shows the previous completion and what was wrong with it. Defaults to True.
+
+        Raises:
+            ValueError: If max_requeries is negative or a warning type is unknown.
+        """
+        if max_requeries < 0:
+            raise ValueError("max_requeries must be non-negative")
+        unknown = set(warnings or {}) - set(syphus_response.WARNING_TYPES)
+        if unknown:
+            raise ValueError(
+                f"Unknown warning types {sorted(unknown)}, must be among {syphus_response.WARNING_TYPES}"
+            )
+        self.max_requeries = max_requeries
+        self.warnings = {**DEFAULT_WARNINGS, **(warnings or {})}
+        self.feedback = feedback
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the RequerySettings instance to a dictionary representation.
+
+        Returns:
+            dict: A dictionary containing the requery settings.
+        """
+        return {
+            "max_requeries": self.max_requeries,
+            "warnings": self.warnings,
+            "feedback": self.feedback,
+        }
+
+
+def read_yaml(yaml_path: str) -> RequerySettings:
+    """
+    Read requery settings from the optional `Requery` section of a YAML file.
+
+    Args:
+        yaml_path (str): The path to the YAML file containing the settings.
+
+    Returns:
+        RequerySettings: The settings from the YAML file, or settings never asking again if the section is missing.
+    """
+    requery_settings_dict = yaml.load(yaml_path).get("Requery") or {}
+    return RequerySettings(**requery_settings_dict)
+
+
+class RequeryPolicy(object):
+    """
+    Asks an info again, up to `max_requeries` times, while the parser warns about its response.
+
+    Only the warning types enabled in the settings count, and failed requests are left to the retry policy. With feedback, the requery appends the previous completion and a user message listing what was wrong with it to the messages; without, the same messages are sent again, bypassing the response cache. A requeried response replaces the previous one, unless it has no QA pair while the previous one had some.
+
+    All methods are thread safe.
+
+    Attributes:
+        settings (RequerySettings): The requery settings.
+        triggered (collections.Counter): The number of requeries triggered by every warning type.
+        requeries (int): The number of requeries sent.
+        recovered (int): The number of infos asked again whose final response has no enabled warning.
+        exhausted (int): The number of infos still warned about after `max_requeries` requeries.
+    """
+
+    def __init__(self, settings: RequerySettings):
+        """
+        Initialize the RequeryPolicy instance.
+
+        Args:
+            settings (RequerySettings): The requery settings.
+        """
+        self.settings = settings
+        self.triggered = collections.Counter()
+        self.requeries = 0
+        self.recovered = 0
+        self.exhausted = 0
+        self.lock = threading.Lock()
+
+    def get_problems(self, response: Response) -> List[str]:
+        """
+        List the enabled warning types of a response.
+
+        Args:
+            response (Response): The response.
+
+        Returns:
+            List[str]: The warning types triggering a requery, in the order of WARNING_TYPES. Empty for failed or cancelled requests.
+        """
+        if "error" in response.full_response or response.stats.get("cancelled"):
+            return []
+        warnings = response.stats.get("warnings", {})
+        return [
+            warning_type
+            for warning_type in syphus_response.WARNING_TYPES
+            if warnings.get(warning_type) and self.settings.warnings[warning_type]
+        ]
+
+    def get_messages(
+        self, messages: List[Dict[str, str]], response: Response, problems: List[str]
+    ) -> List[Dict[str, str]]:
+        """
+        Build the messages of a requery.
+
+        Args:
+            messages (List[Dict[str, str]]): The messages the response was generated for.
+            response (Response): The response asked again for.
+            problems (List[str]): The warning types of the response.
+
+        Returns:
+            List[Dict[str, str]]: The same messages, followed by the first choice of the response and the feedback if feedback is enabled.
+        """
+        if not self.settings.feedback:
+            return messages
+        content = response.full_response["choices"][0]["message"]["content"] or ""
+        return list(messages) + [
+            {"role": "assistant", "content": content},
+            {
+                "role": "user",
+                "content": FEEDBACK_TEMPLATE.format(
+                    problems="; ".join(FEEDBACK[problem] for problem in problems)
+                ),
+            },
+        ]
+
+    def record(self, problems: List[str]):
+        """
+        Count a requery.
+
+        Args:
+            problems (List[str]): The warning types that triggered it.
+        """
+        with self.lock:
+            self.requeries += 1
+            self.triggered.update(problems)
+
+    def finish(self, response: Response, requeries: int, problems: List[str]):
+        """
+        Count the outcome of an info and note its requeries in its statistics and warnings.
+
+        Args:
+            response (Response): The final response of the info.
+            requeries (int): The number of requeries the info took.
+            problems (List[str]): The warning types left in the final response.
+        """
+        if not requeries:
+            return
+        response.stats["requeries"] = requeries
+        response.warning_message.insert(0, f"Asked again {requeries} times.")
+        with self.lock:
+            if problems:
+                self.exhausted += 1
+            else:
+                self.recovered += 1
+
+    def choose(self, response: Response, requeried: Response) -> Response:
+        """
+        Choose between a response and its requery.
+
+        Args:
+            response (Response): The response asked again for.
+            requeried (Response): The response of the requery.
+
+        Returns:
+            Response: The requeried response, or the previous one if the requeried one has no QA pair while the previous one had some.
+        """
+        if not requeried.qa_pairs and response.qa_pairs:
+            return response
+        return requeried
+
+    def report(self) -> str:
+        """
+        Format the counters for the terminal.
+
+        Returns:
+            str: The number of requeries, by warning type, and how many infos they fixed.
+        """
+        with self.lock:
+            by_type = ", ".join(
+                f"{warning_type}={count}"
+                for warning_type, count in sorted(self.triggered.items())
+            )
+            return f"Requeried {self.requeries} times ({by_type or 'none'}): {self.recovered} infos fixed, {self.exhausted} still with warnings"
@@ -1,8 +1,9 @@
 import sys
 import os
 import json
+import collections
 
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Optional, Tuple, Callable
 from tqdm import tqdm
 
 import syphus.prompts.qa_pair as qa_pair
@@ -11,6 +12,21 @@ import syphus.utils.jsonl as jsonl
 
 from syphus.utils.file_format import auto_infer_format, get_loader_by_format, get_saver
 
+# The kinds of warnings of the parser, counted in the statistics of a response.
+NO_QA_PAIRS = "no_qa_pairs"
+UNANSWERED_QUESTION = "unanswered_question"
+UNASKED_ANSWER = "unasked_answer"
+STRAY_LINE = "stray_line"
+NOT_ASSISTANT = "not_assistant"
+
+WARNING_TYPES = (
+    NO_QA_PAIRS,
+    UNANSWERED_QUESTION,
+    UNASKED_ANSWER,
+    STRAY_LINE,
+    NOT_ASSISTANT,
+)
+
 
 def extend_name(name: str, format: str) -> str:
     """
@@ -60,6 +76,153 @@ def get_file_path_names(
     return response_path, error_message_path, full_response_path
 
 
+class QAPairParser(object):
+    """
+    An incremental parser of the question and answer pairs of a GPT message.
+
+    The message can be fed in arbitrary pieces, such as the deltas of a streamed completion. Every line starting with the question header opens a new question, and the lines starting with the answer header, or following a question or an answer, extend it. A pair is complete as soon as the next question starts, so all pairs but the last one are available before the message ends.
+
+    Attributes:
+        question_header (str): The prefix indicating the start of a question.
+        answer_header (str): The prefix indicating the start of an answer.
+        ignore_capitalization (bool): If True, headers are matched without considering capitalization.
+        on_qa_pair (Optional[Callable[[qa_pair.QAPair], None]]): Called with every pair as soon as it is complete.
+        qa_pairs (List[qa_pair.QAPair]): The complete pairs parsed so far.
+        warning_message (List[str]): The warnings generated so far.
+        warning_counts (collections.Counter): The number of warnings of every type of WARNING_TYPES found so far.
+    """
+
+    def __init__(
+        self,
+        *,
+        question_header: str = "question:",
+        answer_header: str = "answer:",
+        ignore_capitalization: bool = True,
+        on_qa_pair: Optional[Callable[[qa_pair.QAPair], None]] = None,
+    ):
+        """
+        Initialize a QAPairParser instance.
+
+        Args:
+            question_header (str): The prefix indicating the start of a question.
+            answer_header (str): The prefix indicating the start of an answer.
+            ignore_capitalization (bool): Whether to ignore capitalization when matching headers.
+            on_qa_pair (Optional[Callable[[qa_pair.QAPair], None]]): Called with every pair as soon as it is complete.
+        """
+        self.question_header = question_header
+        self.answer_header = answer_header
+        self.ignore_capitalization = ignore_capitalization
+        self.on_qa_pair = on_qa_pair
+        self.qa_pairs = []
+        self.warning_message = []
+        self.warning_counts = collections.Counter()
+        self.question = None
+        self.answer = None
+        self.last = None
+        self.pending_line = ""
+
+    def check_start_with(self, line: str, prefix: str) -> bool:
+        if self.ignore_capitalization:
+            return line.lower().startswith(prefix.lower())
+        else:
+            return line.startswith(prefix)
+
+    def add_qa_pair(self):
+        pair = qa_pair.QAPair(self.question, self.answer)
+        self.qa_pairs.append(pair)
+        self.question = None
+        self.answer = None
+        if self.on_qa_pair is not None:
+            self.on_qa_pair(pair)
+
+    def feed(self, text: str):
+        """
+        Parse the next piece of the message. Only complete lines are parsed, the rest is kept until more text arrives.
+
+        Args:
+            text (str): The next piece of the message.
+        """
+        lines = (self.pending_line + text).split("\n")
+        self.pending_line = lines.pop()
+        for line in lines:
+            self.parse_line(line)
+
+    def parse_line(self, full_line: str):
+        """
+        Parse a complete line of the message.
+
+        Args:
+            full_line (str): The line, without its line break.
+        """
+        line = full_line.strip()
+        if line == "":
+            return
+        if self.check_start_with(line, self.question_header):
+            if self.question and self.answer:
+                self.add_qa_pair()
+            if self.question:
+                self.warning_counts[UNANSWERED_QUESTION] += 1
+                self.warning_message.append(
+                    "There is a question without an answer: " + self.question
+                )
+            self.question = line[len(self.question_header) :].strip()
+            self.last = "question"
+        elif self.check_start_with(line, self.answer_header):
+            if self.question is None:
+                self.warning_counts[UNASKED_ANSWER] += 1
+                self.warning_message.append(
+                    "There is an answer without a question: " + line
+                )
+            else:
+                self.answer = line[len(self.answer_header) :].strip()
+                self.last = "answer"
+        else:
+            if self.last == "question":
+                self.question += "\n" + line
+            elif self.last == "answer":
+                self.answer += "\n" + line
+            else:
+                self.warning_counts[STRAY_LINE] += 1
+                self.warning_message.append(
+                    "There is a line which is not a question or answer: " + line
+                )
+
+    @property
+    def unmatched(self) -> int:
+        """
+        The number of questions without an answer and answers without a question found so far.
+
+        Returns:
+            int: The number of unmatched questions and answers.
+        """
+        return (
+            self.warning_counts[UNANSWERED_QUESTION]
+            + self.warning_counts[UNASKED_ANSWER]
+        )
+
+    def close(self):
+        """
+        Parse the last line and complete the last pair, once the whole message was fed.
+        """
+        self.parse_line(self.pending_line)
+        self.pending_line = ""
+        if self.question and self.answer:
+            self.add_qa_pair()
+        if len(self.qa_pairs) == 0:
+            if self.question:
+                self.warning_message.append(
+                    "There is a question without an answer: " + self.question
+                )
+            else:
+                self.warning_counts[NO_QA_PAIRS] += 1
+                self.warning_message.append("There is no question and answer pair.")
+        if self.question:
+            self.warning_counts[UNANSWERED_QUESTION] += 1
+            self.warning_message.append(
+                "There is a question without an answer: " + self.question
+            )
+
+
 class Response(object):
     """
     Represents GPT generated responses and manages question-answer pairs.
@@ -74,6 +237,7 @@ class Response(object):
         warning_message (List[str]): A list of warning messages generated during response processing, such as notifications about missing or mismatched question-answer pairs.
         qa_pairs (List[qa_pair.QAPair]): A list of QA pairs extracted from the response, where each pair consists of a question and its corresponding answer.
         full_response (Dict[str, Any]): The complete GPT-3 response dictionary, including the message content, role, and other metadata.
+        stats (Dict[str, Any]): Statistics of the request that produced the response, such as the number of attempts, or the number of unmatched questions and answers and the number of parser warnings of every type if there are any. They are not saved to files.
 
     Methods:
         __init__: Initialize the Response instance. This constructor can handle both existing data and GPT-3 response inputs.
@@ -83,6 +247,7 @@ class Response(object):
     Note:
         - The class provides flexibility in initializing instances from GPT-3 responses or existing data, allowing users to seamlessly integrate the class into their workflows.
         - It automatically processes the response content to extract question-answer pairs, handling headers and formatting variations.
+        - The QA pairs of every choice of the response are merged, dropping the ones repeated exactly or up to case, punctuation and whitespace.
         - The `save` method enables users to save the instance data, making it convenient for further analysis and sharing with others.
     """
 
@@ -95,6 +260,7 @@ class Response(object):
         ignore_capitalization: bool = True,
         data: Optional[Dict[str, Any]] = None,
         gpt_error_messages: Optional[str] = None,
+        stats: Optional[Dict[str, Any]] = None,
     ):
         """
         Initialize a Response instance with GPT-3 generated responses and QA pairs.
@@ -106,10 +272,12 @@ class Response(object):
             ignore_capitalization (bool): Whether to ignore capitalization when matching headers.
             data (Optional[Dict[str, Any]]): Pre-existing data to initialize the instance.
             gpt_error_messages (Optional[str]): Error messages from GPT-3 if present.
+            stats (Optional[Dict[str, Any]]): Statistics of the request that produced the response.
 
         Raises:
             ValueError: If neither gpt_response nor gpt_error_messages are provided.
         """
+        self.stats = stats if stats is not None else {}
         if data is not None:
             self.full_response = data["full_response"]
             self.warning_message = data["warning_message"]
@@ -128,73 +296,59 @@ class Response(object):
             }
             return
 
-        self.warning_message = []
-        self.qa_pairs = []
         self.full_response = gpt_response
-        question = None
-        answer = None
-        message = gpt_response["choices"][0]["message"]["content"]
-        if gpt_response["choices"][0]["message"]["role"] != "assistant":
-            self.warning_message.append("Response is not from assistant.")
-        last = None
-
-        def check_start_with(line, prefix) -> bool:
-            if ignore_capitalization:
-                return line.lower().startswith(prefix.lower())
-            else:
-                return line.startswith(prefix)
-
-        for full_line in message.split("\n"):
-            line = full_line.strip()
-            if line == "":
-                continue
-            if check_start_with(line, question_header):
-                if question and answer:
-                    self.qa_pairs.append(qa_pair.QAPair(question, answer))
-                    question = None
-                    answer = None
-                if question:
-                    self.warning_message.append(
-                        "There is a question without an answer: " + question
-                    )
-                question = line[len(question_header) :].strip()
-                last = "question"
-            elif check_start_with(line, answer_header):
-                if question is None:
-                    self.warning_message.append(
-                        "There is an answer without a question: " + line
-                    )
-                else:
-                    answer = line[len(answer_header) :].strip()
-                    last = "answer"
-            else:
-                if last == "question":
-                    question += "\n" + line
-                elif last == "answer":
-                    answer += "\n" + line
-                else:
-                    self.warning_message.append(
-                        "There is a line which is not a question or answer: " + line
-                    )
-        if question and answer:
-            self.qa_pairs.append(qa_pair.QAPair(question, answer))
-            question = None
-            answer = None
-        if len(self.qa_pairs) == 0:
-            if question:
-                self.warning_message.append(
-                    "There is a question without an answer: " + question
+        choices = gpt_response["choices"]
+        self.qa_pairs = []
+        self.warning_message = []
+        warning_counts = collections.Counter()
+        for choice in choices:
+            parser = QAPairParser(
+                question_header=question_header,
+                answer_header=answer_header,
+                ignore_capitalization=ignore_capitalization,
+            )
+            if choice["message"]["role"] != "assistant":
+                parser.warning_counts[NOT_ASSISTANT] += 1
+                parser.warning_message.append("Response is not from assistant.")
+            parser.feed(choice["message"]["content"] or "")
+            parser.close()
+            self.qa_pairs.extend(parser.qa_pairs)
+            warning_counts += parser.warning_counts
+            if len(choices) > 1:
+                self.warning_message.extend(
+                    f"Choice {choice.get('index')}: {warning}"
+                    for warning in parser.warning_message
                 )
             else:
-                self.warning_message.append("There is no question and answer pair.")
-        if question:
-            self.warning_message.append(
-                "There is a question without an answer: " + question
+                self.warning_message.extend(parser.warning_message)
+        if len(choices) > 1:
+            num_qa_pairs = len(self.qa_pairs)
+            self.qa_pairs = qa_pair.deduplicate(self.qa_pairs)
+            self.stats["duplicate_qa_pairs"] = num_qa_pairs - len(self.qa_pairs)
+        # A choice without pairs is only a problem if no other choice has some, and is counted once.
+        if warning_counts.pop(NO_QA_PAIRS, 0) and not self.qa_pairs:
+            warning_counts[NO_QA_PAIRS] = 1
+        if warning_counts:
+            self.stats["warnings"] = dict(warning_counts)
+            unmatched = (
+                warning_counts[UNANSWERED_QUESTION] + warning_counts[UNASKED_ANSWER]
             )
+            if unmatched:
+                self.stats["unmatched"] = unmatched
         if self.warning_message:
             for warning in self.warning_message:
                 print(warning, file=sys.stderr)
 
+    @property
+    def attempts(self) -> int:
+        """
+        The number of attempts it took to get the response, 0 if unknown.
+
+        Returns:
+            int: The number of attempts.
+        """
+        return self.stats.get("attempts", 0)
+
     def to_dict(self) -> Dict[str, Any]:
         """
         Convert the Response instance to a dictionary representation.
@@ -528,6 +682,8 @@ def read_all(
         if process_bar:
             responses_ids = tqdm(responses_ids, desc="Loading responses", unit="files")
         for id in responses_ids:
+            if not os.path.isdir(os.path.join(path, id)):
+                continue
             try:
                 response = read_single(
                     os.path.join(path, id),
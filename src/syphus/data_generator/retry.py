@@ -0,0 +1,250 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+import syphus.utils.yaml as yaml
+
+from syphus.data_generator.rate_limiter import get_headers
+from syphus.utils.settings import Settings
+from typing import Optional, Dict, Any
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+RETRYABLE_ERROR_NAMES = {
+    "RateLimitError",
+    "Timeout",
+    "APITimeoutError",
+    "APIConnectionError",
+    "InternalServerError",
+    "ServiceUnavailableError",
+    "TryAgain",
+}
+
+OVERLOAD_STATUS_CODES = {408, 429, 503, 504}
+
+OVERLOAD_ERROR_NAMES = {
+    "RateLimitError",
+    "Timeout",
+    "APITimeoutError",
+    "ServiceUnavailableError",
+}
+
+
+class RetrySettings(Settings):
+    """
+    Represents the retry behaviour of failed GPT requests.
+
+    Attributes:
+        max_attempts (int): The maximum number of attempts per request, including the first one.
+        base_delay (float): The backoff ceiling of the first retry in seconds, doubled on every retry.
+        max_delay (float): The maximum backoff ceiling in seconds.
+        retry_budget (Optional[int]): The maximum number of retries over a whole run, None for no limit.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_attempts: int = 8,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        retry_budget: Optional[int] = None,
+    ):
+        """
+        Initialize the RetrySettings instance.
+
+        Args:
+            max_attempts (int): The maximum number of attempts per request, including the first one.
+            base_delay (float): The backoff ceiling of the first retry in seconds, doubled on every retry.
+            max_delay (float): The maximum backoff ceiling in seconds.
+            retry_budget (Optional[int]): The maximum number of retries over a whole run, None for no limit.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = retry_budget
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the RetrySettings instance to a dictionary representation.
+
+        Returns:
+            dict: A dictionary containing the retry settings.
+        """
+        return {
+            "max_attempts": self.max_attempts,
+            "base_delay": self.base_delay,
+            "max_delay": self.max_delay,
+            "retry_budget": self.retry_budget,
+        }
+
+
+def read_yaml(yaml_path: str) -> RetrySettings:
+    """
+    Read retry settings from the optional `Retry` section of a YAML file.
+
+    Args:
+        yaml_path (str): The path to the YAML file containing the settings.
+
+    Returns:
+        RetrySettings: The settings from the YAML file, or the default settings if the section is missing.
+    """
+    retry_settings_dict = yaml.load(yaml_path).get("Retry") or {}
+    return RetrySettings(**retry_settings_dict)
+
+
+def get_status_code(error: BaseException) -> Optional[int]:
+    """
+    Get the HTTP status code of an OpenAI error, if any.
+
+    Args:
+        error (BaseException): The error raised by a request.
+
+    Returns:
+        Optional[int]: The HTTP status code, or None if the error does not carry one.
+    """
+    for attribute in ["status_code", "http_status"]:
+        status_code = getattr(error, attribute, None)
+        if isinstance(status_code, int):
+            return status_code
+    return None
+
+
+def is_overload(error: BaseException) -> bool:
+    """
+    Check whether an error signals that the server is overloaded, such as a rate limit or a timeout.
+
+    Args:
+        error (BaseException): The error raised by a request.
+
+    Returns:
+        bool: True if sending fewer concurrent requests would likely help.
+    """
+    status_code = get_status_code(error)
+    if status_code is not None:
+        return status_code in OVERLOAD_STATUS_CODES
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    if any(cls.__name__ in OVERLOAD_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    return "rate limit" in str(error).lower()
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """
+    Get the delay requested by the `Retry-After` header of an error, if any.
+
+    Args:
+        error (BaseException): The error raised by a request.
+
+    Returns:
+        Optional[float]: The requested delay in seconds, or None if there is none.
+    """
+    headers = get_headers(error)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RetryPolicy(object):
+    """
+    Decides whether and when a failed GPT request is retried.
+
+    Errors are classified as retryable (rate limits, timeouts, connection errors, 408/409/429 and 5xx responses) or fatal (everything else). Retryable errors are retried with capped exponential backoff and full jitter, or after the delay requested by `Retry-After` if that is longer, until the per-request attempt limit or the per-run retry budget runs out.
+
+    Subclass it and override `is_retryable` or `get_delay` to plug in a different policy.
+
+    Attributes:
+        settings (RetrySettings): The retry settings.
+        retries (int): The number of retries granted so far in this run.
+    """
+
+    def __init__(self, settings: Optional[RetrySettings] = None):
+        """
+        Initialize the RetryPolicy instance.
+
+        Args:
+            settings (Optional[RetrySettings]): The retry settings. Defaults to RetrySettings().
+        """
+        self.settings = settings if settings else RetrySettings()
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def is_retryable(self, error: BaseException) -> bool:
+        """
+        Classify an error as retryable or fatal.
+
+        Args:
+            error (BaseException): The error raised by a request.
+
+        Returns:
+            bool: True if the request may succeed when sent again.
+        """
+        status_code = get_status_code(error)
+        if status_code is not None:
+            return status_code in RETRYABLE_STATUS_CODES
+        if isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+            return True
+        if any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__):
+            return True
+        return "rate limit" in str(error).lower()
+
+    def get_delay(self, attempt: int, error: BaseException) -> float:
+        """
+        Compute how long to wait before the next attempt.
+
+        Args:
+            attempt (int): The number of attempts made so far.
+            error (BaseException): The error raised by the last attempt.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        ceiling = min(
+            self.settings.max_delay, self.settings.base_delay * 2 ** (attempt - 1)
+        )
+        delay = random.uniform(0, ceiling)
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def next_delay(self, attempt: int, error: BaseException) -> Optional[float]:
+        """
+        Decide whether to retry after a failed attempt, consuming the run budget if so.
+
+        Args:
+            attempt (int): The number of attempts made so far.
+            error (BaseException): The error raised by the last attempt.
+
+        Returns:
+            Optional[float]: The delay in seconds before retrying, or None if the error should be raised.
+        """
+        if attempt >= self.settings.max_attempts or not self.is_retryable(error):
+            return None
+        with self.lock:
+            if (
+                self.settings.retry_budget is not None
+                and self.retries >= self.settings.retry_budget
+            ):
+                return None
+            self.retries += 1
+        return self.get_delay(attempt, error)
@@ -0,0 +1,183 @@
+import heapq
+import itertools
+import threading
+
+from syphus.data_generator.response import Response
+from syphus.prompts.info import Info
+from syphus.utils.tokens import TokenCounter
+from typing import Optional, Callable, Dict, Iterable, Iterator
+
+SCHEDULES = ("fifo", "ljf")
+
+DEFAULT_LOOKAHEAD = 1000
+
+
+class CostEstimator(object):
+    """
+    Estimates how long the request of an info takes, in prompt token equivalents.
+
+    The cost is the number of tokens of the info plus `completion_weight` times the completion tokens expected for it. The expected completion length is a least squares fit of the completion tokens of finished infos against their info tokens, updated while the run goes, and the info tokens alone are used until `min_samples` infos finished.
+
+    All methods are thread safe.
+
+    Attributes:
+        counter (TokenCounter): The tokenizer counting the infos.
+        completion_weight (float): How many prompt tokens a completion token costs.
+        max_completion_tokens (Optional[int]): The completion length is never expected to exceed this.
+        samples (int): The number of finished infos the fit is based on.
+    """
+
+    def __init__(
+        self,
+        counter: TokenCounter,
+        *,
+        completion_weight: float = 10.0,
+        max_completion_tokens: Optional[int] = None,
+        min_samples: int = 10,
+    ):
+        """
+        Initialize the CostEstimator instance.
+
+        Args:
+            counter (TokenCounter): The tokenizer counting the infos.
+            completion_weight (float, optional): How many prompt tokens a completion token costs. Generating a token takes far longer than reading one. Defaults to 10.
+            max_completion_tokens (Optional[int], optional): The completion length is never expected to exceed this, usually `max_tokens`. Defaults to None.
+            min_samples (int, optional): The number of finished infos needed before the expected completion length is used. Defaults to 10.
+        """
+        self.counter = counter
+        self.completion_weight = completion_weight
+        self.max_completion_tokens = max_completion_tokens
+        self.min_samples = min_samples
+        self.samples = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xx = 0.0
+        self.sum_xy = 0.0
+        # Info tokens of the infos estimated but not finished, to fit them once they finish.
+        self.pending: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def expected_completion_tokens(self, info_tokens: int) -> Optional[float]:
+        """
+        Predict the completion length of an info from its length.
+
+        Args:
+            info_tokens (int): The number of tokens of the info.
+
+        Returns:
+            Optional[float]: The expected completion tokens, or None if too few infos finished.
+        """
+        with self.lock:
+            if self.samples < self.min_samples:
+                return None
+            mean_x = self.sum_x / self.samples
+            mean_y = self.sum_y / self.samples
+            variance = self.sum_xx / self.samples - mean_x**2
+            slope = (
+                (self.sum_xy / self.samples - mean_x * mean_y) / variance
+                if variance > 0
+                else 0.0
+            )
+        expected = max(0.0, mean_y + slope * (info_tokens - mean_x))
+        if self.max_completion_tokens is not None:
+            expected = min(expected, self.max_completion_tokens)
+        return expected
+
+    def __call__(self, info: Info) -> float:
+        info_tokens = self.counter.count_tokens(info.content)
+        if info.id is not None:
+            with self.lock:
+                self.pending[info.id] = info_tokens
+        completion_tokens = self.expected_completion_tokens(info_tokens)
+        if completion_tokens is None:
+            return float(info_tokens)
+        return info_tokens + self.completion_weight * completion_tokens
+
+    def record(self, id: str, response: Response):
+        """
+        Fit the completion length of a finished info.
+
+        Responses without usage, e.g. failed, cached or split from a batch, are ignored.
+
+        Args:
+            id (str): The Info ID.
+            response (Response): The response of the info.
+        """
+        with self.lock:
+            info_tokens = self.pending.pop(id, None)
+            usage = response.full_response.get("usage") or {}
+            completion_tokens = usage.get("completion_tokens")
+            if (
+                info_tokens is None
+                or completion_tokens is None
+                or response.stats.get("cached")
+            ):
+                return
+            self.samples += 1
+            self.sum_x += info_tokens
+            self.sum_y += completion_tokens
+            self.sum_xx += info_tokens**2
+            self.sum_xy += info_tokens * completion_tokens
+
+
+class LongestJobFirst(object):
+    """
+    Reorders infos so that the most expensive ones are sent first.
+
+    A run only ends when its slowest request does, so if a cluster of long infos comes late, the end of the run is spent waiting on a few of them at low concurrency. Starting them first lets the short infos fill the gaps instead. Infos with a higher `priority` always go before infos with a lower one, and infos without a priority count as priority 0.
+
+    The input is read through a look-ahead window: the most expensive of the next `lookahead` infos is sent first, so streaming inputs of any length are supported with bounded memory.
+
+    Attributes:
+        cost (Callable[[Info], float]): Estimates the cost of an info.
+        lookahead (int): The number of infos the most expensive one is chosen from.
+    """
+
+    def __init__(
+        self, cost: Callable[[Info], float], *, lookahead: int = DEFAULT_LOOKAHEAD
+    ):
+        """
+        Initialize the LongestJobFirst instance.
+
+        Args:
+            cost (Callable[[Info], float]): Estimates the cost of an info, e.g. a CostEstimator.
+            lookahead (int, optional): The number of infos the most expensive one is chosen from. Defaults to 1000.
+
+        Raises:
+            ValueError: If lookahead is smaller than 1.
+        """
+        if lookahead < 1:
+            raise ValueError("lookahead must be at least 1")
+        self.cost = cost
+        self.lookahead = lookahead
+
+    def schedule(self, infos: Iterable[Info]) -> Iterator[Info]:
+        """
+        Reorder infos by decreasing priority, then decreasing cost, within the look-ahead window.
+
+        Args:
+            infos (Iterable[Info]): The infos, pulled lazily.
+
+        Yields:
+            Info: The infos in scheduled order. Ties keep their input order.
+        """
+        heap = []
+        counter = itertools.count()
+        for info in infos:
+            priority = info.priority if info.priority is not None else 0
+            heapq.heappush(heap, (-priority, -self.cost(info), next(counter), info))
+            if len(heap) >= self.lookahead:
+                yield heapq.heappop(heap)[-1]
+        while heap:
+            yield heapq.heappop(heap)[-1]
+
+    def record(self, id: str, response: Response):
+        """
+        Let the cost estimator learn from a finished info, if it can.
+
+        Args:
+            id (str): The Info ID.
+            response (Response): The response of the info.
+        """
+        if hasattr(self.cost, "record"):
+            self.cost.record(id, response)
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+# The result handed to the followers of a cancelled leader, telling them to run the call again.
+LEADER_CANCELLED = object()
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls that share the same key into a single call.
+
+    The first caller of a key runs the call; every caller arriving with the same key while it is still running waits for it and receives the same result, or the same exception. If an asynchronous caller running the call is cancelled, one of its waiting callers runs it again instead. Once the call finishes the key is forgotten, so later callers run it again.
+
+    Attributes:
+        saved (int): The number of calls avoided by coalescing.
+    """
+
+    def __init__(self):
+        self.saved = 0
+        self.lock = threading.Lock()
+        self.calls: Dict[str, Future] = {}
+        self.async_calls: Dict[str, asyncio.Future] = {}
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """
+        Run `func`, or wait for the call already running with the same key.
+
+        Args:
+            key (str): The key identifying identical calls.
+            func (Callable[[], Any]): The call to run.
+
+        Returns:
+            Any: The result of the call.
+        """
+        is_leader = False
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.saved += 1
+            else:
+                future = self.calls[key] = Future()
+                future.set_running_or_notify_cancel()
+                is_leader = True
+        if not is_leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    async def ado(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await `func()`, or the call already running with the same key, on the current event loop.
+
+        Args:
+            key (str): The key identifying identical calls.
+            func (Callable[[], Awaitable[Any]]): The coroutine function to run.
+
+        Returns:
+            Any: The result of the call.
+        """
+        future = self.async_calls.get(key)
+        if future is not None:
+            self.saved += 1
+        while future is not None:
+            result = await asyncio.shield(future)
+            if result is not LEADER_CANCELLED:
+                return result
+            # The leader was cancelled, so the first follower to wake up runs the call again.
+            future = self.async_calls.get(key)
+            if future is None:
+                self.saved -= 1
+        future = self.async_calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # Only the leader was cancelled, so its followers must not be.
+            future.set_result(LEADER_CANCELLED)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else is waiting for it.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.async_calls[key]
@@ -0,0 +1,204 @@
+import time
+
+from syphus.data_generator.response import QAPairParser, Response
+from syphus.prompts.qa_pair import QAPair, get_key
+from syphus.utils.tokens import estimate_tokens
+from typing import Optional, Callable, List, Dict, Any
+
+
+class StreamAccumulator(object):
+    """
+    Rebuilds a chat completion from the chunks of a streamed request and measures its speed.
+
+    The rebuilt completion has the same layout as a non-streamed one, so it can be cached and parsed by Response as usual. Requests of several completions stream the pieces of all of them, told apart by the index of their choice.
+
+    Attributes:
+        start (float): The monotonic time the request was sent.
+        on_delta (Optional[Callable[[str], None]]): Called with every piece of content of the first choice as soon as it arrives.
+        first_token_time (Optional[float]): The monotonic time the first piece of content arrived.
+        choices (Dict[int, Dict[str, Any]]): The role, finish reason and pieces of content received so far of every choice.
+    """
+
+    def __init__(
+        self,
+        *,
+        start: Optional[float] = None,
+        on_delta: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        Initialize a StreamAccumulator instance.
+
+        Args:
+            start (Optional[float]): The monotonic time the request was sent. Defaults to now.
+            on_delta (Optional[Callable[[str], None]]): Called with every piece of content of the first choice as soon as it arrives.
+        """
+        self.start = time.monotonic() if start is None else start
+        self.on_delta = on_delta
+        self.first_token_time = None
+        self.choices: Dict[int, Dict[str, Any]] = {}
+        self.metadata: Dict[str, Any] = {}
+        self.usage = None
+
+    def add(self, chunk: Dict[str, Any]):
+        """
+        Add a chunk of the stream.
+
+        Args:
+            chunk (Dict[str, Any]): A `chat.completion.chunk` object.
+        """
+        for key in ["id", "created", "model"]:
+            if key in chunk:
+                self.metadata[key] = chunk[key]
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+        for choice in chunk.get("choices") or []:
+            index = choice.get("index", 0)
+            if index not in self.choices:
+                self.choices[index] = {
+                    "role": "assistant",
+                    "finish_reason": None,
+                    "contents": [],
+                }
+            state = self.choices[index]
+            delta = choice.get("delta") or {}
+            if delta.get("role"):
+                state["role"] = delta["role"]
+            if choice.get("finish_reason"):
+                state["finish_reason"] = choice["finish_reason"]
+            content = delta.get("content")
+            if content:
+                if self.first_token_time is None:
+                    self.first_token_time = time.monotonic()
+                state["contents"].append(content)
+                if self.on_delta is not None and index == 0:
+                    self.on_delta(content)
+
+    @property
+    def contents(self) -> List[str]:
+        """
+        The pieces of content received so far, of every choice.
+
+        Returns:
+            List[str]: The pieces of content.
+        """
+        return [
+            content
+            for index in sorted(self.choices)
+            for content in self.choices[index]["contents"]
+        ]
+
+    def to_response(self) -> Dict[str, Any]:
+        """
+        Build the completion the stream is equivalent to.
+
+        Returns:
+            Dict[str, Any]: A `chat.completion` object.
+        """
+        response = {
+            **self.metadata,
+            "object": "chat.completion",
+            "choices": [
+                {
+                    "finish_reason": state["finish_reason"],
+                    "index": index,
+                    "message": {
+                        "content": "".join(state["contents"]),
+                        "role": state["role"],
+                    },
+                }
+                for index, state in sorted(self.choices.items())
+            ]
+            or [
+                {
+                    "finish_reason": None,
+                    "index": 0,
+                    "message": {"content": "", "role": "assistant"},
+                }
+            ],
+        }
+        if self.usage is not None:
+            response["usage"] = self.usage
+        return response
+
+    def record_stats(self, stats: Dict[str, Any]):
+        """
+        Record the time to first token and the generation speed of the request.
+
+        The number of completion tokens is taken from the usage of the stream if the server sends it, and estimated from the content otherwise.
+
+        Args:
+            stats (Dict[str, Any]): The statistics of the request.
+        """
+        end = time.monotonic()
+        if self.usage is not None:
+            completion_tokens = self.usage.get("completion_tokens", 0)
+        else:
+            completion_tokens = estimate_tokens("".join(self.contents))
+        stats["completion_tokens"] = completion_tokens
+        if self.first_token_time is None:
+            return
+        stats["ttft"] = self.first_token_time - self.start
+        generation_time = end - self.first_token_time
+        if generation_time > 0:
+            stats["tokens_per_second"] = completion_tokens / generation_time
+
+
+class QAPairStream(object):
+    """
+    Feeds the streamed content of a request to a QAPairParser, so that QA pairs are handed out while the completion is still being generated.
+
+    A new parser is started for every attempt, so the content of a failed attempt does not leak into the next one. The pairs of a failed attempt may however already have been handed out. Only the first choice of a request is streamed, the pairs of the other choices are handed out once it is done.
+
+    Attributes:
+        on_qa_pair (Callable[[QAPair], None]): Called with every QA pair as soon as it is complete.
+        parser (Optional[QAPairParser]): The parser of the current attempt, None until content arrives.
+        attempt (Optional[int]): The number of the current attempt.
+    """
+
+    def __init__(self, on_qa_pair: Callable[[QAPair], None]):
+        """
+        Initialize a QAPairStream instance.
+
+        Args:
+            on_qa_pair (Callable[[QAPair], None]): Called with every QA pair as soon as it is complete.
+        """
+        self.on_qa_pair = on_qa_pair
+        self.parser: Optional[QAPairParser] = None
+        self.attempt: Optional[int] = None
+        self.handed_out = set()
+
+    def feed(self, content: str, attempt: int):
+        """
+        Parse the next piece of content, to be passed as `on_delta` to GPTManager.query_gpt.
+
+        Args:
+            content (str): The next piece of content.
+            attempt (int): The number of the attempt the content belongs to.
+        """
+        if attempt != self.attempt:
+            self.parser = QAPairParser(on_qa_pair=self.hand_out)
+            self.attempt = attempt
+        self.parser.feed(content)
+
+    def hand_out(self, pair: QAPair):
+        self.handed_out.add(get_key(pair))
+        self.on_qa_pair(pair)
+
+    def finish(self, response: Response):
+        """
+        Hand out the remaining QA pairs once the request is done.
+
+        The last pair of a stream is only complete at its end. Every pair of the response that was not streamed, for example because the response came from the cache or belongs to another choice, is handed out too.
+
+        Args:
+            response (Response): The final response of the request.
+        """
+        if (
+            self.parser is not None
+            and self.attempt == response.attempts
+            and response.qa_pairs
+        ):
+            self.parser.close()
+        for pair in response.qa_pairs:
+            if get_key(pair) not in self.handed_out:
+                self.hand_out(pair)
@@ -1,17 +1,85 @@
+import contextlib
+import copy
 import os
+import sys
+import time
 
-from typing import Optional, Tuple, Iterable, Union, List
+from typing import (
+    Any,
+    Callable,
+    Generator,
+    Optional,
+    Tuple,
+    Iterable,
+    Iterator,
+    Union,
+    List,
+    Dict,
+    AsyncIterator,
+)
 from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
 import syphus.data_generator.gpt_manager as gpt_manager
 import syphus.data_generator.openai_settings as openai_settings
 import syphus.data_generator.gpt_params_settings as gpt_params_settings
+import syphus.data_generator.rate_limiter as rate_limiter
+import syphus.data_generator.journal as journal
+import syphus.data_generator.cache as response_cache
+import syphus.data_generator.single_flight as single_flight
+import syphus.data_generator.batching as batching
+import syphus.data_generator.cascade as cascade
+import syphus.data_generator.requery as requery
 import syphus.data_generator.response as syphus_response
 import syphus.prompts.prompts as syphus_prompts
 
+from syphus.data_generator.concurrency import AIMDController
+from syphus.data_generator.cancellation import Cancellation, RunCancelledError
+from syphus.data_generator.metrics import Metrics
+from syphus.data_generator.scheduler import LongestJobFirst
 from syphus.data_generator.response import Response
+from syphus.data_generator.streaming import QAPairStream
+from syphus.prompts.example_selector import ExampleSelector
 from syphus.prompts.info import Info
+from syphus.prompts.qa_pair import QAPair
+from syphus.utils.pipeline import bounded_map, async_bounded_map, chunked
+
+
+class GPTCall(object):
+    """
+    A completion asked for by the steps of a query, sent with `query_gpt` or `aquery_gpt` of its manager.
+
+    Attributes:
+        manager (gpt_manager.GPTManager): The manager sending the request.
+        messages (List[Dict[str, str]]): The messages to send.
+        kwargs (Dict[str, Any]): The keyword arguments of `query_gpt`, such as the statistics of the request.
+    """
+
+    def __init__(
+        self,
+        manager: gpt_manager.GPTManager,
+        messages: List[Dict[str, str]],
+        **kwargs,
+    ):
+        self.manager = manager
+        self.messages = messages
+        self.kwargs = kwargs
+
+
+class InfoCall(object):
+    """
+    An info queried on its own by the steps of a query, with `query_single_info` or `aquery_single_info`.
+
+    Attributes:
+        info (Info): The info.
+    """
+
+    def __init__(self, info: Info):
+        self.info = info
+
+
+# The steps of a query: a generator yielding the calls it needs, sent the outcome of every call, and returning its result. The same steps are run by the thread based and the asyncio based query engines.
+QuerySteps = Generator[Union[GPTCall, InfoCall], Any, Any]
 
 
 class Syphus(object):
@@ -19,8 +87,17 @@ class Syphus(object):
     A class for managing interactions with the OpenAI GPT-3 engine and querying prompts for responses.
 
     Attributes:
-        gpt_manager (gpt_manager.GPTManager): An instance of GPTManager for managing GPT-3 interactions.
-        prompts (syphus.prompts.prompts.Prompts): An instance of Prompts containing conversation prompts and messages.
+        gpt_manager (gpt_manager.AsyncGPTManager): An instance of AsyncGPTManager for managing GPT-3 interactions, used by both the thread based and the asyncio based query engines.
+        prompts (syphus.prompts.prompts.Prompts): An instance of Prompts containing conversation prompts and messages. Assigning it compiles it again.
+        compiled_prompts (syphus.prompts.prompts.CompiledPrompts): The messages of the prompts, shared by every request. Changes made to the prompts in place are only picked up by assigning them again.
+        example_selector (Optional[ExampleSelector]): Selects the in-context examples of every request, None if all of them are sent.
+        cascade (Optional[cascade.Cascade]): Escalates infos whose response has a problem to stronger engines, None if there is no cascade.
+        requery_policy (Optional[requery.RequeryPolicy]): Asks infos again while the parser warns about their response, None if they are never asked again.
+        single_flight (Optional[single_flight.SingleFlight]): Coalesces identical requests in flight at the same time, None if coalescing is disabled.
+        on_qa_pair (Optional[Callable[[Info, QAPair], None]]): Called with every QA pair as soon as it is available, None if not needed.
+        batch_size (int): The number of infos sent in a single request by query_all_infos and aquery_all_infos.
+        metrics (Metrics): The time spent in every stage of the runs of this instance, the tokens used and the errors met.
+        cancellation (Cancellation): Stops the runs of this instance on a deadline or a signal.
 
     """
 
@@ -28,8 +105,21 @@ class Syphus(object):
         self,
         *,
         gpt_info_path: Optional[str] = None,
-        openai_api: Optional[openai_settings.OpenAISettings] = None,
+        openai_api: Optional[
+            Union[openai_settings.OpenAISettings, List[openai_settings.OpenAISettings]]
+        ] = None,
         gpt_params: Optional[gpt_params_settings.GPTParamsSettings] = None,
+        rate_limit: Optional[rate_limiter.RateLimitSettings] = None,
+        cache: Optional[response_cache.ResponseCache] = None,
+        coalesce: bool = True,
+        stream: bool = False,
+        on_qa_pair: Optional[Callable[[Info, QAPair], None]] = None,
+        batch_size: int = 1,
+        metrics: Optional[Metrics] = None,
+        cancellation: Optional[Cancellation] = None,
+        num_examples: Optional[int] = None,
+        cascade_settings: Optional[cascade.CascadeSettings] = None,
+        requery_settings: Optional[requery.RequerySettings] = None,
         prompts: Union[syphus_prompts.Prompts, str],
     ):
         """
@@ -37,112 +127,1035 @@ class Syphus(object):
 
         Args:
             gpt_info_path (str, optional): Path to a YAML file containing OpenAI API and GPT parameters settings.
-            openai_api (gpt_manager.OpenAISettings, optional): An instance of OpenAISettings containing OpenAI API settings.
+            openai_api (openai_settings.OpenAISettings or List[openai_settings.OpenAISettings], optional): The settings of one endpoint, or of several endpoints to balance requests over.
             gpt_params (gpt_manager.GPTParamsSettings, optional): An instance of GPTParamsSettings containing GPT-3 parameters settings.
+            rate_limit (rate_limiter.RateLimitSettings, optional): Requests and tokens per minute quotas shared by all workers.
+            cache (response_cache.ResponseCache, optional): A persistent response cache, so identical requests are only paid for once.
+            coalesce (bool, optional): Whether infos with identical messages in flight at the same time share a single request.
+            stream (bool, optional): Whether to stream completions, recording the time to first token and tokens per second of every request.
+            on_qa_pair (Callable[[Info, QAPair], None], optional): Called with the info and every QA pair of its response. When streaming, pairs are handed out while the completion is still being generated. Infos sharing a coalesced request are only notified once, for the info that sent it.
+            batch_size (int, optional): The number of infos sent in a single request, to share the system prompt and in-context examples between them. Infos missing from a batched completion are queried on their own. Defaults to 1.
+            metrics (Metrics, optional): Collects the metrics of the runs. Defaults to new metrics.
+            cancellation (Cancellation, optional): Stops the runs on a deadline or a signal. Defaults to runs without deadline.
+            num_examples (int, optional): The number of in-context examples sent with every request, selected among the examples of the prompts by similarity to the info. Defaults to sending all of them.
+            cascade_settings (cascade.CascadeSettings, optional): The stronger engines infos are escalated to when the response of the primary engine has a problem. Read from the `Cascade` section of gpt_info_path if not given.
+            requery_settings (requery.RequerySettings, optional): When infos whose response the parser warns about are asked again. Read from the `Requery` section of gpt_info_path if not given.
             prompts (Union[prompts.Prompts, str]): Either an instance of Prompts or a path to a YAML file containing conversation prompts and messages.
 
         """
-        self.gpt_manager = gpt_manager.GPTManager(
-            gpt_info_path=gpt_info_path, openai_api=openai_api, gpt_params=gpt_params
+        self.metrics = metrics if metrics else Metrics()
+        self.cancellation = cancellation if cancellation else Cancellation()
+        self.gpt_manager = gpt_manager.AsyncGPTManager(
+            gpt_info_path=gpt_info_path,
+            openai_api=openai_api,
+            gpt_params=gpt_params,
+            rate_limit=rate_limit,
+            cache=cache,
+            stream=stream,
+            metrics=self.metrics,
+            cancellation=self.cancellation,
+        )
+        if cascade_settings is None and gpt_info_path:
+            cascade_settings = cascade.read_yaml(gpt_info_path)
+        self.cascade = (
+            cascade.Cascade(cascade_settings, self.gpt_manager)
+            if cascade_settings is not None and cascade_settings.tiers
+            else None
+        )
+        if requery_settings is None and gpt_info_path:
+            requery_settings = requery.read_yaml(gpt_info_path)
+        self.requery_policy = (
+            requery.RequeryPolicy(requery_settings)
+            if requery_settings is not None and requery_settings.max_requeries
+            else None
         )
+        self.on_qa_pair = on_qa_pair
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.batch_size = batch_size
+        self.num_examples = num_examples
         if isinstance(prompts, str):
             self.prompts = syphus_prompts.read_yaml(prompts)
         elif isinstance(prompts, syphus_prompts.Prompts):
             self.prompts = prompts
         else:
             raise ValueError("Must provide either prompts yaml path or prompts object")
+        self.single_flight = single_flight.SingleFlight() if coalesce else None
 
-    def query_single_info(self, info: Info) -> Response:
+    @property
+    def prompts(self) -> syphus_prompts.Prompts:
+        return self._prompts
+
+    @prompts.setter
+    def prompts(self, prompts: syphus_prompts.Prompts):
+        # Compiled once, so requests only build and encode the user message of their info.
+        self._prompts = prompts
+        self.compiled_prompts = prompts.compile()
+        self.example_selector = (
+            ExampleSelector(prompts, self.num_examples)
+            if self.num_examples is not None
+            and self.num_examples < len(prompts.in_context_examples)
+            else None
+        )
+
+    def get_content_messages(self, content: str) -> List[Dict[str, str]]:
         """
-        Generate a response from the GPT-3 engine based on the provided Info object.
+        Build the messages of a request from the content of its user message.
+
+        Args:
+            content (str): The content of the user message.
+
+        Returns:
+            List[Dict[str, str]]: The prompt messages, with the selected in-context examples if examples are selected, followed by the user message.
+
+        """
+        if self.example_selector is not None:
+            return self.example_selector.get_messages(content)
+        return self.compiled_prompts.get_messages(content)
+
+    def get_messages(self, info: Info) -> List[Dict[str, str]]:
+        """
+        Build the messages sent to the GPT-3 engine for the provided Info object.
 
         Args:
             info (Info): An instance of Info containing information for generating the response.
 
         Returns:
-            Response: An instance of Response containing the generated response or error messages.
+            List[Dict[str, str]]: The prompt messages followed by the user message holding the info content.
+
+        """
+        return self.get_content_messages(info.content)
+
+    def get_batch_messages(self, infos: List[Info]) -> List[Dict[str, str]]:
+        """
+        Build the messages asking for the responses of several infos in a single request.
+
+        Args:
+            infos (List[Info]): The infos of the batch, with unique IDs.
+
+        Returns:
+            List[Dict[str, str]]: The prompt messages followed by one user message holding every info under its delimiter.
+
+        """
+        return self.get_content_messages(batching.get_batch_content(infos))
+
+    def get_qa_pair_callback(self, info: Info) -> Optional[Callable[[QAPair], None]]:
+        """
+        Bind `on_qa_pair` to an info.
+
+        Args:
+            info (Info): The info being queried.
+
+        Returns:
+            Optional[Callable[[QAPair], None]]: The callback receiving the QA pairs of the info, None if `on_qa_pair` is not set.
+
+        """
+        if self.on_qa_pair is None:
+            return None
+        return lambda pair: self.on_qa_pair(info, pair)
 
+    def query_messages_steps(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        on_qa_pair: Optional[Callable[[QAPair], None]] = None,
+        manager: Optional[gpt_manager.GPTManager] = None,
+        use_cache: bool = True,
+    ) -> QuerySteps:
         """
-        messages = self.prompts.get_messages()
-        messages.append({"role": "user", "content": info.content})
+        The steps generating a response from the GPT-3 engine for already built messages.
+
+        Args:
+            messages (List[Dict[str, str]]): The messages to send.
+            on_qa_pair (Optional[Callable[[QAPair], None]]): Called with every QA pair of the response, as soon as it is complete when streaming.
+            manager (Optional[gpt_manager.GPTManager]): The manager sending the request, e.g. of a cascade tier. Defaults to gpt_manager.
+            use_cache (bool, optional): Whether to look up and store the response in the response cache. Defaults to True.
+
+        Returns:
+            QuerySteps: The steps, returning a Response containing the generated response or error messages.
+
+        """
+        if manager is None:
+            manager = self.gpt_manager
+        stats = {}
+        qa_pair_stream = QAPairStream(on_qa_pair) if on_qa_pair else None
+        gpt_response = None
+        error = None
         try:
-            gpt_response = self.gpt_manager.query_gpt(messages)
-            response = Response(gpt_response=gpt_response)
+            gpt_response = yield GPTCall(
+                manager,
+                messages,
+                stats=stats,
+                use_cache=use_cache,
+                on_delta=qa_pair_stream.feed if qa_pair_stream else None,
+            )
+            with self.metrics.time("parse"):
+                response = Response(gpt_response=gpt_response, stats=stats)
         except Exception as e:
-            response = Response(gpt_error_messages=str(e))
+            error = e
+            if isinstance(e, RunCancelledError):
+                stats["cancelled"] = True
+            response = Response(gpt_error_messages=str(e), stats=stats)
+        self.metrics.record_request(
+            stats, gpt_response.get("usage") if gpt_response else None, error
+        )
+        if qa_pair_stream is not None:
+            qa_pair_stream.finish(response)
+        return response
+
+    def requery_steps(
+        self,
+        messages: List[Dict[str, str]],
+        response: Response,
+        *,
+        manager: Optional[gpt_manager.GPTManager] = None,
+    ) -> QuerySteps:
+        """
+        The steps re-asking the engine for an info while the parser warns about its response, following the requery policy.
+
+        Args:
+            messages (List[Dict[str, str]]): The messages the response was generated for.
+            response (Response): The response.
+            manager (Optional[gpt_manager.GPTManager]): The manager that generated the response and sends the requeries. Defaults to gpt_manager.
+
+        Returns:
+            QuerySteps: The steps, returning the final response.
+
+        """
+        if self.requery_policy is None:
+            return response
+        requeries = 0
+        problems = self.requery_policy.get_problems(response)
+        while problems and requeries < self.requery_policy.settings.max_requeries:
+            self.requery_policy.record(problems)
+            requeried = yield from self.query_messages_steps(
+                self.requery_policy.get_messages(messages, response, problems),
+                manager=manager,
+                use_cache=self.requery_policy.settings.feedback,
+            )
+            requeries += 1
+            response = self.requery_policy.choose(response, requeried)
+            problems = self.requery_policy.get_problems(response)
+        self.requery_policy.finish(response, requeries, problems)
         return response
 
+    def refine_steps(
+        self,
+        messages: List[Dict[str, str]],
+        response: Response,
+        *,
+        on_qa_pair: Optional[Callable[[QAPair], None]] = None,
+    ) -> QuerySteps:
+        """
+        The steps re-asking the engine for a response of the primary engine if the parser warns about it, then escalating it through the tiers of the cascade as long as it has a problem.
+
+        Args:
+            messages (List[Dict[str, str]]): The messages the response was generated for.
+            response (Response): The response of the primary engine.
+            on_qa_pair (Optional[Callable[[QAPair], None]]): Called with every QA pair of the final response.
+
+        Returns:
+            QuerySteps: The steps, returning the final response.
+
+        """
+        response = yield from self.requery_steps(messages, response)
+        if self.cascade is not None:
+            tier = 0
+            problem = self.cascade.record(tier, response)
+            while problem is not None:
+                manager = self.cascade.managers[tier + 1]
+                escalated = yield from self.query_messages_steps(
+                    messages, manager=manager
+                )
+                escalated = yield from self.requery_steps(
+                    messages, escalated, manager=manager
+                )
+                next_problem = self.cascade.record(tier + 1, escalated)
+                response = self.cascade.choose(tier, response, escalated, problem)
+                tier, problem = tier + 1, next_problem
+        if on_qa_pair is not None:
+            for pair in response.qa_pairs:
+                on_qa_pair(pair)
+        return response
+
+    def query_refined_steps(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        on_qa_pair: Optional[Callable[[QAPair], None]] = None,
+    ) -> QuerySteps:
+        """
+        The steps generating a response for already built messages, asked again and escalated through the cascade if needed.
+
+        With a requery policy or a cascade, QA pairs are only handed out once the final response is known, even when streaming.
+
+        Args:
+            messages (List[Dict[str, str]]): The messages to send.
+            on_qa_pair (Optional[Callable[[QAPair], None]]): Called with every QA pair of the final response.
+
+        Returns:
+            QuerySteps: The steps, returning a Response containing the generated response or error messages.
+
+        """
+        if not self.refines:
+            return (
+                yield from self.query_messages_steps(messages, on_qa_pair=on_qa_pair)
+            )
+        response = yield from self.query_messages_steps(messages)
+        return (yield from self.refine_steps(messages, response, on_qa_pair=on_qa_pair))
+
+    def get_single_info_query(self, info: Info) -> Tuple[Optional[str], QuerySteps]:
+        """
+        Build the steps querying a single info, and the key coalescing it with identical infos in flight.
+
+        Args:
+            info (Info): An instance of Info containing information for generating the response.
+
+        Returns:
+            Tuple[Optional[str], QuerySteps]: The coalescing key, None if coalescing is disabled, and the steps returning the response of the info.
+
+        """
+        with self.metrics.time("prompt"):
+            messages = self.get_messages(info)
+        steps = self.query_refined_steps(
+            messages, on_qa_pair=self.get_qa_pair_callback(info)
+        )
+        if self.single_flight is None:
+            return None, steps
+        return self.gpt_manager.get_cache_key(messages), steps
+
+    def split_batch(
+        self,
+        infos: List[Info],
+        gpt_response: Optional[Dict],
+        stats: Dict,
+    ) -> Tuple[List[Tuple[str, Response]], List[Info]]:
+        """
+        Split the completion of a batch into the responses of its infos.
+
+        Args:
+            infos (List[Info]): The infos of the batch.
+            gpt_response (Optional[Dict]): The completion of the batch, None if the request failed.
+            stats (Dict): The statistics of the batch request, copied to every response.
+
+        Returns:
+            Tuple[List[Tuple[str, Response]], List[Info]]: The responses of the infos found in the completion, and the infos missing from it, to be queried on their own.
+
+        """
+        try:
+            sections = (
+                batching.split_batch_response(gpt_response, [info.id for info in infos])
+                if gpt_response is not None
+                else {}
+            )
+        except (KeyError, IndexError, TypeError):
+            sections = {}
+        results = []
+        missing = []
+        for info in infos:
+            if str(info.id) not in sections:
+                missing.append(info)
+                continue
+            response = Response(
+                gpt_response=sections[str(info.id)],
+                stats={**stats, "batch_size": len(infos)},
+            )
+            on_qa_pair = self.get_qa_pair_callback(info)
+            if on_qa_pair is not None and not self.refines:
+                for pair in response.qa_pairs:
+                    on_qa_pair(pair)
+            results.append((info.id, response))
+        if missing:
+            print(
+                f"Infos {', '.join(str(info.id) for info in missing)} missing from a batched response, querying them on their own",
+                file=sys.stderr,
+            )
+        return results, missing
+
+    def add_batch_warning(self, response: Response) -> Response:
+        """
+        Record in the warnings of a response that its info had to be queried on its own.
+
+        The response may be shared with other infos coalesced with this one, so it is left unchanged.
+
+        Args:
+            response (Response): The response of the info.
+
+        Returns:
+            Response: A copy of the response with the warning added.
+
+        """
+        response = copy.copy(response)
+        response.warning_message = [
+            "Missing from the batched response, queried on its own."
+        ] + response.warning_message
+        return response
+
+    def query_batch_steps(self, infos: List[Info]) -> QuerySteps:
+        """
+        The steps generating the responses of several infos with a single request.
+
+        Args:
+            infos (List[Info]): The infos of the batch, with unique IDs.
+
+        Returns:
+            QuerySteps: The steps, returning the Info ID and the response of every info. Infos missing from the batched completion, or all of them if the request failed, are queried on their own.
+
+        """
+        if len(infos) == 1:
+            return [(infos[0].id, (yield InfoCall(infos[0])))]
+        stats = {}
+        with self.metrics.time("prompt"):
+            messages = self.get_batch_messages(infos)
+        try:
+            gpt_response = yield GPTCall(self.gpt_manager, messages, stats=stats)
+            self.metrics.record_request(stats, gpt_response.get("usage"))
+        except Exception as e:
+            print(f"Batched request failed: {e}", file=sys.stderr)
+            self.metrics.record_request(stats, error=e)
+            gpt_response = None
+        with self.metrics.time("parse"):
+            results, missing = self.split_batch(infos, gpt_response, stats)
+        if self.refines:
+            infos_by_id = {info.id: info for info in infos}
+            refined = []
+            for id, response in results:
+                response = yield from self.refine_steps(
+                    self.get_messages(infos_by_id[id]),
+                    response,
+                    on_qa_pair=self.get_qa_pair_callback(infos_by_id[id]),
+                )
+                refined.append((id, response))
+            results = refined
+        for info in missing:
+            response = yield InfoCall(info)
+            results.append((info.id, self.add_batch_warning(response)))
+        return results
+
+    def query_scheduled_batch_steps(
+        self,
+        item: Tuple[List[Info], float],
+        controller: Optional[AIMDController],
+        scheduler: Optional[LongestJobFirst],
+    ) -> QuerySteps:
+        """
+        The steps querying a batch of a run, feeding its latency to the controller and its responses to the scheduler.
+
+        Args:
+            item (Tuple[List[Info], float]): The batch and the monotonic time it was pulled, as produced by get_batches.
+            controller (Optional[AIMDController]): The adaptive concurrency controller, or None if concurrency is fixed.
+            scheduler (Optional[LongestJobFirst]): The scheduler ordering the infos, or None.
+
+        Returns:
+            QuerySteps: The steps, returning the Info ID and the response of every info of the batch.
+
+        """
+        batch, submit_time = item
+        start = time.monotonic()
+        self.metrics.observe("queue", start - submit_time)
+        results = yield from self.query_batch_steps(batch)
+        self.record_latency(controller, results[0][1], time.monotonic() - start)
+        if scheduler is not None:
+            for id, response in results:
+                scheduler.record(id, response)
+        return results
+
+    def run_steps(self, steps: QuerySteps) -> Any:
+        """
+        Run the steps of a query, sending the calls they ask for from the current thread.
+
+        The error of a call is raised inside the steps, which may handle it.
+
+        Args:
+            steps (QuerySteps): The steps.
+
+        Returns:
+            Any: The value returned by the steps.
+
+        """
+        outcome, error = None, None
+        while True:
+            try:
+                call = steps.send(outcome) if error is None else steps.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            outcome, error = None, None
+            try:
+                if isinstance(call, InfoCall):
+                    outcome = self.query_single_info(call.info)
+                else:
+                    outcome = call.manager.query_gpt(call.messages, **call.kwargs)
+            except Exception as e:
+                error = e
+
+    def query_single_info(self, info: Info) -> Response:
+        """
+        Generate a response from the GPT-3 engine based on the provided Info object.
+
+        If coalescing is enabled and another info with identical messages is in flight, its response is shared instead of sending a second request.
+
+        Args:
+            info (Info): An instance of Info containing information for generating the response.
+
+        Returns:
+            Response: An instance of Response containing the generated response or error messages.
+
+        """
+        key, steps = self.get_single_info_query(info)
+        if key is None:
+            return self.run_steps(steps)
+        return self.single_flight.do(key, lambda: self.run_steps(steps))
+
+    def query_batch(self, infos: List[Info]) -> List[Tuple[str, Response]]:
+        """
+        Generate the responses of several infos with a single request.
+
+        Args:
+            infos (List[Info]): The infos of the batch, with unique IDs.
+
+        Returns:
+            List[Tuple[str, Response]]: The Info ID and the response of every info. Infos missing from the batched completion, or all of them if the request failed, are queried on their own.
+
+        """
+        return self.run_steps(self.query_batch_steps(infos))
+
+    def get_batches(
+        self, infos: Iterable[Info], scheduler: Optional[LongestJobFirst] = None
+    ) -> Iterator[Tuple[List[Info], float]]:
+        """
+        Group infos into the batches of the query engines, timing how long the infos take to load and render. No batch is produced once the run is stopped.
+
+        Args:
+            infos (Iterable[Info]): The infos.
+            scheduler (Optional[LongestJobFirst], optional): If given, reorders the infos before they are grouped.
+
+        Yields:
+            Tuple[List[Info], float]: The batches, of `batch_size` infos, and the monotonic time they were pulled, to measure how long they wait for a worker.
+
+        """
+        infos = self.metrics.time_iter(infos, "render")
+        if scheduler is not None:
+            infos = scheduler.schedule(infos)
+        for batch in chunked(infos, self.batch_size):
+            if self.cancellation.stopped:
+                return
+            yield batch, time.monotonic()
+
+    def record_latency(
+        self, controller: Optional[AIMDController], response: Response, latency: float
+    ):
+        """
+        Feed the latency and overload signal of a completed request to an adaptive concurrency controller.
+
+        Responses served from the cache say nothing about the server and are ignored.
+
+        Args:
+            controller (Optional[AIMDController]): The controller, or None if concurrency is fixed.
+            response (Response): The response of the request.
+            latency (float): The time the request took in seconds.
+
+        """
+        if controller is None or response.stats.get("cached"):
+            return
+        controller.record(latency, overloaded=response.stats.get("overloaded", False))
+
+    def report_coalesced(self, saved_before: int):
+        """
+        Print how many requests coalescing saved since `saved_before` was read.
+
+        Args:
+            saved_before (int): The value of `single_flight.saved` at the start of the run.
+
+        """
+        if self.single_flight is None:
+            return
+        saved = self.single_flight.saved - saved_before
+        if saved:
+            print(
+                f"Coalesced {saved} duplicate requests into in-flight ones",
+                file=sys.stderr,
+            )
+
+    @property
+    def refines(self) -> bool:
+        """
+        Whether responses may be asked again or escalated once generated.
+
+        Returns:
+            bool: True if there is a requery policy or a cascade.
+
+        """
+        return self.requery_policy is not None or self.cascade is not None
+
+    def set_pool_size(self, pool_size: int):
+        """
+        Size the connection pool of every endpoint, of every tier of the cascade if there is one.
+
+        Args:
+            pool_size (int): The number of connections per endpoint.
+
+        """
+        if self.cascade is None:
+            self.gpt_manager.set_pool_size(pool_size)
+        else:
+            self.cascade.set_pool_size(pool_size)
+
+    async def aclose_clients(self):
+        """
+        Close the async clients created on the running event loop, of every tier of the cascade if there is one, so that their connections do not outlive the loop.
+
+        """
+        managers = [self.gpt_manager] if self.cascade is None else self.cascade.managers
+        for manager in managers:
+            await manager.load_balancer.aclose()
+
+    def report_refined(self):
+        """
+        Print the requery counters and the hit rate of every tier of the cascade, if there are any.
+
+        """
+        if self.requery_policy is not None:
+            print(self.requery_policy.report(), file=sys.stderr)
+        if self.cascade is not None:
+            print(self.cascade.report(), file=sys.stderr)
+
+    def report_cancelled(self, cancelled: int):
+        """
+        Print why a run stopped early, if it did.
+
+        Args:
+            cancelled (int): The number of infos in flight whose requests were cancelled.
+
+        """
+        if self.cancellation.reason is None:
+            return
+        print(
+            f"Run stopped early ({self.cancellation.reason}), {cancelled} infos in flight were cancelled. The results completed so far are saved, resume the run to query the others.",
+            file=sys.stderr,
+        )
+
+    def update_progress(
+        self,
+        progress_bar: tqdm,
+        results: List[Tuple[str, Response]],
+        controller: Optional[AIMDController],
+    ):
+        """
+        Advance the progress bar of a run by the infos of a completed batch.
+
+        Args:
+            progress_bar (tqdm): The progress bar.
+            results (List[Tuple[str, Response]]): The responses of the batch.
+            controller (Optional[AIMDController]): The adaptive concurrency controller, whose limit is shown, or None if concurrency is fixed.
+
+        """
+        progress_bar.update(len(results))
+        if controller is not None:
+            progress_bar.set_postfix(limit=controller.limit, refresh=False)
+
     def query_all_infos(
-        self, infos: Iterable[Info], *, num_threads: int = 4
-    ) -> Iterable[Tuple[str, Optional[Response], Optional[str]]]:
+        self,
+        infos: Iterable[Info],
+        *,
+        num_threads: int = 4,
+        max_in_flight: Optional[int] = None,
+        ordered: bool = True,
+        controller: Optional[AIMDController] = None,
+        scheduler: Optional[LongestJobFirst] = None,
+    ) -> Iterator[Tuple[str, Response]]:
         """
         Generate responses for multiple Info objects using multiple threads.
 
+        Infos are pulled from `infos` lazily and at most `max_in_flight` of them are in the pipeline at any time, so `infos` may be an iterator of any length.
+
+        With a `batch_size` larger than 1, infos are grouped into batches sent as single requests, and `max_in_flight` counts batches.
+
         Args:
             infos (Iterable[Info]): An iterable containing Info objects to generate responses for.
             num_threads (int, optional): Number of threads to use for concurrent response generation.
+            max_in_flight (Optional[int], optional): Maximum number of infos submitted but not yet yielded. Defaults to twice num_threads.
+            ordered (bool, optional): Whether to yield responses in input order. If False, responses are yielded as soon as they complete, so one slow request does not hold back the others.
+            controller (Optional[AIMDController], optional): If given, the number of requests in flight is adapted by the controller between its bounds instead of being fixed, and num_threads and max_in_flight are ignored.
+            scheduler (Optional[LongestJobFirst], optional): If given, infos are sent in the order of the scheduler, most expensive first, and input order means scheduled order.
 
         Yields:
-            Tuple[str, Optional[Response], Optional[str]]: A tuple containing the Info ID, response, and error message (if any).
+            Tuple[str, Response]: A tuple containing the Info ID and its response.
 
         """
+        if controller is not None:
+            num_threads = controller.max_limit
+            max_in_flight = lambda: controller.limit
+        elif max_in_flight is None:
+            max_in_flight = 2 * num_threads
+        self.set_pool_size(num_threads)
+
+        def query(item: Tuple[List[Info], float]) -> List[Tuple[str, Response]]:
+            return self.run_steps(
+                self.query_scheduled_batch_steps(item, controller, scheduler)
+            )
+
+        total = len(infos) if hasattr(infos, "__len__") else None
+        saved_before = self.single_flight.saved if self.single_flight else 0
         with ThreadPoolExecutor(max_workers=num_threads) as executor:
-            with tqdm(total=len(infos), desc="Querying GPT") as progress_bar:
-                for id, response in executor.map(
-                    lambda info: (info.id, self.query_single_info(info)), infos
+            with tqdm(total=total, desc="Querying GPT") as progress_bar:
+                for results in bounded_map(
+                    query,
+                    self.get_batches(infos, scheduler),
+                    executor=executor,
+                    max_in_flight=max_in_flight,
+                    ordered=ordered,
                 ):
-                    yield id, response
-                    progress_bar.update(1)
+                    yield from results
+                    self.update_progress(progress_bar, results, controller)
+        self.report_coalesced(saved_before)
+        self.report_refined()
+
+    def skip_finished_infos(
+        self, infos: Iterable[Info], path: str
+    ) -> Tuple[Iterable[Info], Dict[str, Response]]:
+        """
+        Load the journal of a previous run in `path` and drop the infos it already finished.
+
+        Infos whose last recorded response is an error, e.g. because their retries ran out during an outage, are not finished and are queried again.
+
+        Args:
+            infos (Iterable[Info]): The infos of the run.
+            path (str): The output folder of the run.
+
+        Returns:
+            Tuple[Iterable[Info], Dict[str, Response]]: The infos still to query, and the finished responses keyed by Info ID.
+
+        """
+        recorded = journal.load(path)
+        finished = {
+            id: response
+            for id, response in recorded.items()
+            if "error" not in response.full_response
+        }
+        if not recorded:
+            return infos, finished
+        print(
+            f"Resuming from {path}, skipping {len(finished)} finished infos and querying {len(recorded) - len(finished)} failed ones again",
+            file=sys.stderr,
+        )
+        return (info for info in infos if info.id not in finished), finished
+
+    def start_save(
+        self, infos: Iterable[Info], path: str, format: str, resume: bool
+    ) -> Tuple[Iterable[Info], Dict[str, Response]]:
+        """
+        Check the output format of a run and, when resuming, drop the infos the journal in `path` already finished.
+
+        Args:
+            infos (Iterable[Info]): The infos of the run.
+            path (str): The output folder of the run.
+            format (str): The output file format.
+            resume (bool): Whether to skip the infos already finished.
+
+        Returns:
+            Tuple[Iterable[Info], Dict[str, Response]]: The infos still to query, and the finished responses keyed by Info ID.
+
+        Raises:
+            ValueError: If an invalid format is provided.
+
+        """
+        if format not in ["json", "yaml", "jsonl"]:
+            raise ValueError("Invalid format, must be json, yaml, or jsonl")
+        if resume:
+            return self.skip_finished_infos(infos, path)
+        return infos, {}
+
+    @contextlib.contextmanager
+    def save_responses(
+        self,
+        path: str,
+        data: Dict[str, Response],
+        *,
+        split: bool,
+        on_response: Optional[Callable[[str, Response], None]],
+        **save_kwargs,
+    ) -> Iterator[Callable[[str, Response], None]]:
+        """
+        Save the responses of a run as they arrive. Once the run ends, even if it fails, the responses kept in `data` are saved, the run is reported and its metrics are written.
+
+        Args:
+            path (str): The output folder of the run.
+            data (Dict[str, Response]): The responses saved together at the end, keyed by Info ID, e.g. the ones of the run being resumed.
+            split (bool): Whether to save every response in its own folder as soon as it arrives, rather than in `data`.
+            on_response (Optional[Callable[[str, Response], None]]): Called with the Info ID and the response of every info once it is recorded.
+            **save_kwargs: The format and file names the responses are saved with.
+
+        Yields:
+            Callable[[str, Response], None]: Records the response of an info in the journal and saves it, unless its request was cancelled.
+
+        """
+        cancelled = 0
+
+        def save(id: str, response: Response):
+            nonlocal cancelled
+            if response.stats.get("cancelled"):
+                cancelled += 1
+                return
+            with self.metrics.time("write"):
+                if split:
+                    response.save(os.path.join(path, id), **save_kwargs)
+                else:
+                    data[id] = response
+                run_journal.record(id, response)
+            if on_response is not None:
+                on_response(id, response)
+
+        try:
+            with journal.Journal(path) as run_journal:
+                yield save
+        finally:
+            if not split:
+                with self.metrics.time("write"):
+                    syphus_response.save_all(data, path, **save_kwargs)
+            self.report_cancelled(cancelled)
+            self.metrics.save(path)
 
     def query_all_infos_and_save(
         self,
-        infos: List[Info],
+        infos: Iterable[Info],
         path,
         *,
         num_threads: int = 4,
+        max_in_flight: Optional[int] = None,
+        ordered: bool = False,
+        controller: Optional[AIMDController] = None,
+        scheduler: Optional[LongestJobFirst] = None,
         format: str = "json",
         response_file_name: str = "responses",
         error_message_file_name: str = "error_messages",
         full_response_file_name: str = "gpt_full_responses",
         split: bool = True,
+        resume: bool = False,
+        on_response: Optional[Callable[[str, Response], None]] = None,
     ):
         """
         Generate responses for multiple Info objects, save them to files, and manage different output formats.
 
         Args:
-            infos (List[Info]): An iterable containing Info objects to generate responses for.
+            infos (Iterable[Info]): An iterable containing Info objects to generate responses for.
             path (str): Path to the directory where the response files will be saved.
             num_threads (int, optional): Number of threads to use for concurrent response generation.
+            max_in_flight (Optional[int], optional): Maximum number of infos submitted but not yet saved. Defaults to twice num_threads.
+            ordered (bool, optional): Whether to save responses in input order rather than completion order.
+            controller (Optional[AIMDController], optional): If given, the number of requests in flight is adapted by the controller instead of being fixed.
+            scheduler (Optional[LongestJobFirst], optional): If given, infos are sent in the order of the scheduler, most expensive first.
             format (str, optional): Output file format (json, yaml, or jsonl).
             response_file_name (str, optional): Name of the response file.
             error_message_file_name (str, optional): Name of the error message file.
             full_response_file_name (str, optional): Name of the full response file.
             split (bool, optional): Whether to split the responses into separate files.
+            resume (bool, optional): Whether to skip the infos already finished according to the journal in `path`.
+            on_response (Optional[Callable[[str, Response], None]], optional): Called with the Info ID and the response of every info once it is recorded, e.g. to collect statistics.
+
+        Note:
+            Every completed response is also appended to a journal in `path` as soon as it arrives, so an interrupted run can be resumed with `resume=True`. The metrics of the run are written to `metrics.json` and `metrics.prom` in `path` at the end, even if the run fails.
 
         Raises:
             ValueError: If an invalid output type or format is provided.
 
         """
-        if format not in ["json", "yaml", "jsonl"]:
-            raise ValueError("Invalid format, must be json, yaml, or jsonl")
-        if split:
-            for id, response in self.query_all_infos(infos, num_threads=num_threads):
-                response.save(
-                    os.path.join(path, id),
-                    format=format,
-                    response_file_name=response_file_name,
-                    error_message_file_name=error_message_file_name,
-                    full_response_file_name=full_response_file_name,
-                )
-        else:
-            data = {}
-            for id, response in self.query_all_infos(infos, num_threads=num_threads):
-                data[id] = response
-            syphus_response.save_all(
-                data,
-                path,
-                format=format,
-                response_file_name=response_file_name,
-                error_message_file_name=error_message_file_name,
-                full_response_file_name=full_response_file_name,
+        infos, data = self.start_save(infos, path, format, resume)
+        with self.save_responses(
+            path,
+            data,
+            split=split,
+            on_response=on_response,
+            format=format,
+            response_file_name=response_file_name,
+            error_message_file_name=error_message_file_name,
+            full_response_file_name=full_response_file_name,
+        ) as save:
+            for id, response in self.query_all_infos(
+                infos,
+                num_threads=num_threads,
+                max_in_flight=max_in_flight,
+                ordered=ordered,
+                controller=controller,
+                scheduler=scheduler,
+            ):
+                save(id, response)
+
+    async def arun_steps(self, steps: QuerySteps) -> Any:
+        """
+        Run the steps of a query, awaiting the calls they ask for on the current event loop.
+
+        The error of a call is raised inside the steps, which may handle it.
+
+        Args:
+            steps (QuerySteps): The steps.
+
+        Returns:
+            Any: The value returned by the steps.
+
+        """
+        outcome, error = None, None
+        while True:
+            try:
+                call = steps.send(outcome) if error is None else steps.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            outcome, error = None, None
+            try:
+                if isinstance(call, InfoCall):
+                    outcome = await self.aquery_single_info(call.info)
+                else:
+                    outcome = await call.manager.aquery_gpt(
+                        call.messages, **call.kwargs
+                    )
+            except Exception as e:
+                error = e
+
+    async def aquery_single_info(self, info: Info) -> Response:
+        """
+        Asynchronously generate a response from the GPT-3 engine based on the provided Info object.
+
+        If coalescing is enabled and another info with identical messages is in flight, its response is shared instead of sending a second request.
+
+        Args:
+            info (Info): An instance of Info containing information for generating the response.
+
+        Returns:
+            Response: An instance of Response containing the generated response or error messages.
+
+        """
+        key, steps = self.get_single_info_query(info)
+        if key is None:
+            return await self.arun_steps(steps)
+        return await self.single_flight.ado(key, lambda: self.arun_steps(steps))
+
+    async def aquery_batch(self, infos: List[Info]) -> List[Tuple[str, Response]]:
+        """
+        Asynchronously generate the responses of several infos with a single request.
+
+        Args:
+            infos (List[Info]): The infos of the batch, with unique IDs.
+
+        Returns:
+            List[Tuple[str, Response]]: The Info ID and the response of every info. Infos missing from the batched completion, or all of them if the request failed, are queried on their own.
+
+        """
+        return await self.arun_steps(self.query_batch_steps(infos))
+
+    async def aquery_all_infos(
+        self,
+        infos: Iterable[Info],
+        *,
+        max_concurrency: int = 256,
+        ordered: bool = False,
+        controller: Optional[AIMDController] = None,
+        scheduler: Optional[LongestJobFirst] = None,
+    ) -> AsyncIterator[Tuple[str, Response]]:
+        """
+        Generate responses for multiple Info objects concurrently from a single asyncio event loop.
+
+        At most `max_concurrency` requests are in flight at any time, and infos are only pulled from `infos` when a slot is free, so `infos` may be a lazy iterator.
+
+        With a `batch_size` larger than 1, infos are grouped into batches sent as single requests.
+
+        Args:
+            infos (Iterable[Info]): An iterable containing Info objects to generate responses for.
+            max_concurrency (int, optional): Maximum number of requests in flight at once.
+            ordered (bool, optional): Whether to yield responses in input order rather than completion order.
+            controller (Optional[AIMDController], optional): If given, the number of requests in flight is adapted by the controller between its bounds instead of being fixed, and max_concurrency is ignored.
+            scheduler (Optional[LongestJobFirst], optional): If given, infos are sent in the order of the scheduler, most expensive first, and input order means scheduled order.
+
+        Yields:
+            Tuple[str, Response]: A tuple containing the Info ID and its response.
+
+        """
+
+        async def query(item: Tuple[List[Info], float]) -> List[Tuple[str, Response]]:
+            return await self.arun_steps(
+                self.query_scheduled_batch_steps(item, controller, scheduler)
             )
+
+        max_in_flight = (
+            max_concurrency if controller is None else lambda: controller.limit
+        )
+        self.set_pool_size(
+            max_concurrency if controller is None else controller.max_limit
+        )
+        total = len(infos) if hasattr(infos, "__len__") else None
+        saved_before = self.single_flight.saved if self.single_flight else 0
+        try:
+            with tqdm(total=total, desc="Querying GPT") as progress_bar:
+                async for results in async_bounded_map(
+                    query,
+                    self.get_batches(infos, scheduler),
+                    max_in_flight=max_in_flight,
+                    ordered=ordered,
+                ):
+                    for id, response in results:
+                        yield id, response
+                    self.update_progress(progress_bar, results, controller)
+        finally:
+            await self.aclose_clients()
+        self.report_coalesced(saved_before)
+        self.report_refined()
+
+    async def aquery_all_infos_and_save(
+        self,
+        infos: Iterable[Info],
+        path,
+        *,
+        max_concurrency: int = 256,
+        ordered: bool = False,
+        controller: Optional[AIMDController] = None,
+        scheduler: Optional[LongestJobFirst] = None,
+        format: str = "json",
+        response_file_name: str = "responses",
+        error_message_file_name: str = "error_messages",
+        full_response_file_name: str = "gpt_full_responses",
+        split: bool = True,
+        resume: bool = False,
+        on_response: Optional[Callable[[str, Response], None]] = None,
+    ):
+        """
+        Asynchronously generate responses for multiple Info objects and save them to files.
+
+        Args:
+            infos (Iterable[Info]): An iterable containing Info objects to generate responses for.
+            path (str): Path to the directory where the response files will be saved.
+            max_concurrency (int, optional): Maximum number of requests in flight at once.
+            ordered (bool, optional): Whether to save responses in input order rather than completion order.
+            controller (Optional[AIMDController], optional): If given, the number of requests in flight is adapted by the controller instead of being fixed.
+            scheduler (Optional[LongestJobFirst], optional): If given, infos are sent in the order of the scheduler, most expensive first.
+            format (str, optional): Output file format (json, yaml, or jsonl).
+            response_file_name (str, optional): Name of the response file.
+            error_message_file_name (str, optional): Name of the error message file.
+            full_response_file_name (str, optional): Name of the full response file.
+            split (bool, optional): Whether to split the responses into separate files.
+            resume (bool, optional): Whether to skip the infos already finished according to the journal in `path`.
+            on_response (Optional[Callable[[str, Response], None]], optional): Called with the Info ID and the response of every info once it is recorded, e.g. to collect statistics.
+
+        Note:
+            Every completed response is also appended to a journal in `path` as soon as it arrives, so an interrupted run can be resumed with `resume=True`. The metrics of the run are written to `metrics.json` and `metrics.prom` in `path` at the end, even if the run fails.
+
+        Raises:
+            ValueError: If an invalid output type or format is provided.
+
+        """
+        infos, data = self.start_save(infos, path, format, resume)
+        with self.save_responses(
+            path,
+            data,
+            split=split,
+            on_response=on_response,
+            format=format,
+            response_file_name=response_file_name,
+            error_message_file_name=error_message_file_name,
+            full_response_file_name=full_response_file_name,
+        ) as save:
+            async for id, response in self.aquery_all_infos(
+                infos,
+                max_concurrency=max_concurrency,
+                ordered=ordered,
+                controller=controller,
+                scheduler=scheduler,
+            ):
+                save(id, response)
@@ -0,0 +1,229 @@
+import syphus.utils.yaml as yaml
+
+from syphus.utils.settings import Settings
+from syphus.utils.tokens import TokenCounter
+from typing import Optional, List, Dict, Tuple, Any
+
+POLICIES = ("truncate", "reject")
+
+# Context windows of known models. A name matches the model of that name and its versions, such as dated snapshots, and the longest matching name wins.
+CONTEXT_WINDOWS = [
+    ("gpt-5", 400000),
+    ("gpt-4.1", 1047576),
+    ("gpt-4.5-preview", 128000),
+    ("gpt-4o", 128000),
+    ("gpt-4-turbo", 128000),
+    ("gpt-4-1106", 128000),
+    ("gpt-4-0125", 128000),
+    ("gpt-4-vision-preview", 128000),
+    ("gpt-4-32k", 32768),
+    ("gpt-4", 8192),
+    ("gpt-3.5-turbo", 16385),
+    ("gpt-3.5-turbo-16k", 16385),
+    ("gpt-3.5-turbo-0301", 4096),
+    ("gpt-3.5-turbo-0613", 4096),
+    ("gpt-3.5-turbo-instruct", 4096),
+    ("o1", 200000),
+    ("o1-mini", 128000),
+    ("o1-preview", 128000),
+    ("o3", 200000),
+    ("o3-mini", 200000),
+    ("o4-mini", 200000),
+]
+
+
+class TokenBudgetError(ValueError):
+    """
+    Raised when a request does not fit in the context window of the model.
+    """
+
+
+class TokenBudgetSettings(Settings):
+    """
+    Represents how the completion budget of each request is sized to the context window of the model.
+
+    Attributes:
+        context_window (Optional[int]): The number of tokens of the context window. None to look it up from the engine.
+        min_completion_tokens (int): The smallest number of completion tokens worth sending a request for.
+        safety_margin (int): The number of tokens left unused, to absorb differences between the local tokenizer and the server.
+        policy (str): What to do with infos too long to leave min_completion_tokens: "truncate" their content or "reject" them.
+    """
+
+    def __init__(
+        self,
+        *,
+        context_window: Optional[int] = None,
+        min_completion_tokens: int = 256,
+        safety_margin: int = 16,
+        policy: str = "truncate",
+    ):
+        """
+        Initialize the TokenBudgetSettings instance.
+
+        Args:
+            context_window (Optional[int]): The number of tokens of the context window. None to look it up from the engine.
+            min_completion_tokens (int): The smallest number of completion tokens worth sending a request for.
+            safety_margin (int): The number of tokens left unused.
+            policy (str): "truncate" or "reject".
+
+        Raises:
+            ValueError: If the policy is unknown.
+        """
+        if policy not in POLICIES:
+            raise ValueError(
+                f"Unknown token budget policy {policy}, expected one of {POLICIES}"
+            )
+        self.context_window = context_window
+        self.min_completion_tokens = min_completion_tokens
+        self.safety_margin = safety_margin
+        self.policy = policy
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the TokenBudgetSettings instance to a dictionary representation.
+
+        Returns:
+            dict: A dictionary containing the token budget settings.
+        """
+        return {
+            "context_window": self.context_window,
+            "min_completion_tokens": self.min_completion_tokens,
+            "safety_margin": self.safety_margin,
+            "policy": self.policy,
+        }
+
+
+def read_yaml(yaml_path: str) -> TokenBudgetSettings:
+    """
+    Read token budget settings from the optional `Token_budget` section of a YAML file.
+
+    Args:
+        yaml_path (str): The path to the YAML file containing the settings.
+
+    Returns:
+        TokenBudgetSettings: The settings from the YAML file, or the default settings if the section is missing.
+    """
+    token_budget_settings_dict = yaml.load(yaml_path).get("Token_budget") or {}
+    return TokenBudgetSettings(**token_budget_settings_dict)
+
+
+def get_context_window(engine: str) -> Optional[int]:
+    """
+    Look up the context window of a model.
+
+    A known name matches the model of that name, and the models whose name continues it after a dash, so that `gpt-4-0613` is a version of `gpt-4` but `gpt-4.1` is not.
+
+    Args:
+        engine (str): The name of the model.
+
+    Returns:
+        Optional[int]: The number of tokens of the context window, or None if the model is unknown.
+    """
+    matches = [
+        (len(name), context_window)
+        for name, context_window in CONTEXT_WINDOWS
+        if engine == name or engine.startswith(name + "-")
+    ]
+    return max(matches)[1] if matches else None
+
+
+class TokenBudget(object):
+    """
+    Sizes `max_tokens` of every request to what is left of the context window after its messages.
+
+    The quotas of the rate limiters are charged for `max_tokens`, so asking for no more than fits both avoids context overflow errors on long infos and stops short infos from reserving quota they can never use.
+
+    Attributes:
+        settings (TokenBudgetSettings): The token budget settings.
+        counter (TokenCounter): The tokenizer counting the messages.
+        context_window (Optional[int]): The context window of the model, None if unknown, in which case `max_tokens` is left unchanged.
+    """
+
+    def __init__(self, settings: TokenBudgetSettings, engine: str):
+        """
+        Initialize the TokenBudget instance.
+
+        Args:
+            settings (TokenBudgetSettings): The token budget settings.
+            engine (str): The model the requests are sent to.
+        """
+        self.settings = settings
+        self.counter = TokenCounter(engine)
+        self.context_window = (
+            settings.context_window
+            if settings.context_window is not None
+            else get_context_window(engine)
+        )
+
+    def plan(
+        self,
+        messages: List[Dict[str, Any]],
+        max_tokens: int,
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Fit a request in the context window.
+
+        If the messages leave fewer than `min_completion_tokens`, the content of the last message, which holds the info, is truncated or the request is rejected according to the policy.
+
+        Args:
+            messages (List[Dict[str, Any]]): The messages of the request.
+            max_tokens (int): The largest completion wanted.
+            stats (Optional[Dict[str, Any]]): The statistics of the request, filled with the number of prompt tokens and of truncated tokens.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], int]: The messages, truncated if needed, and the number of completion tokens to ask for.
+
+        Raises:
+            TokenBudgetError: If the request does not fit and cannot be truncated to fit.
+        """
+        prompt_tokens = self.counter.count_messages_tokens(messages)
+        if self.context_window is None:
+            return messages, max_tokens
+        available = self.context_window - self.settings.safety_margin - prompt_tokens
+        min_completion_tokens = min(self.settings.min_completion_tokens, max_tokens)
+        if available < min_completion_tokens:
+            if self.settings.policy == "reject":
+                raise TokenBudgetError(
+                    f"Prompt of {prompt_tokens} tokens leaves {available} of the {self.context_window} tokens of the context window"
+                )
+            messages, num_truncated = self.truncate(
+                messages, min_completion_tokens - available
+            )
+            if stats is not None:
+                stats["truncated_tokens"] = num_truncated
+            prompt_tokens -= num_truncated
+            available += num_truncated
+        if stats is not None:
+            stats["prompt_tokens"] = prompt_tokens
+        return messages, min(max_tokens, available)
+
+    def truncate(
+        self, messages: List[Dict[str, Any]], num_tokens: int
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Remove tokens from the end of the content of the last message.
+
+        Args:
+            messages (List[Dict[str, Any]]): The messages of the request, left unchanged.
+            num_tokens (int): The number of tokens to remove.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], int]: The truncated messages and the number of tokens removed.
+
+        Raises:
+            TokenBudgetError: If the last message is too short to remove that many tokens.
+        """
+        last_message = messages[-1]
+        content = str(last_message["content"])
+        content_tokens = self.counter.count_tokens(content)
+        if content_tokens <= num_tokens:
+            raise TokenBudgetError(
+                f"The prompt exceeds the {self.context_window} tokens of the context window even without the info"
+            )
+        truncated_content = self.counter.truncate(content, content_tokens - num_tokens)
+        num_truncated = content_tokens - self.counter.count_tokens(truncated_content)
+        return (
+            messages[:-1] + [{**last_message, "content": truncated_content}],
+            num_truncated,
+        )
@@ -0,0 +1,197 @@
+import collections
+import functools
+import heapq
+import math
+import re
+
+import syphus.prompts.prompts as syphus_prompts
+from syphus.prompts.in_context_example import InContextExample
+from typing import List, Dict, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase words.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        List[str]: The words of the text, in order.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class TfidfIndex(object):
+    """
+    A TF-IDF index of a set of documents, returning the most similar ones to a query by cosine similarity.
+
+    The weights are sublinear term frequencies times smoothed inverse document frequencies, and every document vector is normalized when the index is built. An inverted index maps every term to the documents holding it, so a query only visits the documents sharing a term with it. Terms found in most documents, such as stop words, barely tell documents apart but would make every query visit most of them, so they are left out of the index.
+
+    Attributes:
+        num_documents (int): The number of documents indexed.
+        idf (Dict[str, float]): The inverse document frequency of every term.
+        postings (Dict[str, List[Tuple[int, float]]]): The index and the normalized weight of the term in every document holding it.
+    """
+
+    def __init__(self, documents: List[str], *, max_document_frequency: float = 0.5):
+        """
+        Build the index.
+
+        Args:
+            documents (List[str]): The documents to index.
+            max_document_frequency (float, optional): Terms found in a larger fraction of the documents are ignored. Defaults to 0.5.
+        """
+        self.num_documents = len(documents)
+        term_counts = [
+            collections.Counter(tokenize(document)) for document in documents
+        ]
+        document_frequencies = collections.Counter(
+            term for counts in term_counts for term in counts
+        )
+        self.idf: Dict[str, float] = {
+            term: math.log((1 + self.num_documents) / (1 + frequency)) + 1
+            for term, frequency in document_frequencies.items()
+            if frequency <= max_document_frequency * self.num_documents
+        }
+        self.postings: Dict[str, List[Tuple[int, float]]] = collections.defaultdict(
+            list
+        )
+        for index, counts in enumerate(term_counts):
+            for term, weight in self.get_vector(counts).items():
+                self.postings[term].append((index, weight))
+        self.postings = dict(self.postings)
+
+    def get_vector(self, counts: Dict[str, int]) -> Dict[str, float]:
+        """
+        Weight and normalize term counts, ignoring the terms missing from the index.
+
+        Args:
+            counts (Dict[str, int]): The number of occurrences of every term.
+
+        Returns:
+            Dict[str, float]: The normalized TF-IDF weight of every known term.
+        """
+        weights = {
+            term: (1 + math.log(count)) * self.idf[term]
+            for term, count in counts.items()
+            if term in self.idf
+        }
+        norm = math.sqrt(sum(weight**2 for weight in weights.values()))
+        return {term: weight / norm for term, weight in weights.items()} if norm else {}
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """
+        Find the documents most similar to a query.
+
+        Args:
+            query (str): The query.
+            k (int): The number of documents to return.
+
+        Returns:
+            List[Tuple[int, float]]: The index and cosine similarity of at most k documents sharing a term with the query, most similar first. Ties are broken by index.
+        """
+        scores = collections.defaultdict(float)
+        for term, query_weight in self.get_vector(
+            collections.Counter(tokenize(query))
+        ).items():
+            for index, weight in self.postings[term]:
+                scores[index] += query_weight * weight
+        return heapq.nsmallest(k, scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class ExampleSelector(object):
+    """
+    Sends every request with only the in-context examples of the prompts most similar to its info, instead of all of them.
+
+    The examples are indexed by the TF-IDF vectors of their contexts when the selector is built, and the k examples whose contexts are closest to the content of an info are selected. If fewer than k examples share a word with the info, the first examples of the prompts complete the selection. Selected examples keep their order in the prompts, so infos selecting the same examples send the same prefix, compiled once.
+
+    Attributes:
+        prompts (Prompts): The prompts holding the system message and the pool of examples.
+        k (int): The number of examples sent with every request.
+        index (TfidfIndex): The index of the contexts of the examples.
+    """
+
+    def __init__(
+        self, prompts: syphus_prompts.Prompts, k: int, *, cache_size: int = 1024
+    ):
+        """
+        Initialize the ExampleSelector instance.
+
+        Args:
+            prompts (Prompts): The prompts holding the system message and the pool of examples.
+            k (int): The number of examples sent with every request.
+            cache_size (int, optional): The number of compiled prefixes kept, one per distinct selection. Defaults to 1024.
+
+        Raises:
+            ValueError: If k is smaller than 1.
+        """
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        self.prompts = prompts
+        self.k = k
+        self.index = TfidfIndex(
+            [example.context for example in prompts.in_context_examples]
+        )
+        self.compile = functools.lru_cache(maxsize=cache_size)(self.compile)
+
+    def select_indices(self, content: str) -> Tuple[int, ...]:
+        """
+        Select the examples closest to a content.
+
+        Args:
+            content (str): The content of the info.
+
+        Returns:
+            Tuple[int, ...]: The indices of the selected examples, in increasing order.
+        """
+        selected = {index for index, _ in self.index.search(content, self.k)}
+        for index in range(self.index.num_documents):
+            if len(selected) >= self.k:
+                break
+            selected.add(index)
+        return tuple(sorted(selected))
+
+    def select(self, content: str) -> List[InContextExample]:
+        """
+        Select the examples closest to a content.
+
+        Args:
+            content (str): The content of the info.
+
+        Returns:
+            List[InContextExample]: The selected examples, in the order of the prompts.
+        """
+        return [
+            self.prompts.in_context_examples[index]
+            for index in self.select_indices(content)
+        ]
+
+    def compile(self, indices: Tuple[int, ...]) -> syphus_prompts.CompiledPrompts:
+        """
+        Compile the prompts with a selection of examples. Results are cached.
+
+        Args:
+            indices (Tuple[int, ...]): The indices of the selected examples.
+
+        Returns:
+            CompiledPrompts: The system message followed by the selected examples.
+        """
+        return syphus_prompts.Prompts(
+            self.prompts.system_message,
+            [self.prompts.in_context_examples[index] for index in indices],
+        ).compile()
+
+    def get_messages(self, content: str) -> syphus_prompts.PromptMessages:
+        """
+        Build the messages of a request with the examples closest to its content.
+
+        Args:
+            content (str): The content of the user message, usually the content of an info.
+
+        Returns:
+            PromptMessages: The system message and the selected examples, followed by the user message.
+        """
+        return self.compile(self.select_indices(content)).get_messages(content)
@@ -90,12 +90,10 @@ class InContextExample(object):
         Returns:
             str: A formatted string containing questions and answers from the example.
         """
-        formatted_qa_pairs = ""
-        for qa_pair in self.qa_pairs:
-            formatted_qa_pairs += (
-                f"Question: {qa_pair.question}\nAnswer: {qa_pair.answer}\n\n"
-            )
-        return formatted_qa_pairs
+        return "".join(
+            f"Question: {qa_pair.question}\nAnswer: {qa_pair.answer}\n\n"
+            for qa_pair in self.qa_pairs
+        )
 
 
 def from_dict(data: Dict[str, Any]) -> InContextExample:
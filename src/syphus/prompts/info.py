@@ -5,6 +5,9 @@ import json
 
 from syphus.utils.file_format import auto_infer_single_file, get_loader_by_format
 
+# The reserved field of a dictionary info holding its scheduling priority, removed from its content.
+PRIORITY_FIELD = "_priority"
+
 
 class Info(object):
     """
@@ -16,15 +19,22 @@ class Info(object):
         info (Any): The information content.
         id (Optional[str], optional): An optional identifier for the information. Defaults to None.
         converting_type (str, optional): The type of conversion to be applied to the information content. Can be "str", "yaml", or "json". Defaults to "str".
+        priority (Optional[float], optional): An optional scheduling priority. Infos with a higher priority are queried first by a scheduler. Defaults to None.
 
     Raises:
         ValueError: If an invalid converting type is provided.
     """
 
     def __init__(
-        self, info: Any, *, id: Optional[str] = None, converting_type: str = "yaml"
+        self,
+        info: Any,
+        *,
+        id: Optional[str] = None,
+        converting_type: str = "yaml",
+        priority: Optional[float] = None,
     ):
         self.id = id
+        self.priority = priority
         if isinstance(info, str):
             self.content = info
         elif converting_type == "str":
@@ -43,12 +53,12 @@ def from_dict(
     ],
     *,
     has_id: bool = False,
-    mandatory_id: Optional[str] = None
+    mandatory_id: Optional[str] = None,
 ) -> Info:
     """
     Creates an Info object from a dictionary, list, or tuple.
 
-    This function creates an Info object from various types of data, such as dictionaries, lists, or tuples. The 'has_id' parameter specifies whether the data has an ID field, and 'mandatory_id' can be provided to forcefully assign an ID.
+    This function creates an Info object from various types of data, such as dictionaries, lists, or tuples. The 'has_id' parameter specifies whether the data has an ID field, and 'mandatory_id' can be provided to forcefully assign an ID. With 'has_id', a reserved '_priority' field of a dictionary is removed from the content and becomes the priority of the Info; any other field, 'priority' included, is kept.
 
     Args:
         info (Union[Dict[str, Any], List[Any], Tuple[str, Union[Dict[str, Any], List[Any]]]]): The information data.
@@ -59,10 +69,11 @@ def from_dict(
         Info: An Info object representing the converted information.
 
     Raises:
-        ValueError: If 'has_id' is True and the provided information is a list.
+        ValueError: If 'has_id' is True and the provided information is a list, or its '_priority' field is not a number.
     """
 
     id = None
+    priority = None
 
     if has_id:
         if isinstance(info, dict):
@@ -73,11 +84,17 @@ def from_dict(
         elif isinstance(info, tuple):
             id = info[0]
             info = info[1]
+        if isinstance(info, dict) and PRIORITY_FIELD in info:
+            priority = info.pop(PRIORITY_FIELD)
+            if isinstance(priority, bool) or not isinstance(priority, (int, float)):
+                raise ValueError(
+                    f"{PRIORITY_FIELD} of info {id} must be a number, got {priority!r}"
+                )
 
     if mandatory_id:
         id = mandatory_id
 
-    return Info(info, id=id)
+    return Info(info, id=id, priority=priority)
 
 
 def read_single(
@@ -85,7 +102,7 @@ def read_single(
     *,
     format: str = "auto",
     has_id: bool = False,
-    mandatory_id: Optional[str] = None
+    mandatory_id: Optional[str] = None,
 ) -> Info:
     """
     Reads a single Info object from a file.
@@ -1,7 +1,99 @@
+import json
+
 import syphus.utils.yaml as yaml
 import syphus.prompts.in_context_example as in_context_example
 import syphus.prompts.qa_pair as qa_pair
-from typing import List, Dict, Any
+from typing import List, Dict, Tuple, Any
+
+
+def dump_messages(messages: List[Dict[str, Any]]) -> str:
+    """
+    Encode chat messages as canonical JSON, with sorted keys and no whitespace.
+
+    Messages built by CompiledPrompts reuse the encoding of their prefix, so only the last message is encoded.
+
+    Args:
+        messages (List[Dict[str, Any]]): The chat messages.
+
+    Returns:
+        str: The JSON encoding of the messages.
+    """
+    if isinstance(messages, PromptMessages):
+        return messages.to_json()
+    return json.dumps(
+        messages, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+
+
+class PromptMessages(list):
+    """
+    The messages of a request built by CompiledPrompts: the shared prefix followed by the user message of an info.
+
+    It is a plain list to every consumer, but remembers the prefix it was built from so its JSON encoding can reuse the precompiled one.
+
+    Attributes:
+        compiled_prompts (CompiledPrompts): The prompts the prefix comes from.
+    """
+
+    def __init__(
+        self, compiled_prompts: "CompiledPrompts", messages: List[Dict[str, Any]]
+    ):
+        super().__init__(messages)
+        self.compiled_prompts = compiled_prompts
+
+    def to_json(self) -> str:
+        """
+        Encode the messages as canonical JSON, splicing the last message into the encoded prefix.
+
+        Returns:
+            str: The same string as `json.dumps(messages, sort_keys=True, ensure_ascii=False, separators=(",", ":"))`.
+        """
+        prefix = self.compiled_prompts.messages
+        if len(self) != len(prefix) + 1 or any(
+            message is not prefix_message
+            for message, prefix_message in zip(self, prefix)
+        ):
+            # Modified since it was built, e.g. truncated: encode it all.
+            return dump_messages(list(self))
+        return self.compiled_prompts.prefix_json + dump_messages([self[-1]])[1:]
+
+
+class CompiledPrompts(object):
+    """
+    The messages of a set of prompts, built and encoded once to be shared by every request of a run.
+
+    The system message and in-context examples come first and in the same order in every request, so providers caching prompt prefixes can reuse them. The prefix is a tuple, and its messages must not be modified.
+
+    Attributes:
+        messages (Tuple[Dict[str, str], ...]): The system and in-context example messages.
+        prefix_json (str): The canonical JSON encoding of the messages, without its closing bracket and followed by a comma, ready for the next message.
+    """
+
+    def __init__(self, messages: List[Dict[str, str]]):
+        """
+        Initialize the CompiledPrompts instance.
+
+        Args:
+            messages (List[Dict[str, str]]): The system and in-context example messages.
+        """
+        self.messages: Tuple[Dict[str, str], ...] = tuple(messages)
+        self.prefix_json = dump_messages(list(self.messages))[:-1] + (
+            "," if self.messages else ""
+        )
+
+    def get_messages(self, content: Any) -> PromptMessages:
+        """
+        Build the messages of a request by appending a user message to the prefix.
+
+        Args:
+            content (Any): The content of the user message, usually the content of an info.
+
+        Returns:
+            PromptMessages: The prefix messages followed by the user message.
+        """
+        return PromptMessages(
+            self, [*self.messages, {"role": "user", "content": content}]
+        )
 
 
 class Prompts(object):
@@ -44,6 +136,17 @@ class Prompts(object):
             )
         return messages
 
+    def compile(self) -> CompiledPrompts:
+        """
+        Build and encode the messages once, to append the user message of every info to them.
+
+        The compiled prompts do not follow later changes to the Prompts object, compile it again after modifying it.
+
+        Returns:
+            CompiledPrompts: The compiled messages.
+        """
+        return CompiledPrompts(self.get_messages())
+
     def to_dict(self) -> List[Dict[str, Any]]:
         """
         Converts the Prompts object to a dictionary.
@@ -1,5 +1,6 @@
 import json
-from typing import Dict
+import re
+from typing import Dict, Iterable, List, Tuple
 
 
 class QAPair(object):
@@ -61,3 +62,49 @@ def from_dict(data: Dict[str, str]) -> QAPair:
         QAPair: A new QAPair object.
     """
     return QAPair(data["question"], data["answer"])
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes a text for comparison, ignoring case, punctuation and whitespace.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The lowercased words of the text, separated by single spaces.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def get_key(qa_pair: QAPair) -> Tuple[str, str]:
+    """
+    Returns the key QA pairs are deduplicated by.
+
+    Args:
+        qa_pair (QAPair): The QA pair.
+
+    Returns:
+        Tuple[str, str]: The normalized question and answer.
+    """
+    return normalize_text(qa_pair.question), normalize_text(qa_pair.answer)
+
+
+def deduplicate(qa_pairs: Iterable[QAPair]) -> List[QAPair]:
+    """
+    Removes the QA pairs that repeat an earlier one, exactly or up to case, punctuation and whitespace.
+
+    Args:
+        qa_pairs (Iterable[QAPair]): The QA pairs.
+
+    Returns:
+        List[QAPair]: The first occurrence of every QA pair, in order.
+    """
+    seen = set()
+    unique = []
+    for qa_pair in qa_pairs:
+        key = get_key(qa_pair)
+        if key not in seen:
+            seen.add(key)
+            unique.append(qa_pair)
+    return unique
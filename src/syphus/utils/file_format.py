@@ -200,20 +200,24 @@ def remove_folder(path: str, *, force: bool = False):
             os.rmdir(path)
 
 
-def create_output_folder(path: str, *, force: bool = False):
+def create_output_folder(path: str, *, force: bool = False, exist_ok: bool = False):
     """
     Creates an output folder at the specified path.
 
     This function creates a new output folder at the given path. If the 'force' parameter is set to True,
-    it removes any existing folder at the path before creating a new one.
+    it removes any existing folder at the path before creating a new one. If 'exist_ok' is set to True,
+    an existing folder is reused as it is, e.g. to resume an interrupted run.
 
     Args:
         path (str): The path at which the output folder should be created.
         force (bool, optional): If True, remove any existing folder at the path before
                                creating the new folder. Default is False.
+        exist_ok (bool, optional): If True, keep an existing folder and its contents. Default is False.
 
     Example:
         >>> create_output_folder("output", force=True)
     """
+    if exist_ok and os.path.isdir(path):
+        return
     remove_folder(path, force=force)
     os.makedirs(path)
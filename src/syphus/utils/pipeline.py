@@ -0,0 +1,199 @@
+import asyncio
+import itertools
+
+from concurrent.futures import Executor, FIRST_COMPLETED, wait
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Union,
+)
+
+
+class ReorderBuffer(object):
+    """
+    Holds results that completed out of order until every earlier result is available.
+
+    Attributes:
+        next_index (int): The index of the next result to release.
+        results (Dict[int, Any]): The buffered results, keyed by input index.
+    """
+
+    def __init__(self):
+        self.next_index = 0
+        self.results: Dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def push(self, index: int, result: Any) -> Iterator[Any]:
+        """
+        Add a result and release every result that is now in order.
+
+        Args:
+            index (int): The input index of the result.
+            result (Any): The result.
+
+        Yields:
+            Any: The results that can be released, in input order.
+        """
+        self.results[index] = result
+        while self.next_index in self.results:
+            yield self.results.pop(self.next_index)
+            self.next_index += 1
+
+
+def get_window(max_in_flight: Union[int, Callable[[], int]]) -> Callable[[], int]:
+    """
+    Normalize a fixed or dynamic window size into a function returning the current size.
+
+    Args:
+        max_in_flight (Union[int, Callable[[], int]]): The window size, or a function returning it.
+
+    Returns:
+        Callable[[], int]: A function returning the current window size, never smaller than 1.
+
+    Raises:
+        ValueError: If a fixed window size is smaller than 1.
+    """
+    if callable(max_in_flight):
+        return lambda: max(1, max_in_flight())
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+    return lambda: max_in_flight
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    Group items into lists of `size` items, pulling them lazily.
+
+    Args:
+        items (Iterable[Any]): The items to group.
+        size (int): The number of items per group. The last group may be smaller.
+
+    Yields:
+        List[Any]: The groups, in input order.
+
+    Raises:
+        ValueError: If size is smaller than 1.
+    """
+    if size < 1:
+        raise ValueError("size must be at least 1")
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bounded_map(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    *,
+    executor: Executor,
+    max_in_flight: Union[int, Callable[[], int]],
+    ordered: bool = False,
+) -> Iterator[Any]:
+    """
+    Apply a function to every item on an executor, keeping at most `max_in_flight` items in the pipeline.
+
+    Items are pulled from `items` lazily, only when a slot in the window is free, so the input can be an arbitrarily long iterator and memory stays flat. Results are yielded as soon as they complete, or in input order if `ordered` is True, in which case results waiting in the reorder buffer also count against the window.
+
+    Args:
+        func (Callable[[Any], Any]): The function applied to each item.
+        items (Iterable[Any]): The items to process.
+        executor (Executor): The executor running the calls.
+        max_in_flight (Union[int, Callable[[], int]]): The maximum number of items submitted but not yet yielded, or a function returning the current maximum, called before every submission so that the window can be resized while the map runs.
+        ordered (bool, optional): Whether to yield results in input order. Defaults to False.
+
+    Yields:
+        Any: The result of each call.
+
+    Raises:
+        ValueError: If a fixed max_in_flight is smaller than 1.
+    """
+    get_max_in_flight = get_window(max_in_flight)
+    iterator = enumerate(items)
+    exhausted = False
+    pending = {}
+    buffer = ReorderBuffer()
+    try:
+        while True:
+            while not exhausted and len(pending) + len(buffer) < get_max_in_flight():
+                try:
+                    index, item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(func, item)] = index
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                if ordered:
+                    yield from buffer.push(index, future.result())
+                else:
+                    yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def async_bounded_map(
+    func: Callable[[Any], Awaitable[Any]],
+    items: Iterable[Any],
+    *,
+    max_in_flight: Union[int, Callable[[], int]] = 256,
+    ordered: bool = False,
+) -> AsyncIterator[Any]:
+    """
+    Apply an async function to every item, keeping at most `max_in_flight` calls running at once.
+
+    Items are pulled from `items` lazily, only when a slot in the window is free, so the input can be an arbitrarily long iterator. Results are yielded in completion order, or in input order if `ordered` is True, in which case results waiting in the reorder buffer also count against the window.
+
+    Args:
+        func (Callable[[Any], Awaitable[Any]]): The coroutine function applied to each item.
+        items (Iterable[Any]): The items to process.
+        max_in_flight (Union[int, Callable[[], int]], optional): The maximum number of concurrent calls, or a function returning the current maximum, called before every submission. Defaults to 256.
+        ordered (bool, optional): Whether to yield results in input order. Defaults to False.
+
+    Yields:
+        Any: The result of each call.
+
+    Raises:
+        ValueError: If a fixed max_in_flight is smaller than 1.
+    """
+    get_max_in_flight = get_window(max_in_flight)
+    iterator = enumerate(items)
+    exhausted = False
+    pending = {}
+    buffer = ReorderBuffer()
+    try:
+        while True:
+            while not exhausted and len(pending) + len(buffer) < get_max_in_flight():
+                try:
+                    index, item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[asyncio.ensure_future(func(item))] = index
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = pending.pop(task)
+                if ordered:
+                    for result in buffer.push(index, task.result()):
+                        yield result
+                else:
+                    yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
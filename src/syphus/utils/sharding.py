@@ -0,0 +1,59 @@
+import hashlib
+
+from typing import Any, Iterable, Iterator, Tuple
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """
+    Parse a shard specification of the form "i/N".
+
+    Args:
+        spec (str): The specification, where i is the zero-based index of the shard and N the number of shards.
+
+    Returns:
+        Tuple[int, int]: The index of the shard and the number of shards.
+
+    Raises:
+        ValueError: If the specification is malformed or the index is out of range.
+    """
+    try:
+        index, num_shards = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {spec}, expected i/N, e.g. 0/4")
+    if num_shards < 1 or not 0 <= index < num_shards:
+        raise ValueError(f"Invalid shard {spec}, must have 0 <= i < N")
+    return index, num_shards
+
+
+def shard_of(id: Any, num_shards: int) -> int:
+    """
+    Assign an ID to a shard.
+
+    The assignment only depends on the ID, unlike the built-in `hash`, which is salted per process, so every process and every machine agrees on it.
+
+    Args:
+        id (Any): The ID, converted to a string.
+        num_shards (int): The number of shards.
+
+    Returns:
+        int: The index of the shard the ID belongs to.
+    """
+    digest = hashlib.sha1(str(id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def filter_shard(items: Iterable[Any], index: int, num_shards: int) -> Iterator[Any]:
+    """
+    Keep the items whose `id` belongs to a shard.
+
+    Args:
+        items (Iterable[Any]): Items with an `id` attribute, such as Info objects.
+        index (int): The index of the shard to keep.
+        num_shards (int): The number of shards.
+
+    Yields:
+        Any: The items of the shard, in their original order.
+    """
+    for item in items:
+        if shard_of(item.id, num_shards) == index:
+            yield item
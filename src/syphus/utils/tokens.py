@@ -0,0 +1,149 @@
+import functools
+import math
+
+from typing import Any, Dict, List
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CHARACTERS_PER_TOKEN = 4
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimate the number of tokens in a piece of text.
+
+    The estimate uses the common rule of thumb of four characters per token, which is close enough for quota accounting without loading a tokenizer.
+
+    Args:
+        text (str): The text to estimate.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return math.ceil(len(text) / CHARACTERS_PER_TOKEN)
+
+
+def estimate_messages_tokens(messages: List[Dict[str, Any]]) -> int:
+    """
+    Roughly estimate the number of prompt tokens of a list of chat messages.
+
+    Args:
+        messages (List[Dict[str, Any]]): Chat messages, each with 'role' and 'content' keys.
+
+    Returns:
+        int: The estimated number of prompt tokens, including per-message overhead.
+    """
+    num_tokens = TOKENS_PER_REPLY
+    for message in messages:
+        num_tokens += TOKENS_PER_MESSAGE + estimate_tokens(str(message["content"]))
+    return num_tokens
+
+
+class TokenCounter(object):
+    """
+    Counts the tokens of chat messages with the local tokenizer of a model.
+
+    The tokenizer of the `tiktoken` package is used if it is installed, otherwise tokens are estimated with `estimate_tokens`. Counts are cached per message, so the system prompt and in-context examples shared by every request of a run are only tokenized once.
+
+    Attributes:
+        model (str): The model whose tokenizer is used.
+        encoding: The tiktoken encoding, or None if tokens are estimated.
+    """
+
+    def __init__(self, model: str, *, cache_size: int = 4096):
+        """
+        Initialize the TokenCounter instance.
+
+        Args:
+            model (str): The model whose tokenizer is used. Unknown models use the cl100k_base encoding.
+            cache_size (int, optional): The number of message counts kept in the cache. Defaults to 4096.
+        """
+        self.model = model
+        self.encoding = get_encoding(model)
+        self.count_message_tokens = functools.lru_cache(maxsize=cache_size)(
+            self.count_message_tokens
+        )
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Count the tokens of a piece of text.
+
+        Args:
+            text (str): The text to count.
+
+        Returns:
+            int: The number of tokens.
+        """
+        if self.encoding is None:
+            return estimate_tokens(text)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_message_tokens(self, role: str, content: str) -> int:
+        """
+        Count the tokens of a chat message, including its overhead. Results are cached.
+
+        Args:
+            role (str): The role of the message.
+            content (str): The content of the message.
+
+        Returns:
+            int: The number of tokens of the message.
+        """
+        return TOKENS_PER_MESSAGE + self.count_tokens(content)
+
+    def count_messages_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        Count the prompt tokens of a list of chat messages.
+
+        Args:
+            messages (List[Dict[str, Any]]): Chat messages, each with 'role' and 'content' keys.
+
+        Returns:
+            int: The number of prompt tokens, including per-message overhead.
+        """
+        num_tokens = TOKENS_PER_REPLY
+        for message in messages:
+            num_tokens += self.count_message_tokens(
+                message["role"], str(message["content"])
+            )
+        return num_tokens
+
+    def truncate(self, text: str, num_tokens: int) -> str:
+        """
+        Keep the beginning of a piece of text that fits in a number of tokens.
+
+        Args:
+            text (str): The text to truncate.
+            num_tokens (int): The maximum number of tokens to keep.
+
+        Returns:
+            str: The truncated text.
+        """
+        num_tokens = max(num_tokens, 0)
+        if self.encoding is None:
+            return text[: num_tokens * CHARACTERS_PER_TOKEN]
+        tokens = self.encoding.encode(text, disallowed_special=())
+        return self.encoding.decode(tokens[:num_tokens])
+
+
+def get_encoding(model: str):
+    """
+    Get the tiktoken encoding of a model.
+
+    Args:
+        model (str): The name of the model.
+
+    Returns:
+        The tiktoken encoding, or None if tiktoken is not installed.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
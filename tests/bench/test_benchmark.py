@@ -0,0 +1,18 @@
+from syphus.bench.benchmark import format_report, run_query_benchmark
+from syphus.bench.mock_server import MockServerSettings
+
+
+def test_run_query_benchmark():
+    report = run_query_benchmark(
+        num_infos=20,
+        server_settings=MockServerSettings(latency=0.01, rate_limit_rate=0.1, seed=0),
+        threads=4,
+        retry_base_delay=0.01,
+    )
+    assert report["infos"] == 20
+    assert report["requests"] >= 20
+    assert report["requests"] == 20 + report["server"]["rate_limited"]
+    assert report["latency_p50"] <= report["latency_p99"]
+    assert report["cpu_ms_per_request"] > 0
+    assert report["peak_rss_mb"] > 0
+    assert "Requests/sec" in format_report(report)
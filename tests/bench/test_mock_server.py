@@ -0,0 +1,73 @@
+import openai
+import pytest
+
+from syphus.bench.mock_server import MockServer, MockServerSettings
+from syphus.data_generator.response import Response
+
+
+def make_client(mock_server: MockServer) -> openai.OpenAI:
+    return openai.OpenAI(api_key="mock", base_url=mock_server.base_url, max_retries=0)
+
+
+def test_unknown_distribution():
+    with pytest.raises(ValueError):
+        MockServerSettings(distribution="pareto")
+
+
+@pytest.mark.parametrize(
+    "distribution", ["constant", "uniform", "normal", "lognormal", "exponential"]
+)
+def test_sample_latency(distribution):
+    mock_server = MockServer(
+        MockServerSettings(
+            latency=0.1, latency_stddev=0.02, distribution=distribution, seed=0
+        )
+    )
+    latencies = [mock_server.sample_latency() for _ in range(2000)]
+    mock_server.server.server_close()
+    assert min(latencies) >= 0
+    assert abs(sum(latencies) / len(latencies) - 0.1) < 0.01
+
+
+def test_chat_completion():
+    settings = MockServerSettings(latency=0, num_qa_pairs=2)
+    with MockServer(settings) as mock_server:
+        completion = make_client(mock_server).chat.completions.create(
+            model="mock", messages=[{"role": "user", "content": "a red car"}]
+        )
+    response = Response(gpt_response=completion.model_dump())
+    assert len(response.qa_pairs) == 2
+    assert "a red car" in response.qa_pairs[0].question
+    assert completion.usage.completion_tokens > 0
+    assert mock_server.counts["completed"] == 1
+
+
+def test_stream():
+    settings = MockServerSettings(latency=0, tokens_per_second=10000)
+    with MockServer(settings) as mock_server:
+        stream = make_client(mock_server).chat.completions.create(
+            model="mock",
+            messages=[{"role": "user", "content": "a red car"}],
+            stream=True,
+        )
+        content = "".join(chunk.choices[0].delta.content or "" for chunk in stream)
+        assert content == mock_server.get_content(
+            [{"role": "user", "content": "a red car"}]
+        )
+
+
+def test_injected_errors():
+    settings = MockServerSettings(
+        latency=0, rate_limit_rate=0.5, server_error_rate=0.5, seed=0
+    )
+    with MockServer(settings) as mock_server:
+        client = make_client(mock_server)
+        status_codes = []
+        for _ in range(20):
+            with pytest.raises(openai.APIStatusError) as error:
+                client.chat.completions.create(model="mock", messages=[])
+            status_codes.append(error.value.status_code)
+            if error.value.status_code == 429:
+                assert error.value.response.headers["retry-after-ms"] == "100"
+    assert set(status_codes) <= {429, 500, 503}
+    assert mock_server.counts["rate_limited"] + mock_server.counts["errors"] == 20
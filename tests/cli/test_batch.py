@@ -0,0 +1,70 @@
+import os
+import shutil
+import argparse
+import pytest
+
+import syphus.data_generator.response as syphus_response
+import syphus.utils.jsonl as jsonl
+
+from syphus.cli.batch import export, ingest
+
+
+@pytest.fixture
+def output_path():
+    path = "tests/test_output/batch"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    yield path
+    shutil.rmtree(path)
+
+
+def test_export_and_ingest(output_path):
+    requests_path = os.path.join(output_path, "requests.jsonl")
+    export(
+        argparse.Namespace(
+            file=output_path,
+            config="tests/data/gpt_info.example.yaml",
+            input="tests/data/test_info/multiple_infos/data.jsonl",
+            prompts="tests/data/dense_captions_prompt.yaml",
+            output=requests_path,
+            num_examples=None,
+        )
+    )
+    requests = list(jsonl.load(requests_path))
+    assert requests
+    results = [
+        {
+            "custom_id": request["custom_id"],
+            "response": {
+                "status_code": 200,
+                "body": {
+                    "choices": [
+                        {
+                            "index": 0,
+                            "finish_reason": "stop",
+                            "message": {
+                                "role": "assistant",
+                                "content": "question: Q\nanswer: A",
+                            },
+                        }
+                    ]
+                },
+            },
+            "error": None,
+        }
+        for request in requests
+    ]
+    results_path = os.path.join(output_path, "results.jsonl")
+    jsonl.dump(results, results_path)
+    responses_path = os.path.join(output_path, "responses")
+    ingest(
+        argparse.Namespace(
+            results=[results_path],
+            output=responses_path,
+            split=False,
+            output_format="jsonl",
+        )
+    )
+    responses = syphus_response.read_all(responses_path, format="jsonl")
+    assert sorted(responses) == sorted(request["custom_id"] for request in requests)
@@ -0,0 +1,49 @@
+import os
+import shutil
+import pytest
+
+import syphus.data_generator.journal as journal
+import syphus.data_generator.response as syphus_response
+
+from syphus.cli.data_generator import get_shard_path, merge_shards
+from syphus.data_generator.response import Response
+
+
+@pytest.fixture
+def output_path():
+    path = "tests/test_output/shards"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    yield path
+    shutil.rmtree(path)
+
+
+def make_response(question: str) -> Response:
+    return Response(
+        data={
+            "warning_message": [],
+            "qa_pairs": [{"question": question, "answer": "answer"}],
+            "full_response": {},
+        }
+    )
+
+
+def test_merge_shards(output_path):
+    for index in range(2):
+        with journal.Journal(get_shard_path(output_path, index)) as run_journal:
+            run_journal.record(f"{index:05d}", make_response(f"q{index}"))
+    merge_shards(output_path, 2, split=False, format="json")
+    responses = syphus_response.read_all(output_path, format="json")
+    assert sorted(responses) == ["00000", "00001"]
+    assert responses["00001"].qa_pairs[0].question == "q1"
+
+
+def test_merge_shards_split(output_path):
+    for index in range(2):
+        shard_path = get_shard_path(output_path, index)
+        make_response(f"q{index}").save(os.path.join(shard_path, f"{index:05d}"))
+        journal.Journal(shard_path).close()
+    merge_shards(output_path, 2, split=True, format="json")
+    assert sorted(os.listdir(output_path)) == ["00000", "00001", "shards"]
+    assert os.listdir(get_shard_path(output_path, 0)) == ["journal.jsonl"]
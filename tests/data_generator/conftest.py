@@ -0,0 +1,22 @@
+def get_gpt_response(message: str, model: str = "gpt-3.5-turbo-0613"):
+    return {
+        "choices": [
+            {
+                "finish_reason": "stop",
+                "index": 0,
+                "message": {"content": message, "role": "assistant"},
+            }
+        ],
+        "model": model,
+        "object": "chat.completion",
+        "usage": {"completion_tokens": 17, "prompt_tokens": 57, "total_tokens": 74},
+    }
+
+
+class RawResponse(object):
+    def __init__(self, response):
+        self.response = response
+        self.headers = {}
+
+    def parse(self):
+        return self.response
@@ -0,0 +1,125 @@
+import os
+import shutil
+import pytest
+
+import syphus.data_generator.batch_api as batch_api
+import syphus.data_generator.response as syphus_response
+import syphus.utils.jsonl as jsonl
+
+from syphus.data_generator.syphus import Syphus
+from syphus.data_generator.token_budget import TokenBudgetSettings
+from syphus.prompts.info import Info
+
+
+@pytest.fixture
+def output_path():
+    path = "tests/test_output/batch_api"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    yield path
+    shutil.rmtree(path)
+
+
+@pytest.fixture
+def syphus_object():
+    return Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+    )
+
+
+def make_result(id: str, content: str):
+    return {
+        "id": f"batch_req_{id}",
+        "custom_id": id,
+        "response": {
+            "status_code": 200,
+            "request_id": f"req_{id}",
+            "body": {
+                "object": "chat.completion",
+                "model": "gpt-3.5-turbo-0613",
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+            },
+        },
+        "error": None,
+    }
+
+
+def test_get_batch_request(syphus_object):
+    info = Info("some info", id="00000")
+    request = batch_api.get_batch_request(syphus_object, info)
+    assert request["custom_id"] == "00000"
+    assert request["method"] == "POST"
+    assert request["url"] == "/v1/chat/completions"
+    body = request["body"]
+    assert body["model"] == "gpt-3.5-turbo-0613"
+    assert body["messages"] == syphus_object.get_messages(info)
+    assert body["max_tokens"] <= syphus_object.gpt_manager.gpt_params.max_tokens
+    assert "stream" not in body
+
+
+def test_export_requests_skips_rejected_infos(syphus_object, output_path):
+    syphus_object.gpt_manager.token_budget.settings = TokenBudgetSettings(
+        policy="reject"
+    )
+    infos = [Info("info", id="00000"), Info("info " * 10000, id="00001")]
+    path = os.path.join(output_path, "requests.jsonl")
+    assert batch_api.export_requests(syphus_object, infos, path) == 1
+    assert [request["custom_id"] for request in jsonl.load(path)] == ["00000"]
+
+
+def test_parse_batch_result():
+    id, response = batch_api.parse_batch_result(
+        make_result("00000", "question: Q\nanswer: A")
+    )
+    assert id == "00000"
+    assert response.qa_pairs[0].answer == "A"
+
+
+def test_parse_batch_result_errors():
+    _, response = batch_api.parse_batch_result(
+        {
+            "custom_id": "00000",
+            "response": None,
+            "error": {"code": "batch_expired", "message": "expired"},
+        }
+    )
+    assert response.full_response == {"error": "expired"}
+    _, response = batch_api.parse_batch_result(
+        {
+            "custom_id": "00001",
+            "response": {
+                "status_code": 400,
+                "body": {"error": {"message": "context length exceeded"}},
+            },
+            "error": None,
+        }
+    )
+    assert response.full_response == {"error": "context length exceeded"}
+
+
+def test_ingest_results(output_path):
+    results_path = os.path.join(output_path, "results.jsonl")
+    errors_path = os.path.join(output_path, "errors.jsonl")
+    jsonl.dump(
+        [make_result("00000", "question: Q0\nanswer: A0"), make_result("00001", "")],
+        results_path,
+    )
+    jsonl.dump(
+        [{"custom_id": "00002", "response": None, "error": {"message": "boom"}}],
+        errors_path,
+    )
+    responses = batch_api.ingest_results(results_path, errors_path)
+    responses_path = os.path.join(output_path, "responses")
+    syphus_response.save_all(responses, responses_path, process_bar=False)
+    saved = syphus_response.read_all(responses_path)
+    assert sorted(saved) == ["00000", "00001", "00002"]
+    assert saved["00000"].qa_pairs[0].question == "Q0"
+    assert saved["00002"].full_response == {"error": "boom"}
@@ -0,0 +1,80 @@
+import syphus.data_generator.batching as batching
+
+from syphus.prompts.info import Info
+
+
+def test_get_batch_content():
+    content = batching.get_batch_content([Info("a", id="1"), Info("b", id="2")])
+    assert content.startswith(batching.BATCH_INSTRUCTION)
+    assert "### Info 1\na\n\n### Info 2\nb" in content
+
+
+def test_split_batch_content():
+    content = "\n".join(
+        [
+            "Here are the answers.",
+            "### Info 1",
+            "question: Q1",
+            "answer: A1",
+            "**Info 2:**",
+            "question: Q2",
+            "answer: see Info 3",
+            "### Info 3",
+            "question: Q3",
+            "### Info 1",
+            "question: duplicate",
+        ]
+    )
+    sections = batching.split_batch_content(content, ["1", "2"])
+    assert sections == {
+        "1": "question: Q1\nanswer: A1",
+        "2": "question: Q2\nanswer: see Info 3\n### Info 3\nquestion: Q3",
+    }
+
+
+def test_split_batch_response():
+    gpt_response = {
+        "id": "chatcmpl-1",
+        "model": "gpt-3.5-turbo-0613",
+        "choices": [
+            {
+                "finish_reason": "stop",
+                "index": 0,
+                "message": {
+                    "content": "### Info 1\nquestion: Q1\nanswer: A1",
+                    "role": "assistant",
+                },
+            }
+        ],
+        "usage": {"total_tokens": 100},
+    }
+    responses = batching.split_batch_response(gpt_response, ["1", "2"])
+    assert list(responses) == ["1"]
+    assert responses["1"]["id"] == "chatcmpl-1"
+    assert responses["1"]["batch"] == ["1", "2"]
+    assert "usage" not in responses["1"]
+    message = responses["1"]["choices"][0]["message"]
+    assert message == {"content": "question: Q1\nanswer: A1", "role": "assistant"}
+
+
+def test_split_batch_response_multiple_choices():
+    gpt_response = {
+        "choices": [
+            {
+                "index": index,
+                "message": {"content": content, "role": "assistant"},
+            }
+            for index, content in enumerate(
+                [
+                    "### Info 1\nquestion: Q1\nanswer: A1",
+                    "### Info 1\nquestion: Q1b\nanswer: A1b\n### Info 2\nquestion: Q2\nanswer: A2",
+                ]
+            )
+        ],
+    }
+    responses = batching.split_batch_response(gpt_response, ["1", "2"])
+    assert [choice["index"] for choice in responses["1"]["choices"]] == [0, 1]
+    assert [choice["index"] for choice in responses["2"]["choices"]] == [0]
+    assert responses["2"]["choices"][0]["message"]["content"] == (
+        "question: Q2\nanswer: A2"
+    )
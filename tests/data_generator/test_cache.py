@@ -0,0 +1,82 @@
+import os
+import json
+import hashlib
+import shutil
+import time
+import pytest
+
+import syphus.data_generator.cache as response_cache
+import syphus.prompts.prompts as prompts
+
+from syphus.data_generator.cache import ResponseCache
+
+
+@pytest.fixture
+def cache_path():
+    path = "tests/test_output/cache"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    return path
+
+
+def test_fingerprint_is_stable():
+    messages = [{"role": "user", "content": "hello"}]
+    params = {"temperature": 0.7, "max_tokens": 10}
+    key = response_cache.fingerprint(messages, params, "gpt-3.5-turbo")
+    assert key == response_cache.fingerprint(
+        [{"content": "hello", "role": "user"}],
+        {"max_tokens": 10, "temperature": 0.7},
+        "gpt-3.5-turbo",
+    )
+    assert key != response_cache.fingerprint(messages, params, "gpt-4")
+    assert key != response_cache.fingerprint(
+        messages, {"temperature": 0.5, "max_tokens": 10}, "gpt-3.5-turbo"
+    )
+
+
+def test_fingerprint_of_compiled_prompts():
+    compiled = prompts.Prompts("System message").compile()
+    messages = compiled.get_messages("Info")
+    params = {"temperature": 0.7, "max_tokens": 10}
+    payload = json.dumps(
+        {"engine": "gpt-4", "params": params, "messages": list(messages)},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    key = response_cache.fingerprint(messages, params, "gpt-4")
+    assert key == hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    assert key == response_cache.fingerprint(list(messages), params, "gpt-4")
+
+
+def test_get_and_put(cache_path):
+    cache = ResponseCache(cache_path)
+    assert cache.get("key") is None
+    cache.put("key", {"choices": []})
+    assert cache.get("key") == {"choices": []}
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert "1 hits, 1 misses" in cache.summary()
+    cache.close()
+    cache = ResponseCache(cache_path)
+    assert cache.get("key") == {"choices": []}
+    cache.close()
+
+
+def test_age_eviction(cache_path):
+    cache = ResponseCache(cache_path, max_age=0.05)
+    cache.put("key", {"choices": []})
+    time.sleep(0.1)
+    assert cache.get("key") is None
+    cache.evict()
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_size_eviction(cache_path):
+    cache = ResponseCache(cache_path, max_size_bytes=100, evict_every=1)
+    for i in range(10):
+        cache.put(f"key{i}", {"content": "x" * 30})
+    assert 0 < len(cache) <= 2
+    assert cache.get("key9") is not None
+    assert cache.get("key0") is None
+    cache.close()
@@ -0,0 +1,84 @@
+import os
+import signal
+import time
+import pytest
+
+from syphus.data_generator.cancellation import (
+    Cancellation,
+    RunCancelledError,
+    parse_duration,
+)
+
+
+def test_parse_duration():
+    assert parse_duration("90") == 90
+    assert parse_duration("1.5") == 1.5
+    assert parse_duration("90s") == 90
+    assert parse_duration("30m") == 1800
+    assert parse_duration("1.5h") == 5400
+    assert parse_duration("1d") == 86400
+    with pytest.raises(ValueError):
+        parse_duration("-5")
+    with pytest.raises(ValueError):
+        parse_duration("5 minutes")
+
+
+def test_no_deadline():
+    cancellation = Cancellation()
+    assert not cancellation.stopped
+    assert cancellation.remaining() is None
+    cancellation.check(1e9)
+    assert cancellation.reason is None
+
+
+def test_deadline():
+    cancellation = Cancellation()
+    cancellation.set_deadline(0, grace_period=60)
+    assert cancellation.stopped
+    assert cancellation.reason == "deadline reached"
+    assert 59 < cancellation.remaining() <= 60
+    cancellation.check()
+    with pytest.raises(RunCancelledError):
+        cancellation.check(61)
+
+
+def test_deadline_in_the_future():
+    cancellation = Cancellation()
+    cancellation.set_deadline(60, grace_period=10)
+    assert not cancellation.stopped
+    assert 69 < cancellation.remaining() <= 70
+    cancellation.set_deadline(None)
+    assert cancellation.remaining() is None
+
+
+def test_cancel():
+    cancellation = Cancellation()
+    cancellation.set_deadline(3600, grace_period=5)
+    cancellation.cancel("cancelled by test")
+    assert cancellation.stopped
+    assert cancellation.reason == "cancelled by test"
+    assert cancellation.remaining() <= 5
+
+
+def test_abort():
+    cancellation = Cancellation()
+    cancellation.abort()
+    assert cancellation.stopped
+    with pytest.raises(RunCancelledError, match="aborted"):
+        cancellation.check()
+
+
+def test_handle_signals():
+    cancellation = Cancellation()
+    previous_handler = signal.getsignal(signal.SIGTERM)
+    with cancellation.handle_signals():
+        os.kill(os.getpid(), signal.SIGTERM)
+        time.sleep(0.1)
+        assert cancellation.stopped
+        assert cancellation.reason == "cancelled by SIGTERM"
+        cancellation.check()
+        os.kill(os.getpid(), signal.SIGTERM)
+        time.sleep(0.1)
+        with pytest.raises(RunCancelledError):
+            cancellation.check()
+    assert signal.getsignal(signal.SIGTERM) == previous_handler
@@ -0,0 +1,132 @@
+import os
+import shutil
+
+import pytest
+
+import syphus.data_generator.cascade as cascade
+import syphus.utils.yaml as yaml
+
+from syphus.data_generator.gpt_manager import GPTManager
+from syphus.data_generator.openai_settings import OpenAISettings
+from syphus.data_generator.response import Response
+
+
+def get_response(content: str) -> Response:
+    return Response(
+        gpt_response={
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ]
+        }
+    )
+
+
+@pytest.fixture
+def primary():
+    return GPTManager(
+        openai_api=OpenAISettings(
+            type="open_ai", base="http://primary", key="KEY", engine="small"
+        )
+    )
+
+
+def test_read_yaml():
+    path = "tests/test_output/cascade"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    yaml_path = os.path.join(path, "gpt_info.yaml")
+    yaml.dump(
+        {"Cascade": {"tiers": [{"engine": "large"}], "min_qa_pairs": 2}}, yaml_path
+    )
+    settings = cascade.read_yaml(yaml_path)
+    assert settings.tiers == [{"engine": "large"}]
+    assert settings.min_qa_pairs == 2
+    assert settings.escalate_on_unmatched
+    yaml.dump({}, yaml_path)
+    assert cascade.read_yaml(yaml_path).tiers == []
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        cascade.CascadeSettings(tiers=[{"base": "http://large"}])
+    with pytest.raises(ValueError):
+        cascade.CascadeSettings(tiers=[[]])
+    with pytest.raises(ValueError):
+        cascade.CascadeSettings(min_qa_pairs=-1)
+
+
+def test_get_tier_endpoints(primary):
+    settings = cascade.CascadeSettings(
+        tiers=[
+            {"engine": "medium"},
+            [{"engine": "large", "base": "http://large"}, {"engine": "large"}],
+        ]
+    )
+    tiers = settings.get_tier_endpoints(primary.openai_api)
+    assert [[endpoint.engine for endpoint in tier] for tier in tiers] == [
+        ["medium"],
+        ["large", "large"],
+    ]
+    assert tiers[0][0].base == "http://primary"
+    assert tiers[0][0].key == "KEY"
+    assert tiers[1][0].base == "http://large"
+
+
+def test_cascade_managers(primary):
+    tiers = cascade.Cascade(
+        cascade.CascadeSettings(tiers=[{"engine": "large"}]), primary
+    )
+    assert tiers.managers[0] is primary
+    assert tiers.managers[1].openai_api.engine == "large"
+    assert tiers.managers[1].load_balancer is not primary.load_balancer
+    assert tiers.managers[1].gpt_params is primary.gpt_params
+
+
+def test_get_problem(primary):
+    tiers = cascade.Cascade(
+        cascade.CascadeSettings(tiers=[{"engine": "large"}], min_qa_pairs=2),
+        primary,
+    )
+    assert tiers.get_problem(get_response("question: Q1\nanswer: A1")) is not None
+    assert (
+        tiers.get_problem(
+            get_response("question: Q1\nanswer: A1\nquestion: Q2\nanswer: A2")
+        )
+        is None
+    )
+    assert "unmatched" in tiers.get_problem(
+        get_response("question: Q1\nanswer: A1\nquestion: Q2\nanswer: A2\nquestion: Q3")
+    )
+    assert tiers.get_problem(Response(gpt_error_messages="error")) is not None
+
+
+def test_record_and_choose(primary):
+    tiers = cascade.Cascade(
+        cascade.CascadeSettings(tiers=[{"engine": "large"}]), primary
+    )
+    bad = get_response("no pairs")
+    good = get_response("question: Q1\nanswer: A1")
+    problem = tiers.record(0, bad)
+    assert problem is not None
+    assert tiers.record(1, bad) is None
+    assert tiers.record(0, good) is None
+    assert (
+        tiers.record(
+            0, Response(gpt_error_messages="cancelled", stats={"cancelled": True})
+        )
+        is None
+    )
+    assert (tiers.queried, tiers.accepted) == ([2, 1], [1, 0])
+    chosen = tiers.choose(0, bad, good, problem)
+    assert chosen is good
+    assert chosen.stats["cascade_tier"] == 1
+    assert chosen.warning_message[0].startswith("Escalated from small to large")
+    assert tiers.choose(0, good, get_response("no pairs"), "problem") is good
+    report = tiers.report()
+    assert "Cascade tier 0 (small): 1/2 accepted (50.0%)" in report
+    assert "Cascade tier 1 (large): 0/1 accepted (0.0%)" in report
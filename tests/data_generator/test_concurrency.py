@@ -0,0 +1,50 @@
+import pytest
+
+from syphus.data_generator.concurrency import AIMDController
+
+
+def test_additive_increase():
+    controller = AIMDController(min_limit=1, max_limit=4, min_samples=1000)
+    for _ in range(1 + 2 + 3):
+        controller.record(1.0)
+    assert controller.limit == 4
+    for _ in range(100):
+        controller.record(1.0)
+    assert controller.limit == 4
+
+
+def test_multiplicative_decrease_once_per_window():
+    controller = AIMDController(
+        min_limit=2, max_limit=64, initial_limit=32, min_samples=1000
+    )
+    controller.record(1.0, overloaded=True)
+    assert controller.limit == 16
+    for _ in range(15):
+        controller.record(1.0, overloaded=True)
+    assert controller.limit == 16
+    controller.record(1.0, overloaded=True)
+    assert controller.limit == 8
+    for _ in range(100):
+        controller.record(1.0, overloaded=True)
+    assert controller.limit == 2
+    assert controller.decreases == 4
+
+
+def test_rising_latency_decreases_limit():
+    controller = AIMDController(
+        min_limit=1, max_limit=64, initial_limit=8, min_samples=10
+    )
+    for _ in range(10):
+        controller.record(1.0)
+    limit = controller.limit
+    for _ in range(10):
+        controller.record(10.0)
+    assert controller.limit < limit
+    assert controller.decreases == 1
+
+
+def test_invalid_bounds():
+    with pytest.raises(ValueError):
+        AIMDController(min_limit=0)
+    with pytest.raises(ValueError):
+        AIMDController(min_limit=8, max_limit=4)
@@ -83,3 +83,12 @@ def test_load_yaml(yaml_path):
     with open(yaml_path, "r") as yaml_path:
         actual_dict = yaml.safe_load(yaml_path)["GPT_params"]
     assert read_settings.to_dict() == actual_dict
+
+
+def test_n():
+    settings = gpt_params_settings.GPTParamsSettings(n=3, parallel_n=True)
+    assert settings.to_dict()["n"] == 3
+    assert settings.to_dict()["parallel_n"] is True
+    assert "n" not in gpt_params_settings.GPTParamsSettings(n=1).to_dict()
+    with pytest.raises(ValueError):
+        gpt_params_settings.GPTParamsSettings(n=0)
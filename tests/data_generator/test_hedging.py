@@ -0,0 +1,147 @@
+import asyncio
+import os
+import shutil
+import time
+
+import pytest
+
+import syphus.data_generator.hedging as hedging
+import syphus.utils.yaml as yaml
+
+from syphus.data_generator.gpt_manager import AsyncGPTManager
+from syphus.data_generator.openai_settings import OpenAISettings
+
+from conftest import get_gpt_response, RawResponse
+
+
+def slow_a_response(**kwargs):
+    if kwargs["model"] == "a":
+        time.sleep(0.5)
+    return RawResponse(get_gpt_response(kwargs["model"], kwargs["model"]))
+
+
+async def aslow_a_response(**kwargs):
+    if kwargs["model"] == "a":
+        await asyncio.sleep(10)
+    return RawResponse(get_gpt_response(kwargs["model"], kwargs["model"]))
+
+
+@pytest.fixture
+def openai_client(mocker):
+    client = mocker.patch("openai.OpenAI")
+    client.return_value.chat.completions.with_raw_response.create.side_effect = (
+        slow_a_response
+    )
+    async_client = mocker.patch("openai.AsyncOpenAI")
+    async_client.return_value.chat.completions.with_raw_response.create.side_effect = (
+        aslow_a_response
+    )
+    return client
+
+
+def make_manager(**settings) -> AsyncGPTManager:
+    manager = AsyncGPTManager(
+        openai_api=[
+            OpenAISettings(type="open_ai", base="http://a", key="key-a", engine="a"),
+            OpenAISettings(type="open_ai", base="http://b", key="key-b", engine="b"),
+        ],
+        hedge_settings=hedging.HedgeSettings(
+            **{
+                "enabled": True,
+                "max_fraction": 1.0,
+                "min_samples": 1,
+                "min_delay": 0.05,
+                **settings,
+            }
+        ),
+    )
+    manager.hedger.observe(0.01)
+    return manager
+
+
+def test_read_yaml():
+    path = "tests/test_output/hedging"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    yaml_path = os.path.join(path, "gpt_info.yaml")
+    yaml.dump({"Hedging": {"enabled": True, "percentile": 0.9}}, yaml_path)
+    settings = hedging.read_yaml(yaml_path)
+    assert settings.enabled
+    assert settings.percentile == 0.9
+    assert settings.max_fraction == 0.05
+    yaml.dump({}, yaml_path)
+    assert not hedging.read_yaml(yaml_path).enabled
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        hedging.HedgeSettings(percentile=1.0)
+    with pytest.raises(ValueError):
+        hedging.HedgeSettings(max_fraction=1.5)
+    with pytest.raises(ValueError):
+        hedging.HedgeSettings(min_delay=-1)
+
+
+def test_get_delay():
+    hedger = hedging.Hedger(
+        hedging.HedgeSettings(enabled=True, min_samples=10, min_delay=0.5)
+    )
+    for i in range(1, 10):
+        hedger.observe(i)
+    assert hedger.get_delay() is None
+    for i in range(10, 101):
+        hedger.observe(i)
+    assert hedger.get_delay() == 95
+    assert hedger.requests == 2
+    hedger = hedging.Hedger(hedging.HedgeSettings(min_samples=1, min_delay=0.5))
+    hedger.observe(0.1)
+    assert hedger.get_delay() == 0.5
+
+
+def test_try_hedge_is_capped():
+    hedger = hedging.Hedger(hedging.HedgeSettings(max_fraction=0.25))
+    hedged = []
+    for _ in range(8):
+        hedger.get_delay()
+        hedged.append(hedger.try_hedge())
+    assert hedged == [False, False, False, True, False, False, False, True]
+    assert hedger.hedged == 2
+
+
+def test_request_hedged(openai_client):
+    manager = make_manager()
+    stats = {}
+    start = time.monotonic()
+    response = manager.query_gpt([{"role": "user", "content": "info"}], stats=stats)
+    assert time.monotonic() - start < 0.4
+    assert response["model"] == "b"
+    assert stats["hedged"]
+    assert stats["hedge_won"]
+    assert stats["endpoint"] == "b@http://b"
+    assert stats["attempts"] == 2
+    summary = manager.metrics.summary()
+    assert summary["hedged"] == 1
+    assert summary["hedge_wins"] == 1
+
+
+def test_request_hedged_is_capped(openai_client):
+    manager = make_manager(max_fraction=0)
+    stats = {}
+    response = manager.query_gpt([{"role": "user", "content": "info"}], stats=stats)
+    assert response["model"] == "a"
+    assert "hedged" not in stats
+    assert manager.metrics.summary()["hedged"] == 0
+
+
+def test_arequest_hedged(openai_client):
+    manager = make_manager()
+    stats = {}
+    start = time.monotonic()
+    response = asyncio.run(
+        manager.aquery_gpt([{"role": "user", "content": "info"}], stats=stats)
+    )
+    assert time.monotonic() - start < 5
+    assert response["model"] == "b"
+    assert stats["hedge_won"]
+    assert all(endpoint.in_flight == 0 for endpoint in manager.load_balancer.endpoints)
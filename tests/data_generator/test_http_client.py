@@ -0,0 +1,40 @@
+import syphus.data_generator.http_client as http_client
+
+from syphus.data_generator.http_client import HTTPSettings
+
+
+def test_read_yaml_defaults():
+    settings = http_client.read_yaml("tests/data/gpt_info.example.yaml")
+    assert settings.to_dict() == HTTPSettings().to_dict()
+
+
+def test_limits_follow_pool_size():
+    limits = HTTPSettings().get_limits(16)
+    assert limits.max_connections == 16
+    assert limits.max_keepalive_connections == 16
+
+
+def test_limits_from_settings():
+    settings = HTTPSettings(max_connections=8, max_keepalive_connections=4)
+    limits = settings.get_limits(16)
+    assert limits.max_connections == 8
+    assert limits.max_keepalive_connections == 4
+
+
+def test_timeout():
+    timeout = HTTPSettings(connect_timeout=5, read_timeout=120).get_timeout()
+    assert timeout.connect == 5
+    assert timeout.read == 120
+
+
+def test_timeout_limit():
+    timeout = HTTPSettings(connect_timeout=5, read_timeout=120).get_timeout(30)
+    assert timeout.connect == 5
+    assert timeout.read == 30
+    assert HTTPSettings().get_timeout(-1).read == 0
+
+
+def test_create_http_client():
+    client = http_client.create_http_client(HTTPSettings(read_timeout=30), 4)
+    assert client.timeout.read == 30
+    client.close()
@@ -0,0 +1,50 @@
+import os
+import shutil
+import pytest
+
+import syphus.data_generator.journal as journal
+
+from syphus.data_generator.response import Response
+
+
+@pytest.fixture
+def journal_path():
+    path = "tests/test_output/journal"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    return path
+
+
+def make_response(question: str) -> Response:
+    return Response(
+        data={
+            "warning_message": [],
+            "qa_pairs": [{"question": question, "answer": "answer"}],
+            "full_response": {},
+        }
+    )
+
+
+def test_record_and_load(journal_path):
+    with journal.Journal(journal_path) as run_journal:
+        run_journal.record("00001", make_response("q1"))
+        run_journal.record("00002", make_response("q2"))
+    responses = journal.load(journal_path)
+    assert sorted(responses) == ["00001", "00002"]
+    assert responses["00002"].to_dict() == make_response("q2").to_dict()
+
+
+def test_load_missing_journal(journal_path):
+    assert journal.load(journal_path) == {}
+
+
+def test_truncated_line_is_ignored(journal_path, capsys):
+    with journal.Journal(journal_path) as run_journal:
+        run_journal.record("00001", make_response("q1"))
+    with open(os.path.join(journal_path, journal.JOURNAL_FILE_NAME), "a") as f:
+        f.write('{"id": "00002", "respo')
+    assert sorted(journal.load(journal_path)) == ["00001"]
+    assert "Ignoring corrupted line 2" in capsys.readouterr().err
+    with journal.Journal(journal_path) as run_journal:
+        run_journal.record("00003", make_response("q3"))
+    assert sorted(journal.load(journal_path)) == ["00001", "00003"]
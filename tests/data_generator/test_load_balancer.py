@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import pytest
+
+import syphus.data_generator.load_balancer as load_balancer
+
+from syphus.data_generator.load_balancer import LoadBalancer, LoadBalancerSettings
+from syphus.data_generator.openai_settings import OpenAISettings
+
+
+def make_endpoints():
+    return [
+        OpenAISettings(type="open_ai", base="http://a", key="key-a", engine="a"),
+        OpenAISettings(
+            type="azure",
+            base="http://b",
+            key="key-b",
+            engine="b",
+            version="2023-07-01-preview",
+            weight=2,
+            max_concurrency=2,
+        ),
+    ]
+
+
+def test_least_loaded_respects_weights():
+    balancer = LoadBalancer(make_endpoints())
+    names = [balancer.try_acquire().settings.engine for _ in range(3)]
+    assert sorted(names) == ["a", "b", "b"]
+
+
+def test_concurrency_cap():
+    balancer = LoadBalancer(
+        [OpenAISettings(engine="a", max_concurrency=1)], poll_interval=0.01
+    )
+    endpoint = balancer.acquire()
+    assert balancer.try_acquire() is None
+    threading.Timer(0.05, balancer.release, args=(endpoint,)).start()
+    assert balancer.acquire() is endpoint
+    balancer.release(endpoint)
+    assert endpoint.in_flight == 0
+
+
+def test_aacquire_waits_for_release():
+    balancer = LoadBalancer(
+        [OpenAISettings(engine="a", max_concurrency=1)], poll_interval=0.01
+    )
+
+    async def main():
+        endpoint = await balancer.aacquire()
+        asyncio.get_running_loop().call_later(0.05, balancer.release, endpoint)
+        return await balancer.aacquire()
+
+    assert asyncio.run(main()).in_flight == 1
+
+
+def test_unhealthy_endpoint_is_avoided():
+    balancer = LoadBalancer(
+        make_endpoints(), LoadBalancerSettings(failure_threshold=2, cooldown=60)
+    )
+    endpoint_b = balancer.endpoints[1]
+    for _ in range(2):
+        balancer.endpoints[1].in_flight += 1
+        balancer.release(endpoint_b, failed=True)
+    assert all(balancer.try_acquire().settings.engine == "a" for _ in range(3))
+    assert endpoint_b.failures == 2
+
+
+def test_all_unhealthy_falls_back_to_every_endpoint():
+    balancer = LoadBalancer(
+        [OpenAISettings(engine="a")], LoadBalancerSettings(failure_threshold=1)
+    )
+    endpoint = balancer.acquire()
+    balancer.release(endpoint, failed=True)
+    assert balancer.try_acquire() is endpoint
+    balancer.release(endpoint)
+    assert endpoint.consecutive_failures == 0
+
+
+def test_avoid_routes_around_endpoint():
+    balancer = LoadBalancer(make_endpoints())
+    endpoint_a = balancer.endpoints[0]
+    assert balancer.try_acquire(avoid=endpoint_a).settings.engine == "b"
+    balancer = LoadBalancer(make_endpoints()[:1])
+    assert balancer.try_acquire(avoid=balancer.endpoints[0]).settings.engine == "a"
+
+
+def test_keys_of_one_deployment():
+    endpoint = make_endpoints()[0]
+    other_key = OpenAISettings(
+        type="open_ai", base="http://a", key="key-a2", engine="a"
+    )
+    balancer = LoadBalancer([endpoint, other_key])
+    first, second = balancer.endpoints
+    assert [first.name, second.name] == ["a@http://a#0", "a@http://a#1"]
+    assert balancer.try_acquire(avoid=first) is second
+    assert LoadBalancer(make_endpoints()).endpoints[0].name == "a@http://a"
+
+
+def test_weighted_strategy():
+    balancer = LoadBalancer(make_endpoints(), LoadBalancerSettings(strategy="weighted"))
+    assert balancer.try_acquire().settings.engine in ("a", "b")
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        LoadBalancerSettings(strategy="round_robin")
+
+
+def test_endpoint_request_kwargs():
+    endpoint_a, endpoint_b = LoadBalancer(make_endpoints()).endpoints
+    assert endpoint_a.get_request_kwargs() == {"model": "a"}
+    assert endpoint_b.get_request_kwargs() == {"model": "b"}
+
+
+def test_endpoint_clients():
+    endpoint_a, endpoint_b = LoadBalancer(make_endpoints()).endpoints
+    client_a = endpoint_a.get_client()
+    assert client_a is endpoint_a.get_client()
+    assert str(client_a.base_url).startswith("http://a")
+    assert client_a.max_retries == 0
+    client_b = endpoint_b.get_client()
+    assert client_b._api_version == "2023-07-01-preview"
+    assert str(client_b.base_url).startswith("http://b/openai/")
+
+
+def test_set_pool_size_resets_clients():
+    balancer = LoadBalancer(make_endpoints())
+    endpoint_a, endpoint_b = balancer.endpoints
+    client_a = endpoint_a.get_client()
+    balancer.set_pool_size(8)
+    assert endpoint_a.pool_size == 8
+    assert endpoint_b.pool_size == 2
+    assert endpoint_a.get_client() is not client_a
+
+
+def test_async_client_follows_event_loop():
+    endpoint = LoadBalancer(make_endpoints()).endpoints[0]
+
+    async def get_client():
+        return endpoint.get_async_client()
+
+    first_client = asyncio.run(get_client())
+    assert asyncio.run(get_client()) is not first_client
+
+
+def test_retired_async_client_is_closed_on_its_loop(mocker):
+    closed = []
+
+    async def close_async_client(client):
+        closed.append(client)
+
+    mocker.patch(
+        "syphus.data_generator.load_balancer.close_async_client", close_async_client
+    )
+    endpoint = LoadBalancer(make_endpoints()).endpoints[0]
+    loop = asyncio.new_event_loop()
+
+    async def get_client():
+        return endpoint.get_async_client()
+
+    first_client = loop.run_until_complete(get_client())
+    endpoint.set_pool_size(8)
+    assert endpoint.async_client is None
+    loop.run_until_complete(asyncio.sleep(0.01))
+    loop.close()
+    assert closed == [first_client]
+
+
+def test_set_pool_size_keeps_sync_client_open():
+    endpoint = LoadBalancer(make_endpoints()).endpoints[0]
+    client = endpoint.get_client()
+    endpoint.set_pool_size(8)
+    assert not client.is_closed()
+
+
+def test_aclose():
+    balancer = LoadBalancer(make_endpoints())
+
+    async def use_and_close():
+        client = balancer.endpoints[0].get_async_client()
+        await balancer.aclose()
+        return client
+
+    client = asyncio.run(use_and_close())
+    assert client.is_closed()
+    assert balancer.endpoints[0].async_client is None
+
+
+def test_read_yaml_defaults():
+    settings = load_balancer.read_yaml("tests/data/gpt_info.example.yaml")
+    assert settings.to_dict() == LoadBalancerSettings().to_dict()
@@ -0,0 +1,123 @@
+import json
+import os
+import urllib.request
+
+from syphus.data_generator.metrics import Metrics, StageStats, escape_label
+
+
+def test_stage_stats_quantile():
+    stats = StageStats()
+    assert stats.quantile(0.5) is None
+    for i in range(1, 101):
+        stats.observe(i / 100)
+    assert stats.count == 100
+    assert stats.quantile(0.5) == 0.5
+    assert stats.quantile(0.95) == 0.95
+    assert stats.quantile(0.99) == 0.99
+    assert stats.max == 1.0
+
+
+def test_stage_stats_sample_size():
+    stats = StageStats(sample_size=10)
+    for i in range(1000):
+        stats.observe(i)
+    assert stats.count == 1000
+    assert len(stats.samples) == 10
+    assert stats.total == sum(range(1000))
+
+
+def test_time():
+    metrics = Metrics()
+    with metrics.time("parse"):
+        pass
+    items = list(metrics.time_iter(range(3), "render"))
+    assert items == [0, 1, 2]
+    summary = metrics.summary()
+    assert summary["stages"]["parse"]["count"] == 1
+    assert summary["stages"]["render"]["count"] == 3
+    assert summary["stages"]["network"]["count"] == 0
+
+
+def test_record_request():
+    metrics = Metrics()
+    metrics.record_request(
+        {"attempts": 2, "errors": ["RateLimitError"]},
+        {"prompt_tokens": 100, "completion_tokens": 20},
+    )
+    metrics.record_request({"attempts": 1, "cached": True}, {"prompt_tokens": 100})
+    metrics.record_request(
+        {"attempts": 3, "errors": ["APITimeoutError"] * 3},
+        error=TimeoutError("timed out"),
+    )
+    summary = metrics.summary()
+    assert summary["requests"] == 3
+    assert summary["attempts"] == 6
+    assert summary["cached"] == 1
+    assert summary["failed"] == 1
+    assert summary["tokens"] == {"prompt": 100, "completion": 20}
+    assert summary["errors"] == {
+        "RateLimitError": 1,
+        "APITimeoutError": 3,
+        "TimeoutError": 1,
+    }
+
+
+def test_to_prometheus():
+    metrics = Metrics()
+    metrics.observe("network", 0.5)
+    metrics.record_request({"attempts": 1, "errors": ['Bad"Error']})
+    text = metrics.to_prometheus()
+    assert 'syphus_stage_seconds{stage="network",quantile="0.5"} 0.5' in text
+    assert 'syphus_stage_seconds_count{stage="network"} 1' in text
+    assert 'syphus_errors_total{error_class="Bad\\"Error"} 1' in text
+    assert "syphus_requests_total 1" in text
+
+
+def test_record_hedge():
+    metrics = Metrics()
+    metrics.record_request({"attempts": 2})
+    metrics.record_hedge(won=True)
+    metrics.record_hedge(won=False)
+    summary = metrics.summary()
+    assert summary["hedged"] == 2
+    assert summary["hedge_wins"] == 1
+    assert "syphus_hedged_total 2" in metrics.to_prometheus()
+    assert "hedged 2 of 1 requests" in metrics.report()
+    assert "hedged" not in Metrics().report()
+
+
+def test_escape_label():
+    assert escape_label('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
+
+
+def test_save():
+    path = "tests/test_output/metrics/save"
+    metrics = Metrics()
+    metrics.observe("write", 0.1)
+    metrics.save(path)
+    with open(os.path.join(path, "metrics.json")) as f:
+        assert json.load(f)["stages"]["write"]["count"] == 1
+    with open(os.path.join(path, "metrics.prom")) as f:
+        assert 'syphus_stage_seconds_count{stage="write"} 1' in f.read()
+
+
+def test_report():
+    metrics = Metrics()
+    metrics.observe("network", 0.25)
+    report = metrics.report()
+    assert report.startswith("network")
+    assert "prompt" not in report.splitlines()[0]
+    assert "0 failed requests" in report
+
+
+def test_serve():
+    metrics = Metrics()
+    metrics.observe("queue", 0.01)
+    server = metrics.serve(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert 'stage="queue"' in response.read().decode("utf-8")
+    finally:
+        metrics.stop_serving()
+    assert metrics.server is None
@@ -35,3 +35,17 @@ def test_read_yaml(yaml_path, sample_settings):
 
 def test_to_dict(yaml_path, sample_settings):
     assert openai_settings.read_yaml(yaml_path).to_dict() == sample_settings
+
+
+def test_read_yaml_all(tmp_path):
+    yaml_path = tmp_path / "gpt_info.yaml"
+    yaml_path.write_text(
+        "OpenAI_API:\n"
+        "  - {type: azure, base: http://a, key: a, engine: a, version: v1}\n"
+        "  - {type: open_ai, base: http://b, key: b, engine: b, weight: 2}\n"
+    )
+    settings = openai_settings.read_yaml_all(str(yaml_path))
+    assert [s.engine for s in settings] == ["a", "b"]
+    assert settings[0].to_dict()["version"] == "v1"
+    assert settings[1].weight == 2
+    assert openai_settings.read_yaml(str(yaml_path)).engine == "a"
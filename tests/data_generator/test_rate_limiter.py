@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+
+import syphus.data_generator.rate_limiter as rate_limiter
+
+from syphus.data_generator.rate_limiter import (
+    RateLimiter,
+    RateLimitSettings,
+    TokenBucket,
+)
+
+
+def test_token_bucket_reserve():
+    bucket = TokenBucket(60)
+    now = bucket.updated_at
+    assert bucket.reserve(30, now) == 0
+    assert bucket.reserve(30, now) == 0
+    assert bucket.reserve(2, now) == pytest.approx(2.0)
+    assert bucket.reserve(1, now + 3) == pytest.approx(0.0)
+
+
+def test_token_bucket_sync_only_lowers():
+    bucket = TokenBucket(100)
+    now = bucket.updated_at
+    bucket.sync(10, now)
+    assert bucket.level == 10
+    bucket.sync(50, now)
+    assert bucket.level == 10
+
+
+def test_rate_limiter_charges_both_buckets():
+    limiter = RateLimiter(
+        RateLimitSettings(requests_per_minute=600, tokens_per_minute=6000)
+    )
+    assert limiter.reserve(5000) == 0
+    assert limiter.reserve(2000) == pytest.approx(10.0, abs=0.1)
+    assert limiter.requests.level == pytest.approx(598, abs=1)
+
+
+def test_rate_limiter_without_limits():
+    limiter = RateLimiter()
+    assert limiter.reserve(10**9) == 0
+    limiter.acquire(10**9)
+    asyncio.run(limiter.aacquire(10**9))
+
+
+def test_update_from_headers():
+    limiter = RateLimiter(
+        RateLimitSettings(requests_per_minute=100, tokens_per_minute=1000)
+    )
+    limiter.update_from_headers(
+        {
+            "x-ratelimit-remaining-requests": "3",
+            "x-ratelimit-remaining-tokens": "invalid",
+        }
+    )
+    assert limiter.requests.level == pytest.approx(3, abs=0.1)
+    assert limiter.tokens.level == pytest.approx(1000)
+    limiter.update_from_headers(None)
+
+
+def test_get_headers():
+    class Error(Exception):
+        headers = {"x-ratelimit-remaining-requests": "1"}
+
+    assert rate_limiter.get_headers(Error()) == Error.headers
+    assert rate_limiter.get_headers({}) is None
+
+
+def test_read_yaml():
+    settings = rate_limiter.read_yaml("tests/data/gpt_info.example.yaml")
+    assert settings.to_dict() == {
+        "requests_per_minute": None,
+        "tokens_per_minute": None,
+    }
@@ -0,0 +1,112 @@
+import os
+import shutil
+
+import pytest
+
+import syphus.data_generator.requery as requery
+import syphus.utils.yaml as yaml
+
+from syphus.data_generator.response import Response
+
+
+def get_response(content: str) -> Response:
+    return Response(
+        gpt_response={
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ]
+        }
+    )
+
+
+def test_read_yaml():
+    path = "tests/test_output/requery"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    yaml_path = os.path.join(path, "gpt_info.yaml")
+    yaml.dump(
+        {"Requery": {"max_requeries": 2, "warnings": {"stray_line": True}}},
+        yaml_path,
+    )
+    settings = requery.read_yaml(yaml_path)
+    assert settings.max_requeries == 2
+    assert settings.warnings["stray_line"]
+    assert settings.warnings["no_qa_pairs"]
+    assert settings.feedback
+    yaml.dump({}, yaml_path)
+    assert requery.read_yaml(yaml_path).max_requeries == 0
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        requery.RequerySettings(max_requeries=-1)
+    with pytest.raises(ValueError):
+        requery.RequerySettings(warnings={"typo": True})
+
+
+def test_get_problems():
+    policy = requery.RequeryPolicy(requery.RequerySettings(max_requeries=1))
+    assert policy.get_problems(get_response("question: Q\nanswer: A")) == []
+    assert policy.get_problems(get_response("Sure!\nquestion: Q\nanswer: A")) == []
+    assert policy.get_problems(get_response("question: Q")) == ["unanswered_question"]
+    assert policy.get_problems(get_response("nothing")) == ["no_qa_pairs"]
+    assert policy.get_problems(Response(gpt_error_messages="error")) == []
+    response = get_response("question: Q\nanswer: A")
+    response.full_response["choices"].append(
+        {
+            "index": 1,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": "Sorry"},
+        }
+    )
+    assert policy.get_problems(Response(gpt_response=response.full_response)) == []
+    policy = requery.RequeryPolicy(
+        requery.RequerySettings(
+            max_requeries=1, warnings={"stray_line": True, "no_qa_pairs": False}
+        )
+    )
+    assert policy.get_problems(get_response("nothing")) == ["stray_line"]
+
+
+def test_get_messages():
+    messages = [{"role": "user", "content": "info"}]
+    response = get_response("question: Q")
+    policy = requery.RequeryPolicy(requery.RequerySettings(max_requeries=1))
+    requery_messages = policy.get_messages(messages, response, ["unanswered_question"])
+    assert requery_messages[:2] == [
+        {"role": "user", "content": "info"},
+        {"role": "assistant", "content": "question: Q"},
+    ]
+    assert "some questions have no answer" in requery_messages[2]["content"]
+    assert messages == [{"role": "user", "content": "info"}]
+    policy = requery.RequeryPolicy(
+        requery.RequerySettings(max_requeries=1, feedback=False)
+    )
+    assert policy.get_messages(messages, response, ["unanswered_question"]) == (
+        messages
+    )
+
+
+def test_counters():
+    policy = requery.RequeryPolicy(requery.RequerySettings(max_requeries=2))
+    bad = get_response("question: Q")
+    good = get_response("question: Q\nanswer: A")
+    policy.record(["unanswered_question"])
+    assert policy.choose(bad, good) is good
+    assert policy.choose(good, get_response("nothing")) is good
+    policy.finish(good, 1, [])
+    assert good.stats["requeries"] == 1
+    assert good.warning_message[0] == "Asked again 1 times."
+    policy.record(["no_qa_pairs"])
+    policy.record(["no_qa_pairs"])
+    policy.finish(bad, 2, ["no_qa_pairs"])
+    policy.finish(get_response("question: Q\nanswer: A"), 0, [])
+    assert (policy.requeries, policy.recovered, policy.exhausted) == (3, 1, 1)
+    assert policy.report() == (
+        "Requeried 3 times (no_qa_pairs=2, unanswered_question=1): 1 infos fixed, 1 still with warnings"
+    )
@@ -103,6 +103,7 @@ def test_response_with_missing_question():
     )
     assert len(response.qa_pairs) == 0
     assert "answer without a question" in response.warning_message[0]
+    assert response.stats["unmatched"] == 1
 
 
 def test_response_with_missing_answer(capsys):
@@ -112,6 +113,8 @@ def test_response_with_missing_answer(capsys):
     assert len(response.qa_pairs) == 0
     assert "There is a question without an answer" in response.warning_message[0]
     assert "There is a question without an answer" in capsys.readouterr().err
+    assert response.stats["unmatched"] == 1
+    assert response.stats["warnings"] == {"unanswered_question": 1}
 
 
 def test_response_with_invalid_role(capsys):
@@ -472,3 +475,67 @@ def test_auto_infer_format():
         syphus_response.auto_infer_format(
             os.path.join(auto_infer_format_path, "error"), "a", "b"
         )
+
+
+def test_qa_pair_parser_incremental():
+    message = "question: Q1\nanswer: A1\nmore A1\nquestion: Q2\nanswer: A2"
+    second_question_end = message.index("question: Q2") + len("question: Q2\n")
+    completed = []
+    parser = syphus_response.QAPairParser(on_qa_pair=completed.append)
+    for character in message[: second_question_end - 1]:
+        parser.feed(character)
+    assert completed == []
+    # The first pair is complete as soon as the line of the next question ends.
+    parser.feed(message[second_question_end - 1 : second_question_end])
+    assert [pair.answer for pair in completed] == ["A1\nmore A1"]
+    parser.feed(message[second_question_end:])
+    parser.close()
+    assert [pair.question for pair in completed] == ["Q1", "Q2"]
+    assert parser.qa_pairs == completed
+    assert parser.warning_message == []
+    response = Response(gpt_response=get_gpt_response(message))
+    assert [pair.to_dict() for pair in response.qa_pairs] == [
+        pair.to_dict() for pair in completed
+    ]
+
+
+def test_response_with_multiple_choices(capsys):
+    gpt_response = get_gpt_response("question: Q1\nanswer: A1\n")
+    gpt_response["choices"] += [
+        {
+            "finish_reason": "stop",
+            "index": 1,
+            "message": {
+                "content": "Question: q1.\nAnswer: a1\nquestion: Q2\nanswer: A2\n",
+                "role": "assistant",
+            },
+        },
+        {
+            "finish_reason": "stop",
+            "index": 2,
+            "message": {"content": "question: Q3", "role": "assistant"},
+        },
+    ]
+    response = Response(gpt_response=gpt_response)
+    assert [pair.question for pair in response.qa_pairs] == ["Q1", "Q2"]
+    assert response.stats["duplicate_qa_pairs"] == 1
+    assert response.warning_message
+    for warning in response.warning_message:
+        assert warning.startswith("Choice 2: ")
+
+
+def test_response_with_an_empty_choice(capsys):
+    gpt_response = get_gpt_response("question: Q1\nanswer: A1\n")
+    gpt_response["choices"].append(
+        {
+            "finish_reason": "stop",
+            "index": 1,
+            "message": {"content": "Sorry", "role": "assistant"},
+        }
+    )
+    response = Response(gpt_response=gpt_response)
+    assert [pair.question for pair in response.qa_pairs] == ["Q1"]
+    assert "no_qa_pairs" not in response.stats["warnings"]
+    gpt_response["choices"][0]["message"]["content"] = "Sorry"
+    response = Response(gpt_response=gpt_response)
+    assert response.stats["warnings"]["no_qa_pairs"] == 1
@@ -0,0 +1,84 @@
+import pytest
+
+import syphus.data_generator.retry as retry
+
+from syphus.data_generator.retry import RetryPolicy, RetrySettings
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+@pytest.mark.parametrize(
+    "error, retryable",
+    [
+        (StatusError(429), True),
+        (StatusError(500), True),
+        (StatusError(503), True),
+        (StatusError(400), False),
+        (StatusError(401), False),
+        (TimeoutError(), True),
+        (ConnectionResetError(), True),
+        (APIConnectionError("connection reset"), True),
+        (Exception("Rate limit reached for requests"), True),
+        (ValueError("invalid prompt"), False),
+    ],
+)
+def test_is_retryable(error, retryable):
+    assert RetryPolicy().is_retryable(error) == retryable
+
+
+@pytest.mark.parametrize(
+    "error, overload",
+    [
+        (StatusError(429), True),
+        (StatusError(504), True),
+        (StatusError(500), False),
+        (TimeoutError(), True),
+        (ConnectionResetError(), False),
+        (Exception("Rate limit reached for requests"), True),
+    ],
+)
+def test_is_overload(error, overload):
+    assert retry.is_overload(error) == overload
+
+
+def test_get_delay_is_capped_with_jitter():
+    policy = RetryPolicy(RetrySettings(base_delay=1, max_delay=5))
+    for attempt in range(1, 10):
+        delay = policy.get_delay(attempt, StatusError(500))
+        assert 0 <= delay <= min(5, 2 ** (attempt - 1))
+
+
+def test_get_delay_honours_retry_after():
+    policy = RetryPolicy(RetrySettings(base_delay=0.001, max_delay=0.001))
+    assert policy.get_delay(1, StatusError(429, {"retry-after": "7"})) == 7
+    assert policy.get_delay(1, StatusError(429, {"retry-after-ms": "1500"})) == 1.5
+    retry_after = retry.get_retry_after(
+        StatusError(429, {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})
+    )
+    assert retry_after == 0
+
+
+def test_next_delay_limits():
+    policy = RetryPolicy(RetrySettings(max_attempts=3, retry_budget=3))
+    assert policy.next_delay(1, StatusError(400)) is None
+    assert policy.next_delay(3, StatusError(500)) is None
+    assert policy.next_delay(1, StatusError(500)) is not None
+    assert policy.next_delay(2, StatusError(500)) is not None
+    assert policy.next_delay(1, StatusError(500)) is not None
+    assert policy.next_delay(1, StatusError(500)) is None
+    assert policy.retries == 3
+
+
+def test_read_yaml():
+    assert retry.read_yaml("tests/data/gpt_info.example.yaml").to_dict() == (
+        RetrySettings().to_dict()
+    )
@@ -0,0 +1,87 @@
+import pytest
+
+from syphus.data_generator.response import Response
+from syphus.data_generator.scheduler import CostEstimator, LongestJobFirst
+from syphus.prompts.info import Info
+from syphus.utils.tokens import TokenCounter
+
+
+def get_response(completion_tokens: int) -> Response:
+    return Response(
+        gpt_response={
+            "choices": [{"message": {"role": "assistant", "content": ""}}],
+            "usage": {"completion_tokens": completion_tokens},
+        }
+    )
+
+
+def length(info: Info) -> float:
+    return len(info.content)
+
+
+def test_longest_job_first():
+    infos = [Info("a" * size, id=str(i)) for i, size in enumerate([1, 5, 3, 5, 2])]
+    scheduler = LongestJobFirst(length, lookahead=10)
+    assert [info.id for info in scheduler.schedule(infos)] == ["1", "3", "2", "4", "0"]
+
+
+def test_longest_job_first_priority():
+    infos = [
+        Info("a", id="low", priority=-1),
+        Info("aaaa", id="none"),
+        Info("a", id="high", priority=2),
+    ]
+    scheduler = LongestJobFirst(length)
+    assert [info.id for info in scheduler.schedule(infos)] == ["high", "none", "low"]
+
+
+def test_longest_job_first_lookahead():
+    scheduler = LongestJobFirst(length, lookahead=2)
+
+    def infos():
+        for i, size in enumerate([1, 2, 3, 4]):
+            yield Info("a" * size, id=str(i))
+
+    iterator = scheduler.schedule(infos())
+    assert next(iterator).id == "1"
+    assert [info.id for info in iterator] == ["2", "3", "0"]
+
+
+def test_longest_job_first_invalid_lookahead():
+    with pytest.raises(ValueError):
+        LongestJobFirst(length, lookahead=0)
+
+
+def test_cost_estimator():
+    counter = TokenCounter("gpt-3.5-turbo")
+    estimator = CostEstimator(counter, completion_weight=2, min_samples=2)
+    short = Info("word " * 10, id="short")
+    long = Info("word " * 100, id="long")
+    short_tokens = counter.count_tokens(short.content)
+    long_tokens = counter.count_tokens(long.content)
+    assert estimator(short) == short_tokens
+    assert estimator(long) == long_tokens
+    estimator.record("short", get_response(100))
+    estimator.record("long", get_response(10))
+    assert estimator.samples == 2
+    assert estimator.pending == {}
+    # Short infos were seen to get long completions.
+    assert estimator.expected_completion_tokens(short_tokens) == pytest.approx(100)
+    assert estimator(short) == pytest.approx(short_tokens + 200)
+    assert estimator(short) > estimator(long)
+
+
+def test_cost_estimator_max_completion_tokens():
+    counter = TokenCounter("gpt-3.5-turbo")
+    estimator = CostEstimator(counter, max_completion_tokens=50, min_samples=1)
+    estimator(Info("info", id="0"))
+    estimator.record("0", get_response(100))
+    assert estimator.expected_completion_tokens(1000) == 50
+
+
+def test_cost_estimator_ignores_errors():
+    estimator = CostEstimator(TokenCounter("gpt-3.5-turbo"))
+    estimator(Info("info", id="0"))
+    estimator.record("0", Response(gpt_error_messages="error"))
+    assert estimator.samples == 0
+    assert estimator.pending == {}
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from syphus.data_generator.single_flight import SingleFlight
+
+
+def test_do_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    calls = []
+
+    def func():
+        calls.append(1)
+        time.sleep(0.1)
+        return object()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: single_flight.do("key", func), range(4)))
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert single_flight.saved == 3
+    assert single_flight.calls == {}
+
+
+def test_do_runs_again_after_completion():
+    single_flight = SingleFlight()
+    assert single_flight.do("key", lambda: 1) == 1
+    assert single_flight.do("key", lambda: 2) == 2
+    assert single_flight.saved == 0
+
+
+def test_do_shares_exceptions():
+    single_flight = SingleFlight()
+    started = threading.Event()
+
+    def func():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(single_flight.do, "key", func)
+        started.wait()
+        follower = executor.submit(single_flight.do, "key", func)
+        with pytest.raises(RuntimeError):
+            leader.result()
+        with pytest.raises(RuntimeError):
+            follower.result()
+    assert single_flight.saved == 1
+    assert single_flight.calls == {}
+
+
+def test_ado_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def func(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key
+
+    async def main():
+        return await asyncio.gather(
+            single_flight.ado("a", lambda: func("a")),
+            single_flight.ado("a", lambda: func("a")),
+            single_flight.ado("b", lambda: func("b")),
+        )
+
+    assert asyncio.run(main()) == ["a", "a", "b"]
+    assert calls == ["a", "b"]
+    assert single_flight.saved == 1
+    assert single_flight.async_calls == {}
+
+
+def test_ado_cancelled_leader_promotes_a_follower():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def func():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def main():
+        leader = asyncio.create_task(single_flight.ado("key", func))
+        await asyncio.sleep(0)
+        followers = [
+            asyncio.create_task(single_flight.ado("key", func)) for _ in range(2)
+        ]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        assert leader.cancelled()
+        return results
+
+    assert asyncio.run(main()) == [2, 2]
+    assert len(calls) == 2
+    assert single_flight.saved == 1
+    assert single_flight.async_calls == {}
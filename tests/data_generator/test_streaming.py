@@ -0,0 +1,115 @@
+import pytest
+
+from syphus.data_generator.response import Response
+from syphus.data_generator.streaming import QAPairStream, StreamAccumulator
+
+
+def make_chunks(contents):
+    chunks = [
+        {
+            "id": "chatcmpl-1",
+            "model": "gpt-3.5-turbo-0613",
+            "choices": [{"index": 0, "delta": {"role": "assistant"}}],
+        }
+    ]
+    for content in contents:
+        chunks.append({"choices": [{"index": 0, "delta": {"content": content}}]})
+    chunks.append({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+    return chunks
+
+
+def test_stream_accumulator():
+    deltas = []
+    accumulator = StreamAccumulator(on_delta=deltas.append)
+    for chunk in make_chunks(["question: Q", "\nanswer", ": A"]):
+        accumulator.add(chunk)
+    stats = {}
+    accumulator.record_stats(stats)
+    response = accumulator.to_response()
+    assert deltas == ["question: Q", "\nanswer", ": A"]
+    assert response["id"] == "chatcmpl-1"
+    assert response["choices"][0] == {
+        "finish_reason": "stop",
+        "index": 0,
+        "message": {"content": "question: Q\nanswer: A", "role": "assistant"},
+    }
+    assert Response(gpt_response=response).qa_pairs[0].answer == "A"
+    assert stats["ttft"] >= 0
+    assert stats["completion_tokens"] > 0
+
+
+def test_qa_pair_stream_restarts_on_new_attempt():
+    pairs = []
+    stream = QAPairStream(pairs.append)
+    stream.feed("question: stale\nanswer: stale\nquest", 1)
+    stream.feed("question: Q1\nanswer: A1\nquestion: Q2\n", 2)
+    stream.feed("answer: A2", 2)
+    assert [pair.question for pair in pairs] == ["Q1"]
+    stream.finish(
+        Response(
+            data={
+                "warning_message": [],
+                "qa_pairs": [{"question": "Q1", "answer": "A1"}],
+                "full_response": {},
+            },
+            stats={"attempts": 2},
+        )
+    )
+    assert [pair.question for pair in pairs] == ["Q1", "Q2"]
+
+
+def test_qa_pair_stream_without_streaming():
+    pairs = []
+    QAPairStream(pairs.append).finish(
+        Response(
+            data={
+                "warning_message": [],
+                "qa_pairs": [{"question": "Q", "answer": "A"}],
+                "full_response": {},
+            }
+        )
+    )
+    assert [pair.question for pair in pairs] == ["Q"]
+
+
+def test_stream_accumulator_multiple_choices():
+    deltas = []
+    accumulator = StreamAccumulator(on_delta=deltas.append)
+    for chunk in [
+        {"choices": [{"index": 0, "delta": {"role": "assistant", "content": "a"}}]},
+        {"choices": [{"index": 1, "delta": {"role": "assistant", "content": "b"}}]},
+        {"choices": [{"index": 0, "delta": {"content": "c"}, "finish_reason": "stop"}]},
+        {"choices": [{"index": 1, "delta": {}, "finish_reason": "length"}]},
+    ]:
+        accumulator.add(chunk)
+    response = accumulator.to_response()
+    assert deltas == ["a", "c"]
+    assert [choice["message"]["content"] for choice in response["choices"]] == [
+        "ac",
+        "b",
+    ]
+    assert [choice["finish_reason"] for choice in response["choices"]] == [
+        "stop",
+        "length",
+    ]
+
+
+def test_qa_pair_stream_hands_out_other_choices():
+    pairs = []
+    stream = QAPairStream(pairs.append)
+    stream.feed("question: Q1\nanswer: A1\nquestion: Q2\nanswer: A2", 1)
+    stream.finish(
+        Response(
+            data={
+                "warning_message": [],
+                "qa_pairs": [
+                    {"question": "Q1", "answer": "A1"},
+                    {"question": "Q2", "answer": "A2"},
+                    {"question": "Q3", "answer": "A3"},
+                ],
+                "full_response": {},
+            },
+            stats={"attempts": 1},
+        )
+    )
+    assert [pair.question for pair in pairs] == ["Q1", "Q2", "Q3"]
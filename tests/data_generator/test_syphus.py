@@ -0,0 +1,736 @@
+import asyncio
+import os
+import json
+import shutil
+import time
+import pytest
+import re
+
+import syphus.data_generator.journal as journal
+import syphus.data_generator.response as syphus_response
+
+from syphus.data_generator.cache import ResponseCache
+from syphus.data_generator.cascade import CascadeSettings
+from syphus.data_generator.concurrency import AIMDController
+from syphus.data_generator.openai_settings import OpenAISettings
+from syphus.data_generator.requery import RequerySettings
+from syphus.data_generator.scheduler import LongestJobFirst
+from syphus.data_generator.retry import RetryPolicy, RetrySettings
+from syphus.data_generator.syphus import Syphus
+from syphus.prompts.info import Info
+
+from conftest import get_gpt_response, RawResponse
+
+
+def echo_response(**kwargs):
+    return get_gpt_response(
+        f"question: {kwargs['messages'][-1]['content']}\nanswer: Sample Answer"
+    )
+
+
+async def async_echo_response(**kwargs):
+    await asyncio.sleep(0)
+    return echo_response(**kwargs)
+
+
+@pytest.fixture
+def syphus_object():
+    return Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+    )
+
+
+@pytest.fixture
+def infos():
+    return [Info(f"info {i}", id=f"{i:05d}") for i in range(10)]
+
+
+@pytest.fixture
+def openai_client(mocker):
+    return mocker.patch("openai.OpenAI")
+
+
+@pytest.fixture
+def chat_completion(mocker, openai_client):
+    chat_completion = mocker.MagicMock()
+    chat_completion.create.side_effect = echo_response
+    chat_completion.acreate.side_effect = async_echo_response
+
+    async def acreate(**kwargs):
+        return RawResponse(await chat_completion.acreate(**kwargs))
+
+    completions = openai_client.return_value.chat.completions
+    completions.with_raw_response.create.side_effect = lambda **kwargs: RawResponse(
+        chat_completion.create(**kwargs)
+    )
+    async_client = mocker.patch("openai.AsyncOpenAI")
+    async_client.return_value.close = mocker.AsyncMock()
+    async_completions = async_client.return_value.chat.completions
+    async_completions.with_raw_response.create.side_effect = acreate
+    return chat_completion
+
+
+def test_query_single_info(syphus_object, chat_completion):
+    response = syphus_object.query_single_info(Info("some info", id="00000"))
+    messages = chat_completion.create.call_args.kwargs["messages"]
+    assert messages[0]["role"] == "system"
+    assert messages[-1] == {"role": "user", "content": "some info"}
+    assert response.qa_pairs[0].question == "some info"
+
+
+def test_query_single_info_error(syphus_object, chat_completion):
+    chat_completion.create.side_effect = RuntimeError("boom")
+    response = syphus_object.query_single_info(Info("some info", id="00000"))
+    assert response.qa_pairs == []
+    assert response.full_response == {"error": "boom"}
+
+
+def test_aquery_single_info(syphus_object, chat_completion):
+    response = asyncio.run(
+        syphus_object.aquery_single_info(Info("some info", id="00000"))
+    )
+    assert chat_completion.acreate.call_count == 1
+    assert response.qa_pairs[0].answer == "Sample Answer"
+
+
+def test_aquery_all_infos(syphus_object, chat_completion, infos):
+    async def collect():
+        return [
+            result
+            async for result in syphus_object.aquery_all_infos(
+                iter(infos), max_concurrency=3
+            )
+        ]
+
+    results = dict(asyncio.run(collect()))
+    assert len(results) == len(infos)
+    for info in infos:
+        assert results[info.id].qa_pairs[0].question == info.content
+
+
+def test_aquery_all_infos_and_save(syphus_object, chat_completion, infos):
+    path = "tests/test_output/syphus/aquery_all_infos_and_save"
+    asyncio.run(
+        syphus_object.aquery_all_infos_and_save(
+            infos, path, max_concurrency=4, split=False
+        )
+    )
+    responses = syphus_response.read_all(path)
+    assert sorted(responses) == [info.id for info in infos]
+
+
+def test_query_all_infos_and_save_metrics(syphus_object, chat_completion, infos):
+    path = "tests/test_output/syphus/query_all_infos_and_save_metrics"
+    syphus_object.query_all_infos_and_save(infos, path, num_threads=2)
+    with open(os.path.join(path, "metrics.json")) as f:
+        summary = json.load(f)
+    assert summary["requests"] == len(infos)
+    assert summary["failed"] == 0
+    for stage in ["render", "prompt", "queue", "limiter", "network", "parse"]:
+        assert summary["stages"][stage]["count"] == len(infos)
+    assert summary["stages"]["write"]["count"] >= len(infos)
+    with open(os.path.join(path, "metrics.prom")) as f:
+        assert 'syphus_stage_seconds_count{stage="network"} 10' in f.read()
+
+
+def test_query_all_infos_and_save_metrics_on_failure(
+    syphus_object, chat_completion, infos
+):
+    path = "tests/test_output/syphus/query_all_infos_and_save_metrics_on_failure"
+    shutil.rmtree(path, ignore_errors=True)
+
+    def fail_on_response(id, response):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        syphus_object.query_all_infos_and_save(
+            infos, path, num_threads=1, on_response=fail_on_response
+        )
+    with open(os.path.join(path, "metrics.json")) as f:
+        assert json.load(f)["requests"] >= 1
+    assert os.path.exists(os.path.join(path, "metrics.prom"))
+
+
+def test_query_all_infos_and_save_split(syphus_object, chat_completion, infos):
+    path = "tests/test_output/syphus/query_all_infos_and_save_split"
+    syphus_object.query_all_infos_and_save(infos, path, num_threads=2, split=True)
+    assert sorted(os.listdir(path)) == [info.id for info in infos] + [
+        "journal.jsonl",
+        "metrics.json",
+        "metrics.prom",
+    ]
+    assert sorted(syphus_response.read_all(path, split=True)) == [
+        info.id for info in infos
+    ]
+
+
+def test_query_single_info_retries_transient_errors(syphus_object, chat_completion):
+    syphus_object.gpt_manager.retry_policy = RetryPolicy(
+        RetrySettings(base_delay=0, max_delay=0)
+    )
+    chat_completion.create.side_effect = [
+        TimeoutError("timed out"),
+        ConnectionResetError("reset"),
+        get_gpt_response("question: Q\nanswer: A"),
+    ]
+    response = syphus_object.query_single_info(Info("some info", id="00000"))
+    assert response.attempts == 3
+    assert response.stats["errors"] == ["TimeoutError", "ConnectionResetError"]
+    assert response.qa_pairs[0].question == "Q"
+
+
+def test_query_single_info_fatal_error_is_not_retried(syphus_object, chat_completion):
+    chat_completion.create.side_effect = ValueError("invalid request")
+    response = syphus_object.query_single_info(Info("some info", id="00000"))
+    assert response.attempts == 1
+    assert chat_completion.create.call_count == 1
+    assert response.full_response == {"error": "invalid request"}
+
+
+def test_query_all_infos_streams_iterators(syphus_object, chat_completion, infos):
+    results = list(
+        syphus_object.query_all_infos(
+            iter(infos), num_threads=3, max_in_flight=4, ordered=True
+        )
+    )
+    assert [id for id, _ in results] == [info.id for info in infos]
+    for info, (_, response) in zip(infos, results):
+        assert response.qa_pairs[0].question == info.content
+
+
+def test_query_all_infos_scheduler(syphus_object, chat_completion, infos):
+    infos[3].priority = 1
+    scheduler = LongestJobFirst(lambda info: int(info.id), lookahead=len(infos))
+    results = list(
+        syphus_object.query_all_infos(
+            infos, num_threads=1, ordered=True, scheduler=scheduler
+        )
+    )
+    assert [id for id, _ in results] == ["00003"] + [
+        f"{i:05d}" for i in range(9, -1, -1) if i != 3
+    ]
+
+
+def test_query_all_infos_and_save_past_deadline(syphus_object, chat_completion, infos):
+    path = "tests/test_output/syphus/query_all_infos_and_save_past_deadline"
+    syphus_object.cancellation.set_deadline(0)
+    syphus_object.query_all_infos_and_save(infos, path, split=False)
+    assert chat_completion.create.call_count == 0
+    assert syphus_response.read_all(path) == {}
+
+
+def test_query_all_infos_and_save_cancelled(syphus_object, chat_completion, infos):
+    path = "tests/test_output/syphus/query_all_infos_and_save_cancelled"
+    shutil.rmtree(path, ignore_errors=True)
+
+    def cancel_on_third_request(**kwargs):
+        if chat_completion.create.call_count == 3:
+            syphus_object.cancellation.abort()
+            raise TimeoutError("timed out")
+        return echo_response(**kwargs)
+
+    chat_completion.create.side_effect = cancel_on_third_request
+    syphus_object.query_all_infos_and_save(
+        infos, path, num_threads=1, max_in_flight=1, split=False
+    )
+    assert chat_completion.create.call_count == 3
+    assert sorted(syphus_response.read_all(path)) == ["00000", "00001"]
+    assert sorted(journal.load(path)) == ["00000", "00001"]
+
+
+def test_query_single_info_request_timeout(syphus_object, chat_completion):
+    for endpoint in syphus_object.gpt_manager.load_balancer.endpoints:
+        endpoint.http_settings.request_timeout = 5
+    syphus_object.query_single_info(Info("info", id="0"))
+    timeout = chat_completion.create.call_args.kwargs["timeout"]
+    assert timeout.read == 5
+    assert timeout.connect <= 5
+
+
+def test_aquery_single_info_request_timeout(syphus_object, chat_completion):
+    async def slow_response(**kwargs):
+        await asyncio.sleep(10)
+
+    chat_completion.acreate.side_effect = slow_response
+    syphus_object.gpt_manager.retry_policy = RetryPolicy(RetrySettings(max_attempts=1))
+    for endpoint in syphus_object.gpt_manager.load_balancer.endpoints:
+        endpoint.http_settings.request_timeout = 0.1
+    start = time.monotonic()
+    response = asyncio.run(syphus_object.aquery_single_info(Info("info", id="0")))
+    assert time.monotonic() - start < 5
+    assert "timed out" in response.full_response["error"]
+    assert response.stats["errors"] == ["RequestTimeoutError"]
+
+
+def test_query_all_infos_and_save_resume(syphus_object, chat_completion, infos):
+    path = "tests/test_output/syphus/query_all_infos_and_save_resume"
+    syphus_object.query_all_infos_and_save(infos[:4], path, split=False)
+    chat_completion.create.reset_mock()
+    syphus_object.query_all_infos_and_save(infos, path, split=False, resume=True)
+    assert chat_completion.create.call_count == len(infos) - 4
+    responses = syphus_response.read_all(path)
+    assert sorted(responses) == [info.id for info in infos]
+    assert responses["00000"].qa_pairs[0].question == "info 0"
+
+
+def test_query_all_infos_and_save_resume_retries_errors(
+    syphus_object, chat_completion, infos
+):
+    path = "tests/test_output/syphus/query_all_infos_and_save_resume_retries_errors"
+    syphus_object.gpt_manager.retry_policy = RetryPolicy(RetrySettings(max_attempts=1))
+
+    def fail_info_1(**kwargs):
+        if kwargs["messages"][-1]["content"] == "info 1":
+            raise RuntimeError("outage")
+        return echo_response(**kwargs)
+
+    chat_completion.create.side_effect = fail_info_1
+    syphus_object.query_all_infos_and_save(infos[:4], path, split=False)
+    assert "error" in syphus_response.read_all(path)["00001"].full_response
+    chat_completion.create.side_effect = echo_response
+    chat_completion.create.reset_mock()
+    syphus_object.query_all_infos_and_save(infos[:4], path, split=False, resume=True)
+    assert chat_completion.create.call_count == 1
+    responses = syphus_response.read_all(path)
+    assert responses["00001"].qa_pairs[0].question == "info 1"
+
+
+def test_query_single_info_uses_cache(chat_completion):
+    path = "tests/test_output/syphus/cache"
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        cache=ResponseCache(path),
+    )
+    first = syphus_object.query_single_info(Info("some info", id="00000"))
+    second = syphus_object.query_single_info(Info("some info", id="00001"))
+    assert chat_completion.create.call_count == 1
+    assert first.to_dict() == second.to_dict()
+    assert second.stats["cached"] is True
+    syphus_object.query_single_info(Info("other info", id="00002"))
+    assert chat_completion.create.call_count == 2
+
+
+def test_query_all_infos_coalesces_duplicates(syphus_object, chat_completion):
+    def slow_echo_response(**kwargs):
+        time.sleep(0.1)
+        return echo_response(**kwargs)
+
+    chat_completion.create.side_effect = slow_echo_response
+    infos = [Info("same info", id=f"{i:05d}") for i in range(4)]
+    results = dict(syphus_object.query_all_infos(infos, num_threads=4))
+    assert chat_completion.create.call_count == 1
+    assert sorted(results) == [info.id for info in infos]
+    assert all(r.qa_pairs[0].question == "same info" for r in results.values())
+    assert syphus_object.single_flight.saved == 3
+
+
+def test_query_all_infos_without_coalescing(chat_completion):
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        coalesce=False,
+    )
+    infos = [Info("same info", id=f"{i:05d}") for i in range(4)]
+    list(syphus_object.query_all_infos(infos, num_threads=4))
+    assert chat_completion.create.call_count == 4
+
+
+def test_query_single_info_balances_endpoints(chat_completion, openai_client):
+    syphus_object = Syphus(
+        openai_api=[
+            OpenAISettings(type="open_ai", base="http://a", key="key-a", engine="a"),
+            OpenAISettings(type="open_ai", base="http://b", key="key-b", engine="b"),
+        ],
+        prompts="tests/data/dense_captions_prompt.yaml",
+    )
+    for i in range(4):
+        syphus_object.query_single_info(Info(f"info {i}", id=f"{i:05d}"))
+    models = [call.kwargs["model"] for call in chat_completion.create.call_args_list]
+    assert sorted(models) == ["a", "a", "b", "b"]
+    clients = {
+        call.kwargs["api_key"]: call.kwargs["base_url"]
+        for call in openai_client.call_args_list
+    }
+    assert clients == {"key-a": "http://a", "key-b": "http://b"}
+    assert all(call.kwargs["max_retries"] == 0 for call in openai_client.call_args_list)
+
+
+def test_query_all_infos_sizes_connection_pool(syphus_object, chat_completion, infos):
+    list(syphus_object.query_all_infos(infos, num_threads=3))
+    endpoint = syphus_object.gpt_manager.load_balancer.endpoints[0]
+    assert endpoint.pool_size == 3
+    assert endpoint.get_client() is endpoint.get_client()
+
+
+def test_query_all_infos_adaptive(syphus_object, chat_completion, infos):
+    class Overloaded(Exception):
+        status_code = 429
+
+    calls = 0
+
+    def flaky_echo_response(**kwargs):
+        nonlocal calls
+        calls += 1
+        if calls % 3 == 0:
+            raise Overloaded("rate limit")
+        return echo_response(**kwargs)
+
+    chat_completion.create.side_effect = flaky_echo_response
+    syphus_object.gpt_manager.retry_policy = RetryPolicy(
+        RetrySettings(base_delay=0.001, max_delay=0.001)
+    )
+    controller = AIMDController(min_limit=1, max_limit=4, initial_limit=4)
+    results = dict(syphus_object.query_all_infos(infos, controller=controller))
+    assert sorted(results) == [info.id for info in infos]
+    assert controller.decreases >= 1
+
+
+def test_query_single_info_stream(chat_completion):
+    def stream_echo_response(**kwargs):
+        assert kwargs["stream"]
+        content = echo_response(**kwargs)["choices"][0]["message"]["content"]
+        content += "\nquestion: second\nanswer: Second Answer"
+        yield {"choices": [{"index": 0, "delta": {"role": "assistant"}}]}
+        for start in range(0, len(content), 5):
+            yield {
+                "choices": [
+                    {"index": 0, "delta": {"content": content[start : start + 5]}}
+                ]
+            }
+
+    chat_completion.create.side_effect = stream_echo_response
+    pairs = []
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        stream=True,
+        on_qa_pair=lambda info, pair: pairs.append((info.id, pair.question)),
+    )
+    response = syphus_object.query_single_info(Info("some info", id="00000"))
+    assert pairs == [("00000", "some info"), ("00000", "second")]
+    assert [pair.question for pair in response.qa_pairs] == ["some info", "second"]
+    assert "ttft" in response.stats
+    assert response.stats["completion_tokens"] > 0
+
+
+def test_query_single_info_selects_examples(chat_completion):
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        num_examples=1,
+    )
+    syphus_object.query_single_info(
+        Info("A woman does sit ups in a living room.", id="00000")
+    )
+    messages = chat_completion.create.call_args.kwargs["messages"]
+    assert len(messages) == 4
+    assert "sit ups" in messages[1]["content"]
+
+
+def test_query_single_info_sizes_max_tokens(syphus_object, chat_completion):
+    response = syphus_object.query_single_info(Info("some info", id="00000"))
+    max_tokens = chat_completion.create.call_args.kwargs["max_tokens"]
+    assert max_tokens == 4096 - 16 - response.stats["prompt_tokens"]
+
+
+def multiple_choices_response(**kwargs):
+    response = echo_response(**kwargs)
+    choice = response["choices"][0]
+    response["choices"] = [
+        {**choice, "index": index} for index in range(kwargs.get("n", 1))
+    ]
+    response["choices"][-1] = {
+        **choice,
+        "index": kwargs["n"] - 1,
+        "message": {"content": "question: Other\nanswer: Other", "role": "assistant"},
+    }
+    return response
+
+
+def test_query_single_info_n(syphus_object, chat_completion):
+    chat_completion.create.side_effect = multiple_choices_response
+    syphus_object.gpt_manager.gpt_params.n = 3
+    response = syphus_object.query_single_info(Info("info", id="0"))
+    assert chat_completion.create.call_count == 1
+    assert chat_completion.create.call_args.kwargs["n"] == 3
+    assert [pair.question for pair in response.qa_pairs] == ["info", "Other"]
+    assert response.stats["duplicate_qa_pairs"] == 1
+
+
+def test_query_single_info_parallel_n(syphus_object, chat_completion):
+    calls = []
+
+    def answer_differently(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 2:
+            raise ValueError("fatal")
+        return get_gpt_response(f"question: Q{len(calls) % 2}\nanswer: A")
+
+    chat_completion.create.side_effect = answer_differently
+    syphus_object.gpt_manager.gpt_params.n = 3
+    syphus_object.gpt_manager.gpt_params.parallel_n = True
+    response = syphus_object.query_single_info(Info("info", id="0"))
+    assert len(calls) == 3
+    assert all("n" not in kwargs for kwargs in calls)
+    assert len(response.full_response["choices"]) == 2
+    assert response.full_response["usage"]["completion_tokens"] == 34
+    # The first and third requests succeed with the same QA pair.
+    assert [pair.question for pair in response.qa_pairs] == ["Q1"]
+    assert response.stats["attempts"] == 3
+    assert response.stats["errors"] == ["ValueError"]
+
+
+def test_aquery_single_info_parallel_n(syphus_object, chat_completion):
+    syphus_object.gpt_manager.gpt_params.n = 2
+    syphus_object.gpt_manager.gpt_params.parallel_n = True
+    response = asyncio.run(syphus_object.aquery_single_info(Info("info", id="0")))
+    assert chat_completion.acreate.call_count == 2
+    assert len(response.full_response["choices"]) == 2
+    assert [pair.question for pair in response.qa_pairs] == ["info"]
+
+
+def batch_echo_response(**kwargs):
+    content = kwargs["messages"][-1]["content"]
+    sections = re.findall(r"^### Info (\S+)\n(.*)$", content, re.MULTILINE)
+    return get_gpt_response(
+        "\n".join(
+            f"**### Info {id}**\nquestion: {info}\nanswer: Sample Answer"
+            for id, info in sections
+        )
+    )
+
+
+def cascade_response(**kwargs):
+    # The small engine fails on infos with an odd number.
+    if (
+        kwargs["model"] == "large"
+        or int(kwargs["messages"][-1]["content"][-1]) % 2 == 0
+    ):
+        return echo_response(**kwargs)
+    return get_gpt_response("I cannot help with that.")
+
+
+def test_query_all_infos_cascade(chat_completion, infos, capsys):
+    chat_completion.create.side_effect = cascade_response
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        cascade_settings=CascadeSettings(tiers=[{"engine": "large"}]),
+    )
+    results = dict(syphus_object.query_all_infos(infos, num_threads=2))
+    assert chat_completion.create.call_count == 15
+    for info in infos:
+        response = results[info.id]
+        assert [pair.question for pair in response.qa_pairs] == [info.content]
+        escalated = int(info.content[-1]) % 2 == 1
+        assert response.stats.get("cascade_tier", 0) == int(escalated)
+        assert response.warning_message[:1] == (
+            ["Escalated from gpt-3.5-turbo-0613 to large: 0 QA pairs, fewer than 1."]
+            if escalated
+            else []
+        )
+    assert syphus_object.cascade.queried == [10, 5]
+    assert syphus_object.cascade.accepted == [5, 5]
+    assert "Cascade tier 0 (gpt-3.5-turbo-0613): 5/10 accepted (50.0%)" in (
+        capsys.readouterr().err
+    )
+
+
+def test_aquery_all_infos_cascade(chat_completion, infos):
+    async def acascade_response(**kwargs):
+        return cascade_response(**kwargs)
+
+    chat_completion.acreate.side_effect = acascade_response
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        cascade_settings=CascadeSettings(tiers=[{"engine": "large"}]),
+    )
+
+    async def run():
+        return {
+            id: response async for id, response in syphus_object.aquery_all_infos(infos)
+        }
+
+    results = asyncio.run(run())
+    assert all(len(response.qa_pairs) == 1 for response in results.values())
+    assert syphus_object.cascade.queried == [10, 5]
+
+
+def test_query_all_infos_batched_cascade(chat_completion, infos):
+    def batch_cascade_response(**kwargs):
+        if kwargs["model"] == "large":
+            return echo_response(**kwargs)
+        response = batch_echo_response(**kwargs)
+        content = response["choices"][0]["message"]["content"]
+        # The small engine forgets the answers of the infos with an odd number.
+        response["choices"][0]["message"]["content"] = re.sub(
+            r"(question: info \d*[13579])\nanswer: Sample Answer", r"\1", content
+        )
+        return response
+
+    chat_completion.create.side_effect = batch_cascade_response
+    questions = []
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        batch_size=5,
+        cascade_settings=CascadeSettings(tiers=[{"engine": "large"}]),
+        on_qa_pair=lambda info, pair: questions.append(pair.question),
+    )
+    results = dict(syphus_object.query_all_infos(infos, num_threads=1))
+    for info in infos:
+        assert [pair.question for pair in results[info.id].qa_pairs] == [info.content]
+    assert sorted(questions) == sorted(info.content for info in infos)
+    assert syphus_object.cascade.queried == [10, 5]
+
+
+def requery_response(**kwargs):
+    # Answers are forgotten unless the last message is the feedback on them.
+    if kwargs["messages"][-1]["content"].startswith("Your answer could not be parsed"):
+        return echo_response(messages=kwargs["messages"][:-2])
+    return get_gpt_response(f"question: {kwargs['messages'][-1]['content']}")
+
+
+def test_query_single_info_requery(chat_completion, capsys):
+    chat_completion.create.side_effect = requery_response
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        requery_settings=RequerySettings(max_requeries=2),
+    )
+    response = syphus_object.query_single_info(Info("some info", id="00000"))
+    assert chat_completion.create.call_count == 2
+    messages = chat_completion.create.call_args.kwargs["messages"]
+    assert messages[-2] == {"role": "assistant", "content": "question: some info"}
+    assert "some questions have no answer" in messages[-1]["content"]
+    assert [pair.question for pair in response.qa_pairs] == ["some info"]
+    assert response.stats["requeries"] == 1
+    assert response.warning_message == ["Asked again 1 times."]
+    assert syphus_object.requery_policy.recovered == 1
+
+
+def test_query_single_info_requery_is_bounded(chat_completion):
+    chat_completion.create.side_effect = lambda **kwargs: get_gpt_response("nothing")
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        requery_settings=RequerySettings(max_requeries=2, feedback=False),
+    )
+    response = syphus_object.query_single_info(Info("some info", id="00000"))
+    assert chat_completion.create.call_count == 3
+    assert response.stats["requeries"] == 2
+    assert syphus_object.requery_policy.exhausted == 1
+    assert syphus_object.requery_policy.triggered == {"no_qa_pairs": 2}
+
+
+def test_aquery_all_infos_requery(chat_completion, infos):
+    async def arequery_response(**kwargs):
+        return requery_response(**kwargs)
+
+    chat_completion.acreate.side_effect = arequery_response
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        requery_settings=RequerySettings(max_requeries=1),
+    )
+
+    async def run():
+        return {
+            id: response async for id, response in syphus_object.aquery_all_infos(infos)
+        }
+
+    results = asyncio.run(run())
+    assert chat_completion.acreate.call_count == 20
+    for info in infos:
+        assert [pair.question for pair in results[info.id].qa_pairs] == [info.content]
+
+
+def test_query_all_infos_batched(chat_completion, infos):
+    chat_completion.create.side_effect = batch_echo_response
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        batch_size=4,
+    )
+    results = dict(syphus_object.query_all_infos(infos, num_threads=2))
+    assert chat_completion.create.call_count == 3
+    assert sorted(results) == [info.id for info in infos]
+    for info in infos:
+        assert [pair.question for pair in results[info.id].qa_pairs] == [info.content]
+        assert results[info.id].full_response["batch"]
+
+
+def test_query_batch_falls_back_to_single_infos(chat_completion, infos):
+    def drop_first_info(**kwargs):
+        if "### Info" not in kwargs["messages"][-1]["content"]:
+            return echo_response(**kwargs)
+        response = batch_echo_response(**kwargs)
+        message = response["choices"][0]["message"]
+        message["content"] = message["content"].split("\n", 3)[3]
+        return response
+
+    chat_completion.create.side_effect = drop_first_info
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        batch_size=3,
+    )
+    results = dict(syphus_object.query_batch(infos[:3]))
+    assert chat_completion.create.call_count == 2
+    assert results["00000"].warning_message[0].startswith("Missing")
+    assert results["00000"].qa_pairs[0].question == "info 0"
+    assert results["00001"].qa_pairs[0].question == "info 1"
+
+
+def test_add_batch_warning_leaves_shared_response_unchanged(syphus_object):
+    shared = syphus_response.Response(
+        gpt_response=echo_response(messages=[{"content": "info"}])
+    )
+    first = syphus_object.add_batch_warning(shared)
+    second = syphus_object.add_batch_warning(shared)
+    assert shared.warning_message == []
+    assert first.warning_message == second.warning_message
+    assert len(first.warning_message) == 1
+    assert first.qa_pairs == shared.qa_pairs
+
+
+def test_aquery_all_infos_batched_request_error(chat_completion, infos):
+    async def fail_batches(**kwargs):
+        if "### Info" in kwargs["messages"][-1]["content"]:
+            raise ValueError("context length exceeded")
+        return echo_response(**kwargs)
+
+    chat_completion.acreate.side_effect = fail_batches
+    syphus_object = Syphus(
+        gpt_info_path="tests/data/gpt_info.example.yaml",
+        prompts="tests/data/dense_captions_prompt.yaml",
+        batch_size=5,
+    )
+
+    async def collect():
+        return [result async for result in syphus_object.aquery_all_infos(infos)]
+
+    results = dict(asyncio.run(collect()))
+    assert chat_completion.acreate.call_count == 2 + len(infos)
+    for info in infos:
+        assert results[info.id].qa_pairs[0].question == info.content
+
+
+def test_query_all_infos_and_save_on_response(syphus_object, chat_completion, infos):
+    path = "tests/test_output/syphus/query_all_infos_and_save_on_response"
+    latencies = {}
+    syphus_object.query_all_infos_and_save(
+        infos,
+        path,
+        split=False,
+        on_response=lambda id, response: latencies.update(
+            {id: response.stats["latency"]}
+        ),
+    )
+    assert sorted(latencies) == [info.id for info in infos]
+    assert all(latency >= 0 for latency in latencies.values())
@@ -0,0 +1,91 @@
+import pytest
+
+import syphus.data_generator.token_budget as token_budget
+
+from syphus.data_generator.token_budget import (
+    TokenBudget,
+    TokenBudgetError,
+    TokenBudgetSettings,
+)
+
+
+def make_messages(content: str):
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": content},
+    ]
+
+
+def test_read_yaml_defaults():
+    settings = token_budget.read_yaml("tests/data/gpt_info.example.yaml")
+    assert settings.to_dict() == TokenBudgetSettings().to_dict()
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        TokenBudgetSettings(policy="drop")
+
+
+def test_get_context_window():
+    assert token_budget.get_context_window("gpt-3.5-turbo-0613") == 4096
+    assert token_budget.get_context_window("gpt-3.5-turbo-16k-0613") == 16385
+    assert token_budget.get_context_window("gpt-4-0613") == 8192
+    assert token_budget.get_context_window("gpt-3.5-turbo") == 16385
+    assert token_budget.get_context_window("gpt-4-turbo-2024-04-09") == 128000
+    assert token_budget.get_context_window("gpt-4.1") == 1047576
+    assert token_budget.get_context_window("gpt-4.1-mini") == 1047576
+    assert token_budget.get_context_window("gpt-4.5-preview") == 128000
+    assert token_budget.get_context_window("gpt-4o-mini") == 128000
+    assert token_budget.get_context_window("gpt-4x") is None
+    assert token_budget.get_context_window("my-local-model") is None
+
+
+def test_max_tokens_fits_context_window():
+    budget = TokenBudget(
+        TokenBudgetSettings(context_window=1000, safety_margin=0), "gpt-3.5-turbo"
+    )
+    messages = make_messages("short info")
+    prompt_tokens = budget.counter.count_messages_tokens(messages)
+    stats = {}
+    planned_messages, max_tokens = budget.plan(messages, 3000, stats)
+    assert planned_messages == messages
+    assert max_tokens == 1000 - prompt_tokens
+    assert stats["prompt_tokens"] == prompt_tokens
+    assert budget.plan(messages, 100)[1] == 100
+
+
+def test_unknown_context_window_keeps_max_tokens():
+    budget = TokenBudget(TokenBudgetSettings(), "my-local-model")
+    messages = make_messages("info " * 10000)
+    assert budget.plan(messages, 3000) == (messages, 3000)
+
+
+def test_truncate_long_info():
+    budget = TokenBudget(
+        TokenBudgetSettings(
+            context_window=1000, min_completion_tokens=200, safety_margin=0
+        ),
+        "gpt-3.5-turbo",
+    )
+    messages = make_messages("info " * 2000)
+    stats = {}
+    planned_messages, max_tokens = budget.plan(messages, 3000, stats)
+    assert planned_messages[0] == messages[0]
+    assert messages[1]["content"].startswith(planned_messages[1]["content"])
+    assert stats["truncated_tokens"] > 0
+    assert 0 < max_tokens <= 200
+    assert budget.counter.count_messages_tokens(planned_messages) + max_tokens <= 1000
+
+
+def test_reject_long_info():
+    budget = TokenBudget(
+        TokenBudgetSettings(context_window=1000, policy="reject"), "gpt-3.5-turbo"
+    )
+    with pytest.raises(TokenBudgetError):
+        budget.plan(make_messages("info " * 2000), 3000)
+
+
+def test_prompt_too_long_without_info():
+    budget = TokenBudget(TokenBudgetSettings(context_window=10), "gpt-3.5-turbo")
+    with pytest.raises(TokenBudgetError):
+        budget.plan(make_messages("info"), 3000)
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from syphus.prompts import prompts, in_context_example, qa_pair
+from syphus.prompts.example_selector import ExampleSelector, TfidfIndex, tokenize
+
+
+@pytest.fixture
+def sample_prompts():
+    contexts = [
+        "A dog runs on the beach.",
+        "A cat sleeps on the sofa.",
+        "Two dogs play with a ball in the park.",
+        "A chef cooks pasta in the kitchen.",
+    ]
+    return prompts.Prompts(
+        "System Message",
+        [
+            in_context_example.InContextExample(
+                context, [qa_pair.QAPair(f"Question {i}", f"Answer {i}")]
+            )
+            for i, context in enumerate(contexts)
+        ],
+    )
+
+
+def test_tokenize():
+    assert tokenize("A dog, THE dog's ball.") == ["a", "dog", "the", "dog", "s", "ball"]
+
+
+def test_tfidf_index_search():
+    index = TfidfIndex(
+        ["the red apple", "the green pear", "a red car", "the yellow banana"]
+    )
+    results = index.search("the red apple pie", 3)
+    assert [i for i, _ in results] == [0, 2]
+    assert results[0][1] > results[1][1]
+    assert "the" not in index.idf
+    assert index.search("the kiwi", 3) == []
+    assert index.search("", 3) == []
+
+
+def test_select(sample_prompts):
+    selector = ExampleSelector(sample_prompts, 2)
+    selected = selector.select("Dogs and a dog at the park with a ball")
+    assert [example.context for example in selected] == [
+        "A dog runs on the beach.",
+        "Two dogs play with a ball in the park.",
+    ]
+
+
+def test_select_fills_with_first_examples(sample_prompts):
+    selector = ExampleSelector(sample_prompts, 3)
+    assert selector.select_indices("pasta") == (0, 1, 3)
+    assert selector.select_indices("nothing similar") == (0, 1, 2)
+
+
+def test_get_messages(sample_prompts):
+    selector = ExampleSelector(sample_prompts, 1)
+    messages = selector.get_messages("A cat on the sofa")
+    assert [message["content"] for message in messages[:2]] == [
+        "System Message",
+        "A cat sleeps on the sofa.",
+    ]
+    assert messages[-1] == {"role": "user", "content": "A cat on the sofa"}
+    other_messages = selector.get_messages("Another cat")
+    assert other_messages[1] is messages[1]
+
+
+def test_invalid_k(sample_prompts):
+    with pytest.raises(ValueError):
+        ExampleSelector(sample_prompts, 0)
+
+
+def test_select_is_fast():
+    examples = [
+        in_context_example.InContextExample(
+            f"Example {i} about topic {i % 97} and subject {i % 13}", []
+        )
+        for i in range(5000)
+    ]
+    selector = ExampleSelector(prompts.Prompts("System Message", examples), 3)
+    start = time.perf_counter()
+    for i in range(100):
+        selector.select_indices(f"A question about topic {i} and subject {i}")
+    assert (time.perf_counter() - start) / 100 < 0.005
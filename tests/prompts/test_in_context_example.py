@@ -113,3 +113,14 @@ def test_remove_last_qa_pair(sample_in_context_example):
     assert len(example.qa_pairs) == 1
     assert example.qa_pairs[0].question == "What is the capital of France?"
     assert example.qa_pairs[0].answer == "Paris"
+
+
+def test_get_formatted_qa_pairs(sample_in_context_example):
+    assert sample_in_context_example.get_formatted_qa_pairs() == (
+        "Question: What is the capital of France?\nAnswer: Paris\n\n"
+        "Question: Who wrote the play 'Hamlet'?\nAnswer: William Shakespeare\n\n"
+    )
+    assert (
+        in_context_example.InContextExample("Context", []).get_formatted_qa_pairs()
+        == ""
+    )
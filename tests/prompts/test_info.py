@@ -113,3 +113,19 @@ def test_read_multiple_infos(info_load_path: str):
             == yaml.loads(info_jsonl[key])
             == data_dict[key]
         )
+
+
+def test_info_priority():
+    info = syphus_info.from_dict(
+        {"id": "0", "_priority": 2, "key": "value"}, has_id=True
+    )
+    assert info.id == "0"
+    assert info.priority == 2
+    assert yaml.loads(info.content) == {"key": "value"}
+    info = syphus_info.from_dict(("1", {"key": "value"}), has_id=True)
+    assert info.priority is None
+    info = syphus_info.from_dict({"id": "2", "priority": "high"}, has_id=True)
+    assert info.priority is None
+    assert yaml.loads(info.content) == {"priority": "high"}
+    with pytest.raises(ValueError):
+        syphus_info.from_dict({"id": "3", "_priority": "high"}, has_id=True)
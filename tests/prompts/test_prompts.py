@@ -1,5 +1,6 @@
 from syphus.prompts import prompts, in_context_example, qa_pair
 
+import json
 import yaml
 import pytest
 
@@ -124,3 +125,34 @@ def test_copy(sample_prompts):
 
     prompts_copy.system_message = "New System Message"
     assert prompts_copy.system_message != prompts.system_message
+
+
+def test_compile(sample_prompts):
+    compiled = sample_prompts.compile()
+    messages = compiled.get_messages("Info content")
+    assert messages == sample_prompts.get_messages() + [
+        {"role": "user", "content": "Info content"}
+    ]
+    assert all(
+        message is prefix_message
+        for message, prefix_message in zip(messages, compiled.messages)
+    )
+    other_messages = compiled.get_messages("Other content")
+    assert other_messages[0] is messages[0]
+
+
+def test_dump_messages(sample_prompts):
+    messages = sample_prompts.compile().get_messages('Info "content" with ünicode')
+    expected = json.dumps(
+        list(messages), sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    assert messages.to_json() == expected
+    assert prompts.dump_messages(messages) == expected
+    assert prompts.dump_messages(list(messages)) == expected
+    truncated = prompts.PromptMessages(
+        messages.compiled_prompts,
+        messages[:-1] + [{"role": "user", "content": "Info"}],
+    )
+    assert json.loads(truncated.to_json())[-1]["content"] == "Info"
+    messages[0] = {"role": "system", "content": "Changed"}
+    assert json.loads(messages.to_json())[0]["content"] == "Changed"
@@ -28,3 +28,18 @@ def test_from_dict():
 def test_to_str():
     qa = qa_pair.QAPair(**sample_qa_pair)
     assert json.loads(str(qa)) == sample_qa_pair
+
+
+def test_normalize_text():
+    assert qa_pair.normalize_text("  What is  THIS?\n") == "what is this"
+
+
+def test_deduplicate():
+    pairs = [
+        qa_pair.QAPair("What is this?", "A cat."),
+        qa_pair.QAPair("What is this?", "A cat."),
+        qa_pair.QAPair("what is this", "a  cat"),
+        qa_pair.QAPair("What is this?", "A dog."),
+    ]
+    unique = qa_pair.deduplicate(pairs)
+    assert unique == [pairs[0], pairs[3]]
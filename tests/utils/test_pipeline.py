@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+from syphus.utils.pipeline import (
+    ReorderBuffer,
+    bounded_map,
+    async_bounded_map,
+    chunked,
+)
+
+
+def test_reorder_buffer():
+    buffer = ReorderBuffer()
+    assert list(buffer.push(1, "b")) == []
+    assert list(buffer.push(2, "c")) == []
+    assert len(buffer) == 2
+    assert list(buffer.push(0, "a")) == ["a", "b", "c"]
+    assert len(buffer) == 0
+
+
+def slow_first(item):
+    time.sleep(0.2 if item == 0 else 0.001)
+    return item
+
+
+def test_bounded_map_completion_order():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            bounded_map(slow_first, iter(range(8)), executor=executor, max_in_flight=4)
+        )
+    assert sorted(results) == list(range(8))
+    assert results[0] != 0
+
+
+def test_bounded_map_ordered():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            bounded_map(
+                slow_first,
+                iter(range(8)),
+                executor=executor,
+                max_in_flight=4,
+                ordered=True,
+            )
+        )
+    assert results == list(range(8))
+
+
+def test_bounded_map_limits_in_flight():
+    lock = threading.Lock()
+    in_flight = 0
+    max_seen = 0
+
+    def func(item):
+        nonlocal in_flight, max_seen
+        with lock:
+            in_flight += 1
+            max_seen = max(max_seen, in_flight)
+        time.sleep(0.001)
+        with lock:
+            in_flight -= 1
+        return item
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            bounded_map(func, iter(range(50)), executor=executor, max_in_flight=3)
+        )
+    assert sorted(results) == list(range(50))
+    assert max_seen <= 3
+
+
+def test_bounded_map_dynamic_window():
+    window = 1
+    max_seen = 0
+    pending = 0
+    lock = threading.Lock()
+
+    def func(item):
+        nonlocal pending, max_seen
+        with lock:
+            pending += 1
+            max_seen = max(max_seen, pending)
+        time.sleep(0.001)
+        with lock:
+            pending -= 1
+        return item
+
+    results = []
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for result in bounded_map(
+            func, range(40), executor=executor, max_in_flight=lambda: window
+        ):
+            results.append(result)
+            if len(results) == 20:
+                window = 4
+    assert sorted(results) == list(range(40))
+    assert 1 < max_seen <= 4
+
+
+def test_async_bounded_map_limits_in_flight():
+    in_flight = 0
+    max_seen = 0
+
+    async def func(item):
+        nonlocal in_flight, max_seen
+        in_flight += 1
+        max_seen = max(max_seen, in_flight)
+        await asyncio.sleep(0.001 * (item % 3))
+        in_flight -= 1
+        return item * 2
+
+    async def collect():
+        return [
+            result
+            async for result in async_bounded_map(
+                func, iter(range(20)), max_in_flight=4
+            )
+        ]
+
+    results = asyncio.run(collect())
+    assert sorted(results) == [item * 2 for item in range(20)]
+    assert max_seen <= 4
+
+
+def test_async_bounded_map_invalid_window():
+    async def collect():
+        return [
+            result
+            async for result in async_bounded_map(
+                asyncio.sleep, range(3), max_in_flight=0
+            )
+        ]
+
+    with pytest.raises(ValueError):
+        asyncio.run(collect())
+
+
+def test_async_bounded_map_ordered():
+    async def func(item):
+        await asyncio.sleep(0.05 if item == 0 else 0)
+        return item
+
+    async def collect():
+        return [
+            result
+            async for result in async_bounded_map(
+                func, range(6), max_in_flight=3, ordered=True
+            )
+        ]
+
+    assert asyncio.run(collect()) == list(range(6))
+
+
+def test_chunked():
+    assert list(chunked(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(chunked([], 3)) == []
+    with pytest.raises(ValueError):
+        list(chunked(range(3), 0))
@@ -0,0 +1,28 @@
+import pytest
+
+from syphus.prompts.info import Info
+from syphus.utils.sharding import filter_shard, parse_shard, shard_of
+
+
+def test_parse_shard():
+    assert parse_shard("0/4") == (0, 4)
+    assert parse_shard("3/4") == (3, 4)
+    for spec in ["4/4", "-1/4", "0/0", "1", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_shard(spec)
+
+
+def test_shard_of_is_stable():
+    assert shard_of("00001", 1) == 0
+    assert shard_of("00001", 7) == shard_of("00001", 7)
+    assert shard_of(1, 7) == shard_of("1", 7)
+    # Fixed values, so that a change of the hash function does not go unnoticed.
+    assert [shard_of(f"{i:05d}", 4) for i in range(8)] == [0, 1, 3, 1, 0, 2, 2, 2]
+
+
+def test_filter_shard_partitions():
+    infos = [Info(f"info {i}", id=f"{i:05d}") for i in range(100)]
+    shards = [list(filter_shard(infos, index, 3)) for index in range(3)]
+    ids = sorted(info.id for shard in shards for info in shard)
+    assert ids == [info.id for info in infos]
+    assert all(shard for shard in shards)
@@ -0,0 +1,30 @@
+from syphus.utils.tokens import TokenCounter, estimate_messages_tokens
+
+
+def test_count_messages_tokens_matches_estimate_without_tokenizer(mocker):
+    mocker.patch("syphus.utils.tokens.tiktoken", None)
+    counter = TokenCounter("gpt-3.5-turbo")
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": "Describe the image."},
+    ]
+    assert counter.count_messages_tokens(messages) == estimate_messages_tokens(messages)
+
+
+def test_message_counts_are_cached():
+    counter = TokenCounter("gpt-3.5-turbo")
+    prefix = {"role": "system", "content": "You are a helpful assistant."}
+    for i in range(3):
+        counter.count_messages_tokens([prefix, {"role": "user", "content": f"{i}"}])
+    cache_info = counter.count_message_tokens.cache_info()
+    assert cache_info.hits == 2
+    assert cache_info.misses == 4
+
+
+def test_truncate():
+    counter = TokenCounter("gpt-3.5-turbo")
+    text = "word " * 100
+    truncated = counter.truncate(text, 10)
+    assert text.startswith(truncated)
+    assert counter.count_tokens(truncated) <= 10
+    assert counter.truncate(text, 0) == ""